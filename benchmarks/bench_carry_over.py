@@ -0,0 +1,62 @@
+"""
+Compares Worker carry-over iterations against cold restarts.
+
+Runs the same plan on two copies of a sample workspace, once per mode, and prints tokens and tool calls
+per completed task. Needs OPENAI_API_KEY since it talks to the real API.
+
+    python benchmarks/bench_carry_over.py [--model gpt-4o] [--runs 3]
+"""
+import argparse
+import copy
+import tempfile
+from pathlib import Path
+
+from gpt_worker.agents import Worker
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.telemetry import summarize_usage, per_task_metrics
+
+FILES = {
+    "calc.py": (
+        "def add(a, b):\n    return a + b\n\n"
+        "def sub(a, b):\n    return a - b\n\n"
+        "def mul(a, b):\n    return a * b\n"
+    ),
+    "README.md": "# calc\n\nSmall arithmetic helpers.\n",
+}
+
+TASKS = [
+    {"task_id": 0, "name": "Add div", "description": "Add a div(a, b) function to calc.py that raises ValueError on zero.", "next_step": "Edit calc.py", "done_flg": False},
+    {"task_id": 1, "name": "Add docstrings", "description": "Add a one-line docstring to every function in calc.py.", "next_step": "Edit calc.py", "done_flg": False},
+    {"task_id": 2, "name": "Document API", "description": "List every function of calc.py in README.md.", "next_step": "Edit README.md", "done_flg": False},
+]
+
+def run_once(carry_over: bool, model: str) -> dict:
+    with tempfile.TemporaryDirectory() as workspace:
+        for name, content in FILES.items():
+            Path(workspace, name).write_text(content, encoding="utf-8")
+        dataholder = DataHolder(tasklist=copy.deepcopy(TASKS), state_summary="", workspace_dir=workspace)
+        for _ in Worker(dataholder).run(model=model, carry_over=carry_over):
+            pass
+        completed = len(dataholder.find_task({"done_flg": True}))
+        result = summarize_usage(dataholder.usage_log)
+        result.update(per_task_metrics(dataholder.usage_log, completed))
+        return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'run':>4}{'done':>6}{'turns':>7}{'tokens':>9}{'tok/task':>10}{'calls/task':>12}")
+    for carry_over in (False, True):
+        mode = "carry-over" if carry_over else "cold"
+        for run in range(args.runs):
+            r = run_once(carry_over, args.model)
+            tokens = r["prompt_tokens"] + r["completion_tokens"]
+            tok_task = f"{r['tokens_per_task']:.0f}" if r["tokens_per_task"] else "-"
+            calls_task = f"{r['tool_calls_per_task']:.1f}" if r["tool_calls_per_task"] else "-"
+            print(f"{mode:<12}{run:>4}{r['completed_tasks']:>6}{r['turns']:>7}{tokens:>9}{tok_task:>10}{calls_task:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the JSON codec backends on the payloads of a session.
+
+For every installed backend (orjson, msgspec, json), times the JSON work of a run of the given number
+of turns: decoding the arguments of every tool call, encoding a structured tool result, and saving and
+loading a plan after every turn. Then compares loading a large plan file whole against streaming it with
+iter_json_array, in time and peak memory. Runs offline.
+
+    python benchmarks/bench_json_codec.py [--turns 500] [--tasks 200] [--large-tasks 100000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from bench_tasklist import make_plan
+from gpt_worker import codec
+
+def tool_arguments(turns: int) -> list:
+    arguments = []
+    for i in range(turns):
+        arguments.append(json.dumps({"file_path": f"src/module_{i % 40}.py"}))
+        arguments.append(json.dumps({"script": f"python -m pytest -q tests/test_module_{i % 40}.py", "ask_user": False}))
+        arguments.append(json.dumps({"tasklist": make_plan(5, i % 5)}))
+    return arguments
+
+def structured_result() -> dict:
+    return {"matches": [{"path": f"src/module_{i}.py", "line": i * 7, "text": f"def step_{i}(value):"} for i in range(50)]}
+
+def time_session(turns: int, tasks: int) -> float:
+    arguments = tool_arguments(turns)
+    result = structured_result()
+    plan = make_plan(tasks, tasks // 2)
+    started = time.perf_counter()
+    for text in arguments:
+        codec.loads(text)
+    for _ in range(turns):
+        codec.dumps(result)
+        codec.loads(codec.dumps(plan))
+    return time.perf_counter() - started
+
+def measure(function):
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = function()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return value, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks of the plan saved and loaded every turn")
+    parser.add_argument("--large-tasks", type=int, default=100000, help="Tasks of the plan loaded whole and streamed")
+    args = parser.parse_args()
+
+    print(f"Session of {args.turns} turns, {args.tasks}-task plan")
+    print(f"{'backend':<10}{'seconds':>10}{'vs json':>10}")
+    baseline = None
+    for name in reversed(codec.available_backends()):
+        codec.use(name)
+        elapsed = time_session(args.turns, args.tasks)
+        baseline = baseline or elapsed
+        print(f"{name:<10}{elapsed:>10.3f}{baseline / elapsed:>9.1f}x")
+    codec.use()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "plan.json")
+        with open(path, mode="w", encoding="utf-8") as f:
+            f.write(codec.dumps(make_plan(args.large_tasks, args.large_tasks // 2)))
+        print(f"\n{args.large_tasks}-task plan ({os.path.getsize(path) / 2**20:.1f} MiB), backend {codec.backend_name()}")
+        print(f"{'method':<12}{'seconds':>10}{'peak MiB':>10}")
+
+        def load_whole():
+            with open(path, encoding="utf-8") as f:
+                return len(codec.loads(f.read()))
+
+        def stream():
+            with open(path, encoding="utf-8") as f:
+                return sum(1 for _ in codec.iter_json_array(f))
+
+        whole, elapsed, peak = measure(load_whole)
+        print(f"{'whole':<12}{elapsed:>10.3f}{peak / 2**20:>10.1f}")
+        streamed, elapsed, peak = measure(stream)
+        print(f"{'streamed':<12}{elapsed:>10.3f}{peak / 2**20:>10.1f}")
+        assert whole == streamed
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares the memory taken by a long conversation kept as a list of dicts and in a MessageStore.
+
+Builds a Worker conversation of the given number of turns the way the connector did before (tool calls
+kept as `vars()` of SDK objects, every tool result a separate string) and the way it does now (plain
+tool call dicts appended to a MessageStore). Each turn reads one of a few dozen files, so files are read
+again and again as in a real session. Prints the memory held at the end with tracemalloc, and the time
+taken to turn the whole conversation into API format for the last request. Runs offline.
+
+    python benchmarks/bench_message_store.py [--turns 500] [--files 40] [--file-lines 200]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from gpt_worker.messages import MessageStore, to_api, tool_call_dict
+from gpt_worker.wire import encode_tool_result
+
+def make_file(index: int, lines: int) -> str:
+    return "".join(f"def step_{index}_{line}(value):\n    return value + {line}\n" for line in range(lines))
+
+def sdk_tool_call(turn: int, path: str) -> ChatCompletionMessageToolCall:
+    return ChatCompletionMessageToolCall(
+        id=f"call_{turn:06d}", type="function",
+        function={"name": "FileReader", "arguments": json.dumps({"path": path})},
+    )
+
+def build(turns: int, files: int, file_lines: int, compact: bool):
+    messages = MessageStore() if compact else []
+    messages.append({"role": "system", "content": "You are a worker agent."})
+    messages.append({"role": "user", "content": "Complete the task list."})
+    for turn in range(turns):
+        path = f"src/module_{turn % files}.py"
+        tool_call = sdk_tool_call(turn, path)
+        calls = [tool_call_dict(tool_call)] if compact else [vars(tool_call)]
+        messages.append({"role": "assistant", "tool_calls": calls})
+        # Every read returns a new string, as the tool reads the file again
+        content = encode_tool_result({"success": True, "path": path, "content": make_file(turn % files, file_lines)})
+        messages.append({"role": "tool", "content": content, "tool_call_id": tool_call.id})
+    return messages
+
+def measure(turns: int, files: int, file_lines: int, compact: bool) -> tuple:
+    tracemalloc.start()
+    messages = build(turns, files, file_lines, compact)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    api_messages = to_api(messages)
+    return api_messages, held, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--files", type=int, default=40, help="Distinct files read over the session")
+    parser.add_argument("--file-lines", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Session of {args.turns} turns reading {args.files} files of {args.file_lines * 2} lines")
+    print(f"{'storage':<14}{'held MiB':>10}{'to_api ms':>11}")
+    results = {}
+    for compact in (False, True):
+        name = "MessageStore" if compact else "list"
+        api_messages, held, elapsed = measure(args.turns, args.files, args.file_lines, compact)
+        results[name] = (api_messages, held)
+        print(f"{name:<14}{held / 2**20:>10.1f}{elapsed * 1000:>11.2f}")
+
+    legacy, legacy_held = results["list"]
+    compact, compact_held = results["MessageStore"]
+    assert [message.get("content") for message in legacy] == [message.get("content") for message in compact]
+    print(f"\n{legacy_held / compact_held:.1f}x less memory held")
+
+if __name__ == "__main__":
+    main()
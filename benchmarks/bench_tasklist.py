@@ -0,0 +1,45 @@
+"""
+Compares the prompt tokens taken by the task list in each rendering.
+
+Renders plans of growing length at several stages of completion as the Python repr used before
+(`str(tasklist)`), as the full table and as the compact view, and prints the token counts. Runs offline.
+
+    python benchmarks/bench_tasklist.py [--encoding o200k_base] [--frontier 3]
+"""
+import argparse
+
+from bench_wire_format import make_counter
+from gpt_worker.prompts import TaskListView, format_tasklist
+
+def make_plan(count: int, done: int) -> list:
+    return [
+        {
+            "task_id": i,
+            "name": f"Implement step {i}",
+            "description": f"Implement step {i} of the feature in src/module_{i}.py, following the existing style, and cover it with tests.",
+            "next_step": f"Open src/module_{i}.py and add the function for step {i}",
+            "done_flg": i < done,
+        }
+        for i in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoding", default="o200k_base")
+    parser.add_argument("--frontier", type=int, default=3)
+    args = parser.parse_args()
+
+    count, method = make_counter(args.encoding)
+    compact = TaskListView(frontier=args.frontier)
+    print(f"Token counts: {method}")
+    print(f"{'tasks':>6}{'done':>6}{'repr':>8}{'full':>8}{'compact':>9}{'saved':>8}")
+    for tasks in (5, 20, 60):
+        for done in (0, tasks // 2, tasks - 1):
+            plan = make_plan(tasks, done)
+            legacy = count(str(plan))
+            full = count(format_tasklist(plan, TaskListView.full()))
+            folded = count(format_tasklist(plan, compact))
+            print(f"{tasks:>6}{done:>6}{legacy:>8}{full:>8}{folded:>9}{1 - folded / legacy:>8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the token cost of tool results in the text wire format against json.dumps.
+
+Encodes FileReader results for the package's own source files, a command output and a PlanUpdater
+result on a ten-task plan both ways, and prints the token counts. Tokens are counted with tiktoken
+when it is installed, and estimated otherwise. Runs offline.
+
+    python benchmarks/bench_wire_format.py [--encoding o200k_base]
+"""
+import argparse
+import json
+import re
+import subprocess
+from pathlib import Path
+
+from gpt_worker.wire import diff_tasklist, encode_tool_result
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "gpt_worker"
+
+def make_counter(encoding: str):
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding(encoding)
+        return lambda text: len(enc.encode(text)), f"tiktoken {encoding}"
+    except ImportError:
+        # Words, escape sequences and single punctuation marks as tokens
+        pattern = re.compile(r"\\.|\w+|[^\w\s]")
+        return lambda text: len(pattern.findall(text)), "estimate (tiktoken not installed)"
+
+def samples():
+    for path in sorted(PACKAGE_DIR.glob("*.py")):
+        result = {"success": True, "path": f"gpt_worker/{path.name}", "content": path.read_text(encoding="utf-8")}
+        yield f"FileReader {path.name}", json.dumps(result), encode_tool_result(result)
+
+    listing = subprocess.run(["ls", "-la", str(PACKAGE_DIR)], capture_output=True, text=True).stdout
+    result = {"success": True, "content": listing}
+    yield "ScriptExecutor ls -la", json.dumps(result), encode_tool_result(result)
+
+    tasklist = [
+        {"task_id": i, "name": f"Task {i}", "description": f"Implement step {i} of the feature and its tests.", "next_step": "Edit the module", "done_flg": i < 4}
+        for i in range(10)
+    ]
+    before = json.loads(json.dumps(tasklist))
+    tasklist[4].update({"done_flg": True, "next_step": "Done"})
+    legacy = {"success": True, "content": str(tasklist)}
+    compact = {"success": True, "content": diff_tasklist(before, tasklist)}
+    yield "PlanUpdater (10 tasks)", json.dumps(legacy), encode_tool_result(compact)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoding", default="o200k_base")
+    args = parser.parse_args()
+
+    count, method = make_counter(args.encoding)
+    print(f"Token counts: {method}")
+    print(f"{'sample':<32}{'json':>8}{'wire':>8}{'saved':>8}")
+    total_json = total_wire = 0
+    for name, legacy, compact in samples():
+        json_tokens, wire_tokens = count(legacy), count(compact)
+        total_json += json_tokens
+        total_wire += wire_tokens
+        print(f"{name:<32}{json_tokens:>8}{wire_tokens:>8}{1 - wire_tokens / json_tokens:>8.0%}")
+    print(f"{'total':<32}{total_json:>8}{total_wire:>8}{1 - total_wire / total_json:>8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
-import os
-import json
-from typing import List, Dict, Type, Optional
+import logging
+import queue
+import threading
+from typing import List, Dict, Tuple, Type, Optional
 from abc import ABC, abstractmethod
-from gpt_worker.tools import FileReader, FileWriter, PlanMaker, ScriptExecutor, StateUpdater
+from gpt_worker.cancellation import CancelledError, CancelToken
+from gpt_worker.tools import CodeSearch, FileReader, FileWriter, MultiFileReader, OutlineReader, PlanMaker, ScriptExecutor, StateUpdater
 from gpt_worker.connector import OpenAIConnector
 from gpt_worker.dataholder import DataHolder
-from gpt_worker.constants import MAX_ITERATIONS, DEFAULT_MODEL
+from gpt_worker.prompts import TaskListView, build_planner_messages, build_worker_messages
+from gpt_worker.fingerprint import WorkspaceFingerprint
+from gpt_worker.history import summarize_turns, render_notes
+from gpt_worker.messages import MessageStore
+from gpt_worker.progress import ProgressTracker
+from gpt_worker.profiler import PHASE_FINGERPRINT, PHASE_PLANNER, PHASE_PROGRESS, PHASE_PROMPT, PHASE_WORKER, profiler
+from gpt_worker.routing import RoutingPolicy
+from gpt_worker.constants import MAX_ITERATIONS, DEFAULT_MODEL, CARRY_OVER_MAX_CHARS, STAGNATION_WINDOW
+
+logger = logging.getLogger(__name__)
 
 # Base Agent class using Abstract Base Class
 class Agent(ABC):
@@ -19,133 +30,107 @@ class Agent(ABC):
 
 # Planner class that utilizes tools to create task plans
 class Planner(Agent):
-    DEFAULT_TOOLS = [FileReader, PlanMaker, StateUpdater]
+    DEFAULT_TOOLS = [FileReader, MultiFileReader, OutlineReader, CodeSearch, PlanMaker, StateUpdater]
 
     def __init__(self, dataholder: DataHolder, tools: Optional[List[Type]] = None):
         self.tools = tools if tools is not None else self.DEFAULT_TOOLS
         self.dataholder = dataholder
 
-    def run(self, order: str = "", model=DEFAULT_MODEL):
+    def run(self, order: str = "", model=DEFAULT_MODEL, routing: Optional[RoutingPolicy] = None, tasklist_view: Optional[TaskListView] = None,
+            cancel: Optional[CancelToken] = None):
         """
         Constructs instructions for LLM to generate intelligent plans. Fetches the current
         directory structure and state summary to provide context to the LLM.
+        Static instructions come first so the prompt prefix can be cached by the provider.
+        Raises CancelledError when the cancel token is cancelled.
         """
-        if order == "":
-            order = "Then expect purpose of your work. Then using PlanMaker tool, make a plan that completes expected purpose of your work.\n"
-        else:
-            order = (
-                "Follow instruction below:\n"
-                + order
-                + "\n"
-                "Then using PlanMaker tool, make a plan that completes expected purpose of your work.\n"
-            )
-
-        # Parse existing tasks and state summary for contextual information
-        taskliststr = ""
-        if self.dataholder.tasklist:
-            for task in self.dataholder.tasklist:
-                taskliststr += str(task) + "\n"
-
-        instruction = (
-            "Using FileReader tool, read an important file in the workspace directory. Read files one by one. Do not read multiple files at once. Repeat this until you understand what is going on in the directory.\n"
-            "Then using StateUpdater tool, write a summary of what is going on in the directory."
-            + order
-            + "---\n"
-            "Below is the current situation and task list. If you think these are enough to perform your work, do not change these.\n"
-            "If tasks are all completed, delete all of them and make a new plan that makes progress."
-            "---\n"
-            + "current situation:\n"
-            + self.dataholder.state_summary
-            + "task list:\n"
-            + taskliststr
-            + "---\n"
-            "Below is the structure of the directory.\n"
-            "Each line means ('path', ['files'], ['directories'])\n"
-            "---\n"
-        )
-        
-        dir_structure = os.walk(self.dataholder.workspace_dir)
-        for i in dir_structure:
-            if ("/." in i[0]) or ("/__" in i[0]):
-                continue
-            instruction += str(i) + "\n"
-        
-        messages = [
-            {"role": "system", "content": "You are a diligent worker good at making detailed plans. Use the supplied tools to assist the user."},
-            {"role":"user", "content": instruction}
-        ]
+        with profiler.phase(PHASE_PLANNER):
+            with self.dataholder.lock, profiler.phase(PHASE_PROMPT):
+                self.dataholder.remember_plan()
+                messages = MessageStore(build_planner_messages(self.dataholder, order, tasklist_view))
 
-        for message in OpenAIConnector.CreateResponse(messages, self.tools, self.dataholder, model):
-            yield message
+            for message in OpenAIConnector.CreateResponse(messages, self.tools, self.dataholder, model, routing=routing, role="planner", cancel=cancel):
+                yield message
+
+    def resume(self, messages: List[Dict], response, model=DEFAULT_MODEL, routing: Optional[RoutingPolicy] = None,
+               cancel: Optional[CancelToken] = None):
+        """
+        Continues a Planner run whose first request was answered elsewhere (e.g. by the Batch API),
+        executing the tool calls of the response and carrying on with interactive turns.
+        """
+        with profiler.phase(PHASE_PLANNER):
+            for message in OpenAIConnector.CreateResponse(MessageStore(messages), self.tools, self.dataholder, model, routing=routing, role="planner", response=response, cancel=cancel):
+                yield message
 
 # Worker class that executes tasks and utilizes various tools to assist 
 class Worker(Agent):
-    DEFAULT_TOOLS = [FileReader, FileWriter, ScriptExecutor, PlanMaker]
+    DEFAULT_TOOLS = [FileReader, MultiFileReader, OutlineReader, CodeSearch, FileWriter, ScriptExecutor, PlanMaker]
 
     def __init__(self, dataholder: DataHolder, tools: Optional[List[Type]] = None):
         self.tools = tools if tools is not None else self.DEFAULT_TOOLS
         self.dataholder = dataholder
 
-    def run(self, order: str = "", max_iterations: int = MAX_ITERATIONS, model=DEFAULT_MODEL):
+    def run(
+        self,
+        order: str = "",
+        max_iterations: int = MAX_ITERATIONS,
+        model=DEFAULT_MODEL,
+        carry_over: bool = False,
+        stagnation_window: int = STAGNATION_WINDOW,
+        token_budget: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        routing: Optional[RoutingPolicy] = None,
+        tasklist_view: Optional[TaskListView] = None,
+        cancel: Optional[CancelToken] = None,
+    ):
         """
-        Executes tasks based on the current task list and updates their status iteratively. Stops execution in
-case of stagnation in progress or upon reaching a maximum number of iterations.
+        Executes tasks based on the current task list and updates their status iteratively. Stops execution when
+        all tasks are done, when no progress is made for stagnation_window iterations, when the token or time
+        budget is used up, or upon reaching a maximum number of iterations. The reason is kept in self.progress.
+        With carry_over, each iteration continues from a compacted summary of what was read and done before
+        instead of starting cold. When a WorkspaceWatcher is attached to the DataHolder, each iteration is told
+        which files changed since the previous one. When the cancel token is cancelled (or its deadline passes),
+        the run stops at the next safe point: a command in progress is killed and CancelledError is raised.
         """
-        iteration_count = 0
-        previous_task_states = None
-
-        while True:
-            # Limit the number of iterations to prevent infinite loops
-            if iteration_count >= max_iterations:
-                yield {
-                    "role": "assistant",
-                    "content": f"Warning: Reached maximum number of iterations ({max_iterations}). Stopping execution to prevent infinite loop. Some tasks may remain incomplete."
-                }
-                break
-
-            # Check for incomplete tasks
-            incomplete_tasks = self.dataholder.find_task({"done_flg": False})
-            if not incomplete_tasks:
-                break
-
-            current_task_states = [(task.get("task_id", ""), task.get("done_flg", False)) for task in self.dataholder.tasklist]
-
-            if previous_task_states == current_task_states and iteration_count > 0:
-                yield {
-                    "role": "assistant",
-                    "content": "Warning: No progress detected in tasks between iterations. Stopping execution to prevent infinite loop."
-                }
-                break
-
-            previous_task_states = current_task_states
-
-            current_order = ("Follow instruction below:\n" + order + "\n") if order else ""
-
-            instruction = (
-                "First, check whether you understand the current situation. If not, use tools to explore the directory until you understand. Read files one by one. Do not read multiple files at once.\n"
-                "Then, work on the task using tools. If possible, do not ask the user anything. Do your work as far as you can.\n"
-                + current_order
-                + "At the end of your work, update the situation of the task using PlanMaker, and update the current situation using StateUpdater if needed."
-                "Make sure to set done_flg to true for tasks that are actually completed.\n"
-                "Current situation is below:\n"
-                "---\n"
-                + self.dataholder.state_summary
-                + "---\n"
-                "Your plan of task is below:\n"
-                "---\n"
-                + str(self.dataholder.tasklist)
-                + "\nFocus on completing the remaining incomplete tasks."
-            )
-
-            messages = [
-                {"role":"system", "content": f"You are a diligent worker working on Linux system directory :`{self.dataholder.workspace_dir}`. Use the supplied tools to assist the user."},
-                {"role":"user", "content": instruction}
-            ]
-
-            for message in OpenAIConnector.CreateResponse(messages, self.tools, self.dataholder, model):
-                yield message
-
-            iteration_count += 1
+        with profiler.phase(PHASE_WORKER):
+            with profiler.phase(PHASE_PROGRESS):
+                self.progress = ProgressTracker(
+                    self.dataholder,
+                    max_iterations=max_iterations,
+                    stagnation_window=stagnation_window,
+                    token_budget=token_budget,
+                    time_budget=time_budget,
+                )
+            notes: List[str] = []
+            watcher = self.dataholder.watcher
+            if watcher is not None:
+                # Changes made before the first iteration are already visible in the workspace
+                watcher.drain_changes()
+
+            while True:
+                if cancel is not None:
+                    cancel.check()
+                if self.progress.should_stop():
+                    logger.info(f"Worker stopped ({self.progress.stop_reason}): {self.progress.explanation}")
+                    if self.progress.stop_reason != "completed":
+                        yield {"role": "assistant", "content": self.progress.explanation}
+                    break
+
+                with profiler.phase(PHASE_PROMPT):
+                    carried_over = render_notes(notes, CARRY_OVER_MAX_CHARS) if carry_over else ""
+                    changed_paths = watcher.drain_changes() if watcher is not None else None
+                    with self.dataholder.lock:
+                        self.dataholder.remember_plan()
+                        messages = MessageStore(build_worker_messages(self.dataholder, order, carried_over, changed_paths, tasklist_view))
+                first_turn = len(messages)
+
+                for message in OpenAIConnector.CreateResponse(messages, self.tools, self.dataholder, model, routing=routing, role="worker", cancel=cancel):
+                    yield message
+
+                with profiler.phase(PHASE_PROGRESS):
+                    self.progress.record_iteration(messages[first_turn:])
+                    if carry_over:
+                        notes += summarize_turns(messages[first_turn:])
 
 # Orchestrator class that combines planning and working agents for comprehensive task management
 class Orchestrator(Agent):
@@ -153,14 +138,114 @@ class Orchestrator(Agent):
         self.tools = tools if tools is not None else []
         self.dataholder = dataholder
 
-    def run(self, order: str = "", model: str=DEFAULT_MODEL):
+    def run(self, order: str = "", model: str=DEFAULT_MODEL, carry_over: bool = False, routing: Optional[RoutingPolicy] = None,
+            tasklist_view: Optional[TaskListView] = None, replan: bool = False, pipeline: bool = False,
+            cancel: Optional[CancelToken] = None, **worker_options):
         """
         Deploys the Planner to create an executable task list and then uses the Worker to fulfill the planned tasks.
+        Planning is skipped when the plan has incomplete tasks and neither the workspace, the plan nor the order
+        changed since the previous run ended, unless replan is set. With pipeline, the Worker starts on the first
+        tasks as soon as the Planner has saved a plan, while the Planner keeps refining it.
+        Extra keyword arguments (stagnation_window, token_budget, time_budget, ...) are passed to Worker.run.
+        The cancel token is passed to both agents; a cancelled run raises CancelledError and leaves the
+        fingerprint unsaved, so the next run plans again if needed.
         """
-        planner = Planner(self.dataholder)
-        for message in planner.run(order=order, model=model):
-            yield message
+        with profiler.phase(PHASE_FINGERPRINT):
+            fingerprint = WorkspaceFingerprint(self.dataholder.workspace_dir)
+            pending = self.dataholder.find_task({"done_flg": False})
+            unchanged = not replan and bool(pending) and fingerprint.matches(order, self.dataholder.tasklist)
+        if unchanged:
+            logger.info("Workspace, plan and order unchanged since the previous run; skipping the Planner")
+            yield {"role": "assistant", "content": f"Nothing changed since the previous run; continuing the plan ({len(pending)} tasks left)."}
+        elif pipeline:
+            yield from self._run_pipelined(order, model, carry_over, routing, tasklist_view, cancel, worker_options)
+            with profiler.phase(PHASE_FINGERPRINT):
+                fingerprint.save(order, self.dataholder.tasklist)
+            return
+        else:
+            planner = Planner(self.dataholder)
+            for message in planner.run(order=order, model=model, routing=routing, tasklist_view=tasklist_view, cancel=cancel):
+                yield message
         
         worker = Worker(self.dataholder)
-        for message in worker.run(order=order, model=model):
+        for message in worker.run(order=order, model=model, carry_over=carry_over, routing=routing, tasklist_view=tasklist_view,
+                                  cancel=cancel, **worker_options):
             yield message
+
+        with profiler.phase(PHASE_FINGERPRINT):
+            fingerprint.save(order, self.dataholder.tasklist)
+
+    def _run_pipelined(self, order: str, model: str, carry_over: bool, routing: Optional[RoutingPolicy],
+                       tasklist_view: Optional[TaskListView], cancel: Optional[CancelToken], worker_options: Dict):
+        """
+        Runs the Planner and the Worker on threads: the Worker starts as soon as the Planner has saved a plan,
+        while the Planner goes on refining the plan and the state summary. Messages of both are yielded as
+        they come. Plans saved by either agent are merged, so tasks completed meanwhile stay completed.
+        Both threads are stopped and joined when the run ends, including when the caller closes the generator.
+        """
+        events: "queue.Queue[Tuple[str, object]]" = queue.Queue()
+        threads: List[threading.Thread] = []
+        # Cancelled on the way out, or together with the token of the caller
+        stop = CancelToken()
+        unregister = cancel.on_cancel(lambda: stop.cancel(cancel.reason)) if cancel is not None else None
+
+        def produce(name: str, messages) -> None:
+            try:
+                for message in messages:
+                    if stop.cancelled:
+                        break
+                    events.put(("message", message))
+            except Exception as e:
+                if not isinstance(e, CancelledError):
+                    logger.error(f"{name} failed in pipelined run: {e}")
+                events.put(("error", e))
+            finally:
+                messages.close()
+                events.put(("done", name))
+
+        def start(name: str, messages) -> None:
+            thread = threading.Thread(target=produce, args=(name, messages), name=f"gptw-{name}", daemon=True)
+            threads.append(thread)
+            thread.start()
+
+        self.dataholder.merge_plans = True
+        try:
+            version = self.dataholder.plan_version
+            planner = Planner(self.dataholder)
+            worker = Worker(self.dataholder)
+            start("planner", planner.run(order=order, model=model, routing=routing, tasklist_view=tasklist_view, cancel=stop))
+
+            running = {"planner"}
+            worker_started = False
+            errors: List[Exception] = []
+            while running:
+                kind, payload = events.get()
+                if kind == "message":
+                    yield payload
+                elif kind == "error":
+                    errors.append(payload)
+                    # The other agent would keep making paid requests until it finished on its own
+                    stop.cancel()
+                else:
+                    running.discard(payload)
+                if not worker_started and not errors and (self.dataholder.plan_version > version or not running):
+                    logger.info("Plan saved; starting the Worker while the Planner continues")
+                    start("worker", worker.run(order=order, model=model, carry_over=carry_over, routing=routing,
+                                               tasklist_view=tasklist_view, cancel=stop, **worker_options))
+                    worker_started = True
+                    running.add("worker")
+            if errors:
+                raise errors[0]
+
+            # The Planner added tasks after the Worker had completed everything it knew of
+            if worker_started and worker.progress.stop_reason == "completed" and self.dataholder.find_task({"done_flg": False}):
+                logger.info("Plan revised after the Worker finished; running the Worker again")
+                yield from Worker(self.dataholder).run(order=order, model=model, carry_over=carry_over, routing=routing,
+                                                       tasklist_view=tasklist_view, cancel=stop, **worker_options)
+        finally:
+            stop.cancel()
+            for thread in threads:
+                thread.join()
+            if unregister is not None:
+                unregister()
+            self.dataholder.merge_plans = False
@@ -0,0 +1,416 @@
+"""
+Approval of ScriptExecutor commands.
+
+ApprovalPolicy decides from declarative rules whether a script may run. Scripts are split into
+commands with `shlex`, and each command is matched against the rules of the workspace
+(`.gpt_worker/approval.json`, or the built-in defaults):
+
+    {
+        "allow": ["ls", "git status", "python -m pytest"],
+        "ask": ["git push", "rm -r*"],
+        "deny": ["sudo", "mkfs*"],
+        "paths": ["/tmp"],
+        "default": "model"
+    }
+
+A rule is a command name followed by arguments, all of which may be glob patterns. `allow` rules
+match a command that starts with the rule's words; `ask` and `deny` rules match a command that
+contains the rule's arguments anywhere. Rules are matched against the command run by wrappers such as
+`env`, `nice`, `timeout` or `xargs`, and `sh -c` or `eval` always need approval. Deny wins over ask, and ask over allow. A script is only
+allowed when every command is allowed and every path it names is inside the workspace or one of
+`paths`. Commands naming the `.gpt_worker` directory always need approval, as it holds these rules.
+Commands no rule decides fall back to `default`: "model" (the ask_user flag of the tool
+call), "ask", "allow" or "deny".
+
+When a human has to decide, the approver of the DataHolder is asked: the console by default,
+nobody in unattended runs, or an ApprovalQueue in `gptw serve`. Requests in the queue are answered
+over HTTP, and only the job waiting for one is blocked.
+"""
+import fnmatch
+import json
+import logging
+import os
+import re
+import shlex
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+from gpt_worker.cancellation import CancelToken
+from gpt_worker.constants import APPROVAL_FILE, APPROVAL_TIMEOUT, GPT_WORKER_DIR
+
+logger = logging.getLogger(__name__)
+
+ALLOW = "allow"
+ASK = "ask"
+DENY = "deny"
+MODEL = "model"  # no rule decided; the ask_user flag of the tool call decides
+
+# Commands that only look at the workspace when run through ScriptExecutor
+READ_ONLY_COMMANDS = {"ls", "cat", "head", "tail", "wc", "find", "grep", "tree", "pwd", "file", "stat", "du"}
+
+DEFAULT_RULES = {
+    ALLOW: sorted(READ_ONLY_COMMANDS) + ["echo", "touch", "mkdir", "diff", "sort", "uniq", "true", "false",
+                                         "git status", "git diff", "git log", "git show"],
+    ASK: ["find -delete", "find -exec*", "find -execdir*", "find -ok*", "rm -r*", "rm -f*", "dd", "git push", "git reset"],
+    DENY: ["sudo", "su", "doas", "mkfs*", "shutdown", "reboot", "halt", "poweroff"],
+    "paths": [],
+    "default": MODEL,
+}
+
+# Operators that separate commands
+_CONTROL_OPERATORS = {"&&", "||", ";", "|", "&", "(", ")", ";;", "|&"}
+REDIRECTIONS = {">", ">>", "<", ">&", "<&", "&>", ">|"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+# Redirect targets that are always safe
+SAFE_TARGETS = {"/dev/null"}
+# Commands that run the command following their options, with the options that take a separate argument
+_WRAPPERS = {
+    "env": {"-u", "--unset", "-C", "--chdir", "-S", "--split-string"},
+    "nice": {"-n", "--adjustment"},
+    "nohup": set(),
+    "timeout": {"-s", "--signal", "-k", "--kill-after"},
+    "command": set(),
+    "exec": {"-a"},
+    "xargs": {"-a", "--arg-file", "-d", "--delimiter", "-E", "-e", "-I", "-i", "-L", "-l", "-n", "--max-args",
+              "-P", "--max-procs", "-s", "--max-chars"},
+    "stdbuf": {"-i", "-o", "-e", "--input", "--output", "--error"},
+}
+# Wrappers whose first word after the options is an argument of their own, not the command
+_WRAPPER_ARGUMENTS = {"timeout": 1}
+# Commands that run a string as a script, which cannot be checked
+_SHELLS = {"sh", "bash", "zsh", "dash", "ksh"}
+_RM_FLAGS = {"--recursive": "-r", "--force": "-f", "R": "r"}
+
+# approver(script, workspace_dir, reason) -> whether the script may run
+Approver = Callable[[str, str, str], bool]
+
+class ApprovalError(Exception):
+    """Raised when approval rules are invalid"""
+    pass
+
+class ApprovalNotFoundError(ApprovalError):
+    """Raised when an approval request is not found"""
+    pass
+
+class Decision:
+    """
+    Outcome of a policy check: action is "allow", "ask", "deny" or "model", with the reason.
+    """
+
+    def __init__(self, action: str, reason: str):
+        self.action = action
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"Decision({self.action!r}, {self.reason!r})"
+
+def unwrap_command(words: List[str]) -> List[str]:
+    """
+    Strips wrapper commands (env, nice, nohup, timeout, command, exec, xargs, stdbuf) with their options
+    and assignments, and returns the command they run. Wrappers with no command are returned as they are.
+    """
+    while words and os.path.basename(words[0]) in _WRAPPERS:
+        name = os.path.basename(words[0])
+        index = 1
+        while index < len(words) and (words[index].startswith("-") or (name == "env" and _ASSIGNMENT.match(words[index]))):
+            if words[index] == "--":
+                index += 1
+                break
+            index += 2 if words[index] in _WRAPPERS[name] else 1
+        index += _WRAPPER_ARGUMENTS.get(name, 0)
+        if index >= len(words):
+            break
+        words = words[index:]
+    return words
+
+def normalize_command(words: List[str]) -> List[str]:
+    """
+    Normalizes a command for the ask and deny rules: the command name loses its directory, and the
+    recursive and force flags of rm are spelt "-r" and "-f" whichever form was used.
+    """
+    words = [os.path.basename(words[0])] + words[1:]
+    if words[0] != "rm":
+        return words
+    normalized = ["rm"]
+    for word in words[1:]:
+        if word in _RM_FLAGS:
+            normalized.append(_RM_FLAGS[word])
+        elif word.startswith("-") and not word.startswith("--") and len(word) > 1:
+            normalized += [f"-{_RM_FLAGS.get(flag, flag)}" for flag in word[1:]]
+        else:
+            normalized.append(word)
+    return normalized
+
+def split_commands(script: str) -> List[List[str]]:
+    """
+    Splits a shell script into commands, each a list of words with redirections kept as separate words.
+
+    Raises:
+        ValueError: When the script cannot be parsed (e.g. unbalanced quotes)
+    """
+    lexer = shlex.shlex(script.replace("\n", " ; "), posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    commands: List[List[str]] = [[]]
+    for token in lexer:
+        if token in _CONTROL_OPERATORS:
+            commands.append([])
+        else:
+            commands[-1].append(token)
+    return [command for command in commands if command]
+
+class ApprovalPolicy:
+    """
+    Declarative allow/ask/deny rules for the commands of one workspace.
+    """
+
+    def __init__(self, workspace_dir: str, rules: Optional[Dict] = None):
+        rules = dict(DEFAULT_RULES if rules is None else rules)
+        default = rules.get("default", MODEL)
+        if default not in (ALLOW, ASK, DENY, MODEL):
+            raise ApprovalError(f"Invalid default action: {default} (expected allow, ask, deny or model)")
+        self.workspace_dir = os.path.realpath(workspace_dir)
+        self.allow = self._parse_rules(rules.get(ALLOW, []))
+        self.ask = self._parse_rules(rules.get(ASK, []))
+        self.deny = self._parse_rules(rules.get(DENY, []))
+        self.default = default
+        self.roots = [self.workspace_dir] + [os.path.realpath(os.path.expanduser(path)) for path in rules.get("paths", [])]
+
+    @classmethod
+    def load(cls, workspace_dir: str) -> "ApprovalPolicy":
+        """
+        Loads the approval file of the workspace, or the default rules when there is none.
+
+        Raises:
+            ApprovalError: When the file is not valid
+        """
+        path = os.path.join(workspace_dir, APPROVAL_FILE)
+        if not os.path.isfile(path):
+            return cls(workspace_dir)
+        try:
+            with open(path, encoding="utf-8") as f:
+                rules = json.loads(f.read())
+        except json.JSONDecodeError as e:
+            raise ApprovalError(f"Invalid approval file {path}: {e}")
+        return cls(workspace_dir, rules)
+
+    @staticmethod
+    def _parse_rules(rules: Iterable[str]) -> List[List[str]]:
+        try:
+            return [shlex.split(rule) for rule in rules if rule.strip()]
+        except ValueError as e:
+            raise ApprovalError(f"Invalid rule: {e}")
+
+    @staticmethod
+    def _matches_prefix(rule: List[str], words: List[str]) -> bool:
+        return len(words) >= len(rule) and all(fnmatch.fnmatchcase(word, pattern) for pattern, word in zip(rule, words))
+
+    @staticmethod
+    def _matches_anywhere(rule: List[str], words: List[str]) -> bool:
+        if not fnmatch.fnmatchcase(words[0], rule[0]):
+            return False
+        return all(any(fnmatch.fnmatchcase(word, pattern) for word in words[1:]) for pattern in rule[1:])
+
+    @staticmethod
+    def _runs_string(words: List[str]) -> bool:
+        """
+        Whether the command runs a string as a script (`eval`, `sh -c`, `env -S`), which cannot be checked.
+        """
+        if words[0] == "eval":
+            return True
+        options = [word for word in words[1:] if word.startswith("-") and not word.startswith("--")]
+        if words[0] in _SHELLS:
+            return any("c" in option for option in options)
+        if words[0] == "env":
+            return any("S" in option for option in options) or any(word.startswith("--split-string") for word in words[1:])
+        return False
+
+    def _out_of_scope(self, words: List[str]) -> Optional[str]:
+        """
+        Returns the first path named by the command that is outside the allowed roots.
+        """
+        for index, word in enumerate(words):
+            redirected = index > 0 and words[index - 1] in REDIRECTIONS
+            candidate = word.split("=", 1)[1] if word.startswith("-") and "=" in word else word
+            if "://" in candidate or (candidate.startswith("-") and not redirected):
+                continue
+            if redirected and candidate in SAFE_TARGETS:
+                continue
+            if not redirected and "/" not in candidate and not candidate.startswith("~") and candidate != "..":
+                continue
+            path = os.path.realpath(os.path.join(self.workspace_dir, os.path.expanduser(candidate)))
+            if not any(path == root or path.startswith(root + os.sep) for root in self.roots):
+                return word
+        return None
+
+    def _names_config(self, words: List[str]) -> Optional[str]:
+        """
+        Returns the first word naming the gptw directory of the workspace, or a glob that may match it.
+        The rules, endpoints and routes there must not be changed by the agent without approval.
+        """
+        config_dir = os.path.join(self.workspace_dir, GPT_WORKER_DIR)
+        for word in words[1:]:
+            candidate = word.split("=", 1)[1] if word.startswith("-") and "=" in word else word
+            if any(part.startswith((".", "[")) and fnmatch.fnmatchcase(GPT_WORKER_DIR, part) for part in candidate.split("/")):
+                return word
+            path = os.path.realpath(os.path.join(self.workspace_dir, os.path.expanduser(candidate)))
+            if path == config_dir or path.startswith(config_dir + os.sep):
+                return word
+        return None
+
+    def decide(self, script: str) -> Decision:
+        """
+        Decides whether a script may run.
+        """
+        if "$(" in script or "`" in script:
+            return Decision(ASK, "command substitution cannot be checked")
+        if "<(" in script or ">(" in script:
+            return Decision(ASK, "process substitution cannot be checked")
+        try:
+            commands = split_commands(script)
+        except ValueError as e:
+            return Decision(ASK, f"script cannot be parsed ({e})")
+        if not commands:
+            return Decision(ALLOW, "empty script")
+
+        decisions = []
+        for command in commands:
+            words = [word for word in command if not _ASSIGNMENT.match(word)] or command
+            text = " ".join(words)
+            matched = normalize_command(unwrap_command(words))
+            if any(self._matches_anywhere(rule, matched) for rule in self.deny):
+                return Decision(DENY, f"'{text}' is denied")
+            if any(self._matches_anywhere(rule, matched) for rule in self.ask):
+                decisions.append(Decision(ASK, f"'{text}' needs approval"))
+                continue
+            if self._runs_string(matched):
+                decisions.append(Decision(ASK, f"'{text}' runs a script string that cannot be checked"))
+                continue
+            # Expansions ($HOME, ${VAR}, ...) can name any path, so no allow rule or path check applies
+            if any("$" in word for word in command):
+                decisions.append(Decision(ASK, f"'{text}' uses shell expansion that cannot be checked"))
+                continue
+            config = self._names_config(words)
+            if config is not None:
+                decisions.append(Decision(ASK, f"'{text}' touches {config}, which holds the gptw settings"))
+                continue
+            outside = self._out_of_scope(words)
+            if outside is not None:
+                decisions.append(Decision(ASK, f"'{text}' touches {outside} outside the workspace"))
+            elif any(self._matches_prefix(rule, unwrap_command(words)) for rule in self.allow):
+                decisions.append(Decision(ALLOW, f"'{text}' is allowed"))
+            else:
+                decisions.append(Decision(self.default, f"no rule for '{text}'"))
+
+        for action in (DENY, ASK, MODEL):
+            for decision in decisions:
+                if decision.action == action:
+                    return decision
+        return Decision(ALLOW, "all commands are allowed")
+
+def console_approver(script: str, workspace_dir: str, reason: str) -> bool:
+    """
+    Asks the user on the console.
+    """
+    print("The agent wants to execute the following non-allowed script that requires approval:")
+    print("---")
+    print(script)
+    print("---")
+    if reason:
+        print(f"Reason: {reason}")
+    print("Enter 'y' to permit execution. Any other input will abort.")
+    return input().strip().lower() == "y"
+
+def unattended_approver(script: str, workspace_dir: str, reason: str) -> bool:
+    """
+    Refuses everything that needs a human, for runs nobody is watching.
+    """
+    logger.info(f"Refused without approval (unattended): {script} ({reason})")
+    return False
+
+class ApprovalRequest:
+    """
+    A command waiting for a human decision.
+    """
+
+    def __init__(self, script: str, workspace_dir: str, reason: str):
+        self.request_id = uuid.uuid4().hex
+        self.script = script
+        self.workspace_dir = workspace_dir
+        self.reason = reason
+        self.status = "pending"  # pending, approved, denied, expired
+        self.created_at = time.time()
+        self._event = threading.Event()
+
+    def to_dict(self) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "script": self.script,
+            "directory": self.workspace_dir,
+            "reason": self.reason,
+            "status": self.status,
+            "created_at": self.created_at,
+        }
+
+class ApprovalQueue:
+    """
+    Thread-safe queue of approval requests, answered from elsewhere (e.g. the HTTP API of `gptw serve`).
+    An instance is an approver: calling it blocks only the calling job until the request is answered
+    or expires after `timeout` seconds.
+    """
+
+    def __init__(self, timeout: float = APPROVAL_TIMEOUT):
+        self.timeout = timeout
+        self.requests: Dict[str, ApprovalRequest] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, script: str, workspace_dir: str, reason: str = "") -> ApprovalRequest:
+        request = ApprovalRequest(script, workspace_dir, reason)
+        with self._lock:
+            self.requests[request.request_id] = request
+        logger.info(f"Approval requested: {request.request_id} ({script})")
+        return request
+
+    def pending(self) -> List[ApprovalRequest]:
+        with self._lock:
+            return [request for request in self.requests.values() if request.status == "pending"]
+
+    def resolve(self, request_id: str, approved: bool) -> ApprovalRequest:
+        """
+        Raises:
+            ApprovalNotFoundError: When there is no pending request with the id
+        """
+        with self._lock:
+            request = self.requests.get(request_id)
+            if request is None or request.status != "pending":
+                raise ApprovalNotFoundError(f"Approval request not found: {request_id}")
+            request.status = "approved" if approved else "denied"
+        request._event.set()
+        return request
+
+    def wait(self, request: ApprovalRequest, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for a request to be answered. Returns whether it was approved.
+        """
+        request._event.wait(self.timeout if timeout is None else timeout)
+        with self._lock:
+            if request.status == "pending":
+                request.status = "expired"
+                logger.info(f"Approval request expired: {request.request_id}")
+            self.requests.pop(request.request_id, None)
+            return request.status == "approved"
+
+    def ask(self, script: str, workspace_dir: str, reason: str, cancel: Optional[CancelToken] = None) -> bool:
+        """
+        Submits a request and waits for the answer. A cancelled token expires the request at once.
+        """
+        request = self.submit(script, workspace_dir, reason)
+        unregister = cancel.on_cancel(request._event.set) if cancel is not None else None
+        try:
+            return self.wait(request)
+        finally:
+            if unregister is not None:
+                unregister()
+
+    def __call__(self, script: str, workspace_dir: str, reason: str) -> bool:
+        return self.ask(script, workspace_dir, reason)
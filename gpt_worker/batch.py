@@ -0,0 +1,168 @@
+"""
+Planning many workspaces through the Batch API.
+
+For sweeps over many workspaces, where latency does not matter but cost and rate limits do,
+BatchPlanner sends the first Planner request of every workspace as one JSONL batch
+(`/v1/files` and `/v1/batches`), polls the batch until it is done, and then continues the tool
+loop of each workspace from its result. Only the first turn is batched; the turns that follow
+the tool calls are interactive. Workspaces the batch did not answer are planned interactively.
+
+A batch can take up to its completion window (24 hours). When polling is interrupted, the same
+BatchPlanner can pick up the submitted batch again by its id; the requests are rebuilt from the
+workspaces, which should not change in between.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from openai.types.chat import ChatCompletion
+from gpt_worker.agents import Planner
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.constants import BATCH_COMPLETION_WINDOW, BATCH_COST_FACTOR, BATCH_POLL_INTERVAL, DEFAULT_MODEL
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.prompts import TaskListView, build_planner_messages
+from gpt_worker.routing import RoutingPolicy
+from gpt_worker.telemetry import usage_from_response
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+class BatchError(Exception):
+    """Raised when a batch cannot be submitted or read"""
+    pass
+
+class BatchPlanner:
+    """
+    Runs the Planner on several workspaces with their first requests sent as one batch.
+
+    Attributes:
+        dataholders: workspace path -> DataHolder; the paths are the custom_ids of the batch requests
+        batch_id: Id of the submitted batch
+    """
+
+    def __init__(self, workspace_dirs: List[str], order: str = "", model: str = DEFAULT_MODEL,
+                 routing: Optional[RoutingPolicy] = None, tasklist_view: Optional[TaskListView] = None,
+                 client: Optional[Any] = None, poll_interval: float = BATCH_POLL_INTERVAL):
+        self.dataholders: "OrderedDict[str, DataHolder]" = OrderedDict(
+            (os.path.abspath(workspace_dir), DataHolder.from_workspace(workspace_dir)) for workspace_dir in workspace_dirs
+        )
+        self.order = order
+        self.model = model
+        self.routing = routing
+        self.tasklist_view = tasklist_view
+        self.client = client
+        self.poll_interval = poll_interval
+        self.batch_id: Optional[str] = None
+        self._requests: Dict[str, Dict] = {}
+
+    def _client(self) -> Any:
+        return self.client if self.client is not None else OpenAIConnector.get_client()
+
+    def build(self) -> bytes:
+        """
+        Builds the JSONL batch input: one chat completion request per workspace.
+        """
+        lines = []
+        for custom_id, dataholder in self.dataholders.items():
+            planner = Planner(dataholder)
+            messages = build_planner_messages(dataholder, self.order, self.tasklist_view)
+            route, model = self.routing.select("planner", messages, self.model) if self.routing else ("default", self.model)
+            self._requests[custom_id] = {"messages": messages, "model": model, "route": route}
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {"model": model, "messages": messages, "tools": OpenAIConnector.get_tool_schemas(planner.tools)},
+            }, ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def submit(self, batch_file: Optional[str] = None) -> str:
+        """
+        Uploads the batch input and creates the batch. The input is also written to `batch_file` when given.
+        Returns the batch id.
+        """
+        data = self.build()
+        if batch_file:
+            with open(batch_file, mode="wb") as f:
+                f.write(data)
+        client = self._client()
+        input_file = client.files.create(file=("planner_batch.jsonl", data), purpose="batch")
+        batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW)
+        self.batch_id = batch.id
+        logger.info(f"Submitted batch {batch.id} with {len(self.dataholders)} Planner requests")
+        return batch.id
+
+    def wait(self, batch_id: str) -> Any:
+        """
+        Polls a batch until it is completed, failed, expired or cancelled.
+        """
+        client = self._client()
+        while True:
+            batch = client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            progress = f" ({counts.completed}/{counts.total} done)" if counts is not None else ""
+            logger.info(f"Batch {batch_id}: {batch.status}{progress}")
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            time.sleep(self.poll_interval)
+
+    def results(self, batch: Any) -> Dict[str, ChatCompletion]:
+        """
+        Reads the successful responses of a finished batch by custom_id. Failed requests are logged and left out.
+        """
+        client = self._client()
+        responses: Dict[str, ChatCompletion] = {}
+        if getattr(batch, "output_file_id", None):
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") == 200:
+                    responses[result["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                else:
+                    logger.warning(f"Batch request {result['custom_id']} failed: {result.get('error') or response.get('body')}")
+        if getattr(batch, "error_file_id", None):
+            for line in client.files.content(batch.error_file_id).text.splitlines():
+                if line.strip():
+                    result = json.loads(line)
+                    logger.warning(f"Batch request {result.get('custom_id')} failed: {result.get('error') or result.get('response')}")
+        return responses
+
+    def run(self, batch_id: Optional[str] = None, batch_file: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Submits the batch (or picks up `batch_id`), waits for it and continues every workspace from its result.
+        Yields (workspace path, message) pairs, one workspace after another.
+        """
+        if batch_id is None:
+            batch_id = self.submit(batch_file)
+        else:
+            self.build()
+            self.batch_id = batch_id
+        started = time.perf_counter()
+        batch = self.wait(batch_id)
+        if batch.status != "completed" and not getattr(batch, "output_file_id", None):
+            logger.warning(f"Batch {batch_id} {batch.status} without results; planning every workspace interactively")
+        responses = self.results(batch)
+        elapsed = time.perf_counter() - started
+
+        for custom_id, dataholder in self.dataholders.items():
+            planner = Planner(dataholder)
+            response = responses.get(custom_id)
+            if response is None:
+                logger.warning(f"No batch result for {custom_id}; planning interactively")
+                for message in planner.run(order=self.order, model=self.model, routing=self.routing, tasklist_view=self.tasklist_view):
+                    yield custom_id, message
+                continue
+
+            request = self._requests[custom_id]
+            usage = usage_from_response(response, request["model"], route=request["route"], latency=elapsed)
+            if usage["cost"] is not None:
+                usage["cost"] *= BATCH_COST_FACTOR
+            dataholder.usage_log.append(usage)
+            for message in planner.resume(request["messages"], response, model=self.model, routing=self.routing):
+                yield custom_id, message
@@ -0,0 +1,140 @@
+"""
+Cooperative cancellation and deadlines for agent runs.
+
+A CancelToken is passed from Orchestrator.run through the agents and OpenAIConnector.CreateResponse
+down to the tools. It is cancelled explicitly (Ctrl-C in `gptw run`, a scheduler enforcing an SLA) or
+when its deadline passes, and everything holding it stops at the next safe point:
+
+- the connector stops waiting for an in-flight API request and raises CancelledError,
+- ScriptExecutor kills the process group of a running command,
+- retry delays are cut short.
+
+Tools always finish the write they are doing, so the plan and the state summary on disk stay
+consistent; whatever was saved before the cancellation is kept.
+"""
+import logging
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REASON_CANCELLED = "cancelled"
+REASON_DEADLINE = "deadline exceeded"
+REASON_INTERRUPTED = "interrupted"
+
+class CancelledError(Exception):
+    """Raised when work stops because its CancelToken was cancelled"""
+
+    def __init__(self, reason: str = REASON_CANCELLED):
+        super().__init__(f"Run {reason}")
+        self.reason = reason
+
+class CancelToken:
+    """
+    Cancellation flag shared by everything working on one run, with an optional deadline.
+
+    Attributes:
+        deadline: time.monotonic() value after which the token cancels itself, or None
+        reason: Why the token was cancelled (None while it is not)
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        # Reentrant, as cancel() can run in a signal handler interrupting on_cancel() on the same thread
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        if timeout is not None:
+            self._timer = threading.Timer(max(timeout, 0.0), self.cancel, args=(REASON_DEADLINE,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(REASON_DEADLINE)
+        return self._event.is_set()
+
+    def cancel(self, reason: str = REASON_CANCELLED) -> None:
+        """
+        Cancels the token and runs the callbacks registered with on_cancel. Later calls do nothing.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"Run {reason}")
+        self.close()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancel callback failed: {e}")
+
+    def close(self) -> None:
+        """Stops the deadline timer, e.g. when the run finished before its deadline"""
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None without a deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        """
+        Raises:
+            CancelledError: When the token is cancelled
+        """
+        if self.cancelled:
+            raise CancelledError(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits up to timeout seconds for the token to be cancelled. Returns whether it was"""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Registers a callback run once when the token is cancelled, right away if it already is.
+        Returns a function that unregisters it.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+@contextmanager
+def cancel_on_sigint(token: CancelToken) -> Iterator[CancelToken]:
+    """
+    Makes the first Ctrl-C cancel the token, so the run stops at the next safe point. A second Ctrl-C
+    raises KeyboardInterrupt as usual. Only works on the main thread; elsewhere the handler is left alone.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield token
+        return
+
+    def interrupt(signum, frame):
+        if token.cancelled:
+            raise KeyboardInterrupt
+        token.cancel(REASON_INTERRUPTED)
+
+    previous = signal.signal(signal.SIGINT, interrupt)
+    try:
+        yield token
+    finally:
+        signal.signal(signal.SIGINT, previous)
@@ -3,12 +3,31 @@ GPT Worker Command Line Interface
 """
 import os
 import sys
+import time
 import json
 import click
-from typing import Optional
+from typing import Optional, Tuple
 
-from gpt_worker.constants import DEFAULT_MODEL, DEFAULT_WORKSPACE_DIR, GPT_WORKER_DIR, PLAN_FILE, STATE_SUMMARY_FILE
+from gpt_worker.constants import BATCH_POLL_INTERVAL, DEFAULT_MODEL, DEFAULT_WORKSPACE_DIR, ENDPOINTS_FILE, EXIT_CODE_INTERRUPTED, EXIT_CODE_TIMEOUT, GPT_WORKER_DIR, PLAN_FILE, PROFILE_FOLDED_FILE, PROFILE_STATS_FILE, STATE_SUMMARY_FILE, DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT, SERVER_MAX_JOBS, STAGNATION_WINDOW, TASKLIST_FRONTIER, TASKQUEUE_DEFAULT_QUEUE, TASKQUEUE_FILE, TASKQUEUE_LEASE_SECONDS
 from gpt_worker.agents import DataHolder, Orchestrator
+from gpt_worker.approval import ApprovalPolicy, unattended_approver
+from gpt_worker.batch import BatchPlanner
+from gpt_worker.cancellation import REASON_INTERRUPTED, CancelledError, CancelToken, cancel_on_sigint
+from gpt_worker.codec import iter_json_array
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.endpoints import EndpointPool, format_endpoint_summary
+from gpt_worker.locking import WorkspaceLock
+from gpt_worker.prefetch import read_cache
+from gpt_worker.profiler import format_profile_summary, profiler
+from gpt_worker.prompts import TaskListView
+from gpt_worker.routing import RoutingPolicy
+from gpt_worker.sandbox import SandboxLimits
+from gpt_worker.taskqueue import QueueWorker, SQLiteBroker, collect_results, publish_plan
+from gpt_worker.telemetry import format_usage_summary, format_route_summary, per_task_metrics
+from gpt_worker.summary import SummaryStore
+from gpt_worker.server import JobManager, RemoteClient, ServerError, create_server, token_file, write_token
+from gpt_worker.watcher import watch_workspace
+from gpt_worker.wire import decode_tool_result
 
 def setup_workspace(directory: str) -> None:
     """Setup and validate workspace directory"""
@@ -24,70 +43,383 @@ def cli(ctx, verbose):
     ctx.ensure_object(dict)
     ctx.obj["verbose"] = verbose
 
+def echo_message(ctx, message: dict) -> None:
+    """Print one agent message"""
+    click.echo("------")
+    if ctx.obj["verbose"]:
+        click.echo(f"role: {message['role']}")
+    
+    if message["role"] == "tool":
+        content = decode_tool_result(message["content"])
+        success = content.get("success", False)
+        click.echo(f"Tool execution: {'success' if success else 'failure'}")
+        if not success and ctx.obj["verbose"]:
+            click.echo(f"Error: {content.get('content', 'Unknown error')}")
+    else:
+        if "content" in message:
+            click.echo("Agent:")
+            click.echo(message["content"])
+        
+        if "tool_calls" in message:
+            click.echo("tool_calls:")
+            for tool_call in message["tool_calls"]:
+                click.echo(tool_call["function"])
+
 @cli.command()
 @click.argument('order', required=False)
 @click.option('--model', '-m', default=DEFAULT_MODEL, help='LLM model to use')
 @click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory')
+@click.option('--remote', default=None, help='URL of a gptw serve daemon to run the job on (e.g. http://127.0.0.1:8765)')
+@click.option('--carry-over', is_flag=True, help='Continue Worker iterations from a compacted summary instead of restarting cold')
+@click.option('--stagnation-window', default=STAGNATION_WINDOW, type=int, help='Iterations without progress before the Worker stops')
+@click.option('--token-budget', default=None, type=int, help='Maximum number of tokens the Worker may use')
+@click.option('--time-budget', default=None, type=float, help='Maximum number of seconds the Worker may run')
+@click.option('--timeout', default=None, type=float, help='Cancel the whole run after this many seconds, even in the middle of a request or command')
+@click.option('--route', 'routes', multiple=True, help='Model for a route as route=model (routes: planner, worker_explore, worker_edit)')
+@click.option('--fallback-model', default=None, help='Model to retry with when a routed model fails (default: --model)')
+@click.option('--watch/--no-watch', default=True, help='Watch the workspace for changes instead of rescanning it (default: on)')
+@click.option('--plan-view', type=click.Choice(['compact', 'full']), default='compact', help='How the task list is shown to the agents')
+@click.option('--plan-frontier', default=TASKLIST_FRONTIER, type=int, help='Incomplete tasks shown in full detail with --plan-view compact')
+@click.option('--sandbox/--no-sandbox', default=True, help='Run ScriptExecutor commands with lower priority and CPU time and file size limits (default: on)')
+@click.option('--sandbox-memory', default=None, type=int, help='Limit the address space of each ScriptExecutor process to this many MiB (default: no limit)')
+@click.option('--sandbox-max-processes', default=None, type=int, help='Limit the processes of the user while a ScriptExecutor command runs (default: no limit)')
+@click.option('--unshare', is_flag=True, help='Also run ScriptExecutor commands in new user, network, PID and mount namespaces')
+@click.option('--unattended', is_flag=True, help='Never prompt: refuse ScriptExecutor commands that need approval')
+@click.option('--endpoints', 'endpoints_file', default=None, help=f'Endpoints file to spread requests over (default: {ENDPOINTS_FILE})')
+@click.option('--hedge', is_flag=True, help='Send a second request to the next endpoint when the first is slower than its p95 latency')
+@click.option('--replan', is_flag=True, help='Run the Planner even when nothing changed since the previous run')
+@click.option('--pipeline', is_flag=True, help='Start the Worker as soon as the Planner has saved a plan, while planning continues')
+@click.option('--profile', is_flag=True, help=f'Time the phases of the run and print them at the end; stacks are written to {PROFILE_FOLDED_FILE}')
+@click.option('--profile-cprofile', is_flag=True, help=f'Also run cProfile and write its stats to {PROFILE_STATS_FILE} (implies --profile)')
+@click.option('--profile-memory', is_flag=True, help='Also trace memory allocations with tracemalloc (implies --profile)')
 @click.pass_context
-def run(ctx, order: Optional[str], model: str, directory: str):
+def run(ctx, order: Optional[str], model: str, directory: str, remote: Optional[str], carry_over: bool,
+        stagnation_window: int, token_budget: Optional[int], time_budget: Optional[float], timeout: Optional[float],
+        routes: Tuple[str, ...], fallback_model: Optional[str], watch: bool, plan_view: str, plan_frontier: int,
+        sandbox: bool, sandbox_memory: Optional[int], sandbox_max_processes: Optional[int], unshare: bool, unattended: bool,
+        endpoints_file: Optional[str], hedge: bool, replan: bool, pipeline: bool, profile: bool, profile_cprofile: bool, profile_memory: bool):
     """Execute tasks"""
+    watcher = None
+    cancel = None
+    profiling = (profile or profile_cprofile or profile_memory) and not remote
     try:
         setup_workspace(directory)
         
-        # Load task list and state summary
-        tasklist = []
-        state_summary = ""
-
-        # Load task list
-        plan_dir = os.path.join(directory, PLAN_FILE)
-        if os.path.exists(plan_dir):
-            with open(plan_dir, encoding="utf-8") as f:
-                tasklist = json.loads(f.read())
-            if ctx.obj["verbose"]:
+        if remote:
+            run_remote(ctx, remote, order if order else "", model, directory,
+                       sandbox_memory=sandbox_memory, sandbox_max_processes=sandbox_max_processes)
+            return
+        
+        dataholder = DataHolder.from_workspace(directory)
+        if ctx.obj["verbose"]:
+            plan_dir = os.path.join(directory, PLAN_FILE)
+            if os.path.exists(plan_dir):
                 click.echo(f"Loaded task list: {plan_dir}")
-
-        # Load state summary
-        summary_dir = os.path.join(directory, STATE_SUMMARY_FILE)
-        if os.path.exists(summary_dir):
-            with open(summary_dir, encoding="utf-8") as f:
-                state_summary = f.read()
-            if ctx.obj["verbose"]:
+            summary_dir = os.path.join(directory, STATE_SUMMARY_FILE)
+            if os.path.exists(summary_dir):
                 click.echo(f"Loaded state summary: {summary_dir}")
 
-        dataholder = DataHolder(
-            tasklist=tasklist,
-            state_summary=state_summary,
-            workspace_dir=directory
-        )
+        pool = EndpointPool.load(endpoints_file or os.path.expanduser(ENDPOINTS_FILE))
+        if endpoints_file and pool is None:
+            raise FileNotFoundError(f"Endpoints file not found: {endpoints_file}")
+        if pool is not None:
+            pool.hedge = pool.hedge or hedge
+            OpenAIConnector.set_client(pool)
+
+        routing = RoutingPolicy.load(directory, routes)
+        if fallback_model:
+            routing.fallback_model = fallback_model
+
+        if watch:
+            watcher = watch_workspace(dataholder)
+        if sandbox:
+            dataholder.sandbox = SandboxLimits.from_options(sandbox_memory, sandbox_max_processes, unshare=unshare)
+        # Loaded before the agents run, so they cannot widen their own permissions by editing the rules
+        dataholder.approval_policy = ApprovalPolicy.load(directory)
+        if unattended:
+            dataholder.approver = unattended_approver
+
         orchestrator = Orchestrator(dataholder=dataholder)
+        if profiling:
+            profiler.start(cprofile=profile_cprofile, memory=profile_memory)
         
         if ctx.obj["verbose"]:
             click.echo(f"Model: {model}")
+            for route, route_model in routing.routes.items():
+                click.echo(f"Route: {route} -> {route_model}")
             click.echo(f"Directory: {directory}")
+            if watcher is not None:
+                click.echo(f"Watching workspace: {watcher.backend}")
+            if pool is not None:
+                click.echo(f"Endpoints: {', '.join(endpoint.name for endpoint in pool.endpoints)}" + (" (hedged)" if pool.hedge else ""))
         
-        for message in orchestrator.run(order=order if order else "", model=model):
+        done_before = len(dataholder.find_task({"done_flg": True}))
+        # Ctrl-C and --timeout stop the run at the next safe point instead of killing it mid-write
+        cancel = CancelToken(timeout)
+        cancelled = None
+        messages = orchestrator.run(
+            order=order if order else "",
+            model=model,
+            carry_over=carry_over,
+            stagnation_window=stagnation_window,
+            token_budget=token_budget,
+            time_budget=time_budget,
+            routing=routing,
+            tasklist_view=TaskListView.full() if plan_view == "full" else TaskListView(frontier=plan_frontier),
+            replan=replan,
+            pipeline=pipeline,
+            cancel=cancel,
+        )
+        try:
+            with cancel_on_sigint(cancel):
+                for message in messages:
+                    echo_message(ctx, message)
+        except CancelledError as e:
+            cancelled = e
+        
+        if ctx.obj["verbose"]:
             click.echo("------")
-            if ctx.obj["verbose"]:
-                click.echo(f"role: {message['role']}")
-            
-            if message["role"] == "tool":
-                content = json.loads(message["content"])
-                success = content.get("success", False)
-                click.echo(f"Tool execution: {'success' if success else 'failure'}")
-                if not success and ctx.obj["verbose"]:
-                    click.echo(f"Error: {content.get('content', 'Unknown error')}")
-            else:
-                if "content" in message:
-                    click.echo("Agent:")
-                    click.echo(message["content"])
-                
-                if "tool_calls" in message:
-                    click.echo("tool_calls:")
-                    click.echo(message["tool_calls"]["function"])
+            click.echo(f"Usage: {format_usage_summary(dataholder.usage_log)}")
+            click.echo(format_route_summary(dataholder.usage_log))
+            if pool is not None:
+                click.echo(format_endpoint_summary(pool))
+            cache = read_cache.stats()
+            click.echo(
+                f"Read cache: {cache['hits']}/{cache['reads']} reads served from memory ({cache['hit_rate']:.0%}), "
+                f"prefetch hits: {cache['prefetch_hits']}/{cache['prefetched']} ({cache['prefetch_hit_rate']:.0%})"
+            )
+            metrics = per_task_metrics(dataholder.usage_log, len(dataholder.find_task({"done_flg": True})) - done_before)
+            if metrics["completed_tasks"]:
+                click.echo(
+                    f"Per completed task ({metrics['completed_tasks']} tasks): "
+                    f"{metrics['tokens_per_task']:.0f} tokens, {metrics['tool_calls_per_task']:.1f} tool calls"
+                )
+
+        if cancelled is not None:
+            click.echo(f"{cancelled}; progress saved before that is kept", err=True)
+            sys.exit(EXIT_CODE_INTERRUPTED if cancelled.reason == REASON_INTERRUPTED else EXIT_CODE_TIMEOUT)
                 
     except Exception as e:
         click.echo(f"Error: {str(e)}", err=True)
         sys.exit(1)
+    finally:
+        if cancel is not None:
+            cancel.close()
+        if watcher is not None:
+            watcher.stop()
+        if profiling and profiler.enabled:
+            echo_profile(directory)
+
+def echo_profile(directory: str) -> None:
+    """Stop the profiler, write its files and print the phase summary"""
+    profiler.stop()
+    folded_path = os.path.join(directory, PROFILE_FOLDED_FILE)
+    profiler.write_collapsed(folded_path)
+    click.echo("------")
+    click.echo(format_profile_summary(profiler))
+    click.echo(f"Collapsed stacks (flamegraph.pl, speedscope): {folded_path}")
+    if profiler.cprofile is not None:
+        stats_path = os.path.join(directory, PROFILE_STATS_FILE)
+        profiler.write_cprofile(stats_path)
+        click.echo(f"cProfile stats: {stats_path}")
+
+def run_remote(ctx, url: str, order: str, model: str, directory: str, **options) -> None:
+    """Submit a job to a gptw serve daemon and stream its messages"""
+    client = RemoteClient(url)
+    job = client.submit(order=order, model=model, directory=os.path.abspath(directory), **options)
+    if ctx.obj["verbose"]:
+        click.echo(f"Submitted job {job['job_id']} to {url}")
+    
+    try:
+        for message in client.events(job["job_id"]):
+            echo_message(ctx, message)
+    except KeyboardInterrupt:
+        # The job would otherwise keep running on the daemon
+        client.cancel(job["job_id"])
+        raise
+    
+    job = client.status(job["job_id"])
+    if job["status"] == "failed":
+        raise ServerError(job["error"])
+
+@cli.command(name='plan-batch')
+@click.argument('directories', nargs=-1, required=True)
+@click.option('--order', default='', help='Instruction given to the Planner of every workspace')
+@click.option('--model', '-m', default=DEFAULT_MODEL, help='LLM model to use')
+@click.option('--poll-interval', default=BATCH_POLL_INTERVAL, type=float, help='Seconds between batch status checks')
+@click.option('--batch-file', default=None, help='Also write the JSONL batch input to this file')
+@click.option('--batch-id', default=None, help='Pick up a batch submitted earlier for the same directories instead of submitting a new one')
+@click.pass_context
+def plan_batch(ctx, directories: Tuple[str, ...], order: str, model: str, poll_interval: float,
+               batch_file: Optional[str], batch_id: Optional[str]):
+    """Plan many workspaces with their first Planner requests sent through the Batch API"""
+    try:
+        for directory in directories:
+            setup_workspace(directory)
+        planner = BatchPlanner(directories, order=order, model=model, poll_interval=poll_interval)
+        current = None
+        for directory, message in planner.run(batch_id=batch_id, batch_file=batch_file):
+            if directory != current:
+                click.echo(f"=== {directory} ===")
+                current = directory
+            echo_message(ctx, message)
+        click.echo(f"Batch: {planner.batch_id}")
+
+        if ctx.obj["verbose"]:
+            usage_log = [record for dataholder in planner.dataholders.values() for record in dataholder.usage_log]
+            click.echo(f"Usage: {format_usage_summary(usage_log)}")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.group()
+def queue():
+    """Run the tasks of a plan on several hosts through a shared task queue"""
+    pass
+
+def open_broker(directory: str, db: Optional[str]) -> SQLiteBroker:
+    return SQLiteBroker(db or os.path.join(directory, TASKQUEUE_FILE))
+
+@queue.command(name='publish')
+@click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory')
+@click.option('--db', default=None, help=f'Queue database shared by the workers (default: {TASKQUEUE_FILE} in the working directory)')
+@click.option('--queue', 'queue_name', default=TASKQUEUE_DEFAULT_QUEUE, help='Queue name')
+def queue_publish(directory: str, db: Optional[str], queue_name: str):
+    """Publish the incomplete tasks of the plan"""
+    try:
+        setup_workspace(directory)
+        added = publish_plan(open_broker(directory, db), DataHolder.from_workspace(directory), queue_name)
+        click.echo(f"Published {added} tasks to queue {queue_name}")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@queue.command(name='work')
+@click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory (a checkout of the workspace on this host)')
+@click.option('--db', default=None, help=f'Queue database shared by the workers (default: {TASKQUEUE_FILE} in the working directory)')
+@click.option('--queue', 'queue_name', default=TASKQUEUE_DEFAULT_QUEUE, help='Queue name')
+@click.option('--model', '-m', default=DEFAULT_MODEL, help='LLM model to use')
+@click.option('--worker-id', default=None, help='Name of this worker in the queue (default: host, pid and a random suffix)')
+@click.option('--max-tasks', default=None, type=int, help='Stop after this many tasks')
+@click.option('--wait', is_flag=True, help='Wait for new tasks instead of stopping when the queue is empty')
+@click.option('--lease', 'lease_seconds', default=TASKQUEUE_LEASE_SECONDS, type=float, help='Seconds a task is leased for between heartbeats')
+@click.option('--sandbox/--no-sandbox', default=True, help='Run ScriptExecutor commands with lower priority and CPU time and file size limits (default: on)')
+@click.option('--sandbox-memory', default=None, type=int, help='Limit the address space of each ScriptExecutor process to this many MiB (default: no limit)')
+@click.option('--sandbox-max-processes', default=None, type=int, help='Limit the processes of the user while a ScriptExecutor command runs (default: no limit)')
+@click.option('--unattended', is_flag=True, help='Never prompt: refuse ScriptExecutor commands that need approval')
+@click.pass_context
+def queue_work(ctx, directory: str, db: Optional[str], queue_name: str, model: str, worker_id: Optional[str],
+               max_tasks: Optional[int], wait: bool, lease_seconds: float, sandbox: bool, sandbox_memory: Optional[int],
+               sandbox_max_processes: Optional[int], unattended: bool):
+    """Lease tasks from the queue and run a Worker on each of them"""
+    try:
+        setup_workspace(directory)
+        policy = ApprovalPolicy.load(directory)
+
+        def prepare(dataholder: DataHolder) -> None:
+            if sandbox:
+                dataholder.sandbox = SandboxLimits.from_options(sandbox_memory, sandbox_max_processes)
+            dataholder.approval_policy = policy
+            if unattended:
+                dataholder.approver = unattended_approver
+
+        worker = QueueWorker(open_broker(directory, db), directory, queue=queue_name, worker_id=worker_id,
+                             lease_seconds=lease_seconds, heartbeat_interval=lease_seconds / 5, prepare=prepare, model=model)
+        current = None
+        for task_id, message in worker.run(max_tasks=max_tasks, wait=wait):
+            if task_id != current:
+                click.echo(f"=== Task {task_id} ({worker.worker_id}) ===")
+                current = task_id
+            echo_message(ctx, message)
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@queue.command(name='status')
+@click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory')
+@click.option('--db', default=None, help=f'Queue database shared by the workers (default: {TASKQUEUE_FILE} in the working directory)')
+@click.option('--queue', 'queue_name', default=TASKQUEUE_DEFAULT_QUEUE, help='Queue name')
+def queue_status(directory: str, db: Optional[str], queue_name: str):
+    """Display the tasks of the queue"""
+    entries = open_broker(directory, db).entries(queue_name)
+    if not entries:
+        click.echo(f"Queue {queue_name} is empty")
+    for entry in entries:
+        worker = f" by {entry['worker_id']}" if entry["worker_id"] else ""
+        click.echo(f"{entry['task_id']}: {entry['task'].get('name')} [{entry['status']}{worker}, {entry['attempts']} attempts]")
+
+@queue.command(name='collect')
+@click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory')
+@click.option('--db', default=None, help=f'Queue database shared by the workers (default: {TASKQUEUE_FILE} in the working directory)')
+@click.option('--queue', 'queue_name', default=TASKQUEUE_DEFAULT_QUEUE, help='Queue name')
+def queue_collect(directory: str, db: Optional[str], queue_name: str):
+    """Mark the tasks completed by the workers as done in the plan"""
+    try:
+        setup_workspace(directory)
+        updated = collect_results(open_broker(directory, db), DataHolder.from_workspace(directory), queue_name)
+        click.echo(f"Marked {updated} tasks as done in {PLAN_FILE}")
+    except Exception as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.argument('url')
+@click.option('--approve', 'approve_ids', multiple=True, help='Approve the request with this id')
+@click.option('--deny', 'deny_ids', multiple=True, help='Deny the request with this id')
+def approvals(url: str, approve_ids: Tuple[str, ...], deny_ids: Tuple[str, ...]):
+    """List or answer commands waiting for approval on a gptw serve daemon (token from GPTW_SERVER_TOKEN or the daemon's token file)"""
+    client = RemoteClient(url)
+    try:
+        for request_id, approved in [(i, True) for i in approve_ids] + [(i, False) for i in deny_ids]:
+            request = client.resolve_approval(request_id, approved)
+            click.echo(f"{request['request_id']}: {request['status']}")
+        if approve_ids or deny_ids:
+            return
+
+        pending = client.approvals()
+        if not pending:
+            click.echo("No commands waiting for approval")
+        for request in pending:
+            click.echo(f"{request['request_id']} ({request['directory']}): {request['reason']}")
+            click.echo(f"  {request['script']}")
+    except ServerError as e:
+        click.echo(f"Error: {str(e)}", err=True)
+        sys.exit(1)
+
+@cli.command()
+@click.option('--host', default=DEFAULT_SERVER_HOST, help='Address to bind')
+@click.option('--port', '-p', default=DEFAULT_SERVER_PORT, type=int, help='Port to listen on')
+@click.option('--max-jobs', default=SERVER_MAX_JOBS, type=int, help='Maximum number of concurrently running jobs')
+@click.option('--endpoints', 'endpoints_file', default=None, help='Endpoints file to spread the requests of all jobs over')
+@click.option('--hedge', is_flag=True, help='Send a second request to the next endpoint when the first is slower than its p95 latency')
+@click.pass_context
+def serve(ctx, host: str, port: int, max_jobs: int, endpoints_file: Optional[str], hedge: bool):
+    """Run the gptw daemon with an HTTP job API"""
+    try:
+        if endpoints_file:
+            pool = EndpointPool.load(endpoints_file)
+            if pool is None:
+                raise FileNotFoundError(f"Endpoints file not found: {endpoints_file}")
+            pool.hedge = pool.hedge or hedge
+            OpenAIConnector.set_client(pool)
+        server = create_server(host=host, port=port, manager=JobManager(max_jobs=max_jobs))
+        token_path = token_file(server.server_address[1])
+        write_token(token_path, server.token)
+    except Exception as e:
+        click.echo(f"Error: Failed to start server: {str(e)}", err=True)
+        sys.exit(1)
+    
+    click.echo(f"Serving gptw on http://{host}:{server.server_address[1]}")
+    click.echo(f"Token for clients: {token_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("Shutting down")
+    finally:
+        server.server_close()
+        server.manager.shutdown()
+        if os.path.exists(token_path):
+            os.remove(token_path)
 
 @cli.command()
 @click.argument('directory', required=False, default=DEFAULT_WORKSPACE_DIR)
@@ -141,16 +473,20 @@ def list(directory: str):
             click.echo("Task list does not exist")
             return
 
-        with open(plan_path, encoding="utf-8") as f:
-            tasks = json.loads(f.read())
+        # Read-only: opened under the shared workspace lock and never written, so it can run next to gptw run.
+        # Writers replace the file, so the open file stays the same plan after the lock is released,
+        # and it is parsed one task at a time, so large plans are listed without loading them whole
+        with WorkspaceLock.for_workspace(directory).shared():
+            f = open(plan_path, encoding="utf-8")
+        with f:
+            empty = True
+            for i, task in enumerate(iter_json_array(f), 1):
+                empty = False
+                click.echo(f"\nTask {i}:")
+                click.echo(json.dumps(task, ensure_ascii=False, indent=2))
             
-        if not tasks:
+        if empty:
             click.echo("Task list is empty")
-            return
-            
-        for i, task in enumerate(tasks, 1):
-            click.echo(f"\nTask {i}:")
-            click.echo(json.dumps(task, ensure_ascii=False, indent=2))
         
     except Exception as e:
         click.echo(f"Error: Failed to display task list: {str(e)}", err=True)
@@ -158,18 +494,25 @@ def list(directory: str):
 
 @cli.command()
 @click.option('--directory', '-d', default=DEFAULT_WORKSPACE_DIR, help='Working directory')
-def status(directory: str):
+@click.option('--history', default=0, type=int, help='Also display this many past summary updates')
+def status(directory: str, history: int):
     """Display current state summary"""
     try:
         setup_workspace(directory)
         
-        summary_path = os.path.join(directory, STATE_SUMMARY_FILE)
-        if not os.path.exists(summary_path):
+        # Read-only, like list
+        with WorkspaceLock.for_workspace(directory).shared():
+            records = SummaryStore(directory).history()[-history:] if history > 0 else []
+            summary_path = os.path.join(directory, STATE_SUMMARY_FILE)
+            summary = DataHolder.from_workspace(directory, read_only=True).state_summary if os.path.exists(summary_path) else None
+
+        for record in records:
+            click.echo(f"\n=== {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['time']))} ===\n")
+            click.echo(record["summary"])
+        
+        if summary is None:
             click.echo("State summary does not exist")
             return
-
-        with open(summary_path, encoding="utf-8") as f:
-            summary = f.read()
             
         if not summary:
             click.echo("State summary is empty")
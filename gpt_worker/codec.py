@@ -0,0 +1,177 @@
+"""
+JSON codec used on the hot paths: plan.json, tool call arguments and tool results.
+
+The backend is orjson or msgspec when one of them is installed (`pip install gpt-worker[fast-json]`),
+and the standard library otherwise. GPTW_JSON_CODEC=orjson|msgspec|json selects one explicitly.
+Every backend writes the same compact JSON (no spaces, non-ASCII characters as they are), so files
+written by one are read by the others, and every backend raises json.JSONDecodeError on invalid input.
+
+iter_json_array parses a top-level JSON array one element at a time, so a very large plan can be
+listed without holding the whole file and the whole list in memory at once.
+"""
+import json
+import logging
+import os
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+JSON_CODEC_ENV = "GPTW_JSON_CODEC"
+STREAM_CHUNK_SIZE = 1 << 16
+
+class JSONBackend:
+    """
+    loads/dumps of one JSON library.
+    """
+
+    def __init__(self, name: str, loads: Callable[[Union[str, bytes]], Any], dumps: Callable[[Any], str]):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+def _stdlib_backend() -> JSONBackend:
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    return JSONBackend("json", json.loads, encoder.encode)
+
+def _orjson_backend() -> JSONBackend:
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+    return JSONBackend("orjson", orjson.loads, dumps)
+
+def _msgspec_backend() -> JSONBackend:
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def loads(data: Union[str, bytes]) -> Any:
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), data if isinstance(data, str) else data.decode("utf-8", "replace"), 0)
+
+    def dumps(obj: Any) -> str:
+        return encoder.encode(obj).decode("utf-8")
+
+    return JSONBackend("msgspec", loads, dumps)
+
+BACKENDS: Dict[str, Callable[[], JSONBackend]] = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": _stdlib_backend,
+}
+
+def available_backends() -> List[str]:
+    """Names of the backends that can be loaded, fastest first"""
+    names = []
+    for name, factory in BACKENDS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def _select(name: Optional[str] = None) -> JSONBackend:
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown JSON codec: {name} (choose from {', '.join(BACKENDS)})")
+        return BACKENDS[name]()
+    for factory in BACKENDS.values():
+        try:
+            return factory()
+        except ImportError:
+            continue
+    return _stdlib_backend()
+
+_backend = _select(os.environ.get(JSON_CODEC_ENV) or None)
+logger.debug(f"JSON codec: {_backend.name}")
+
+def use(name: Optional[str] = None) -> str:
+    """
+    Switches the backend (None picks the fastest installed one). Returns the name of the backend in use.
+
+    Raises:
+        ImportError: When the library of the backend is not installed
+        ValueError: When the backend is unknown
+    """
+    global _backend
+    _backend = _select(name)
+    return _backend.name
+
+def backend_name() -> str:
+    return _backend.name
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Parses JSON text or UTF-8 bytes.
+
+    Raises:
+        json.JSONDecodeError: When the input is not valid JSON
+    """
+    return _backend.loads(data)
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text of obj"""
+    return _backend.dumps(obj)
+
+def iter_json_array(f: IO[str], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Yields the elements of the JSON array in a text file one at a time, reading it in chunks.
+
+    Raises:
+        json.JSONDecodeError: When the file is not a JSON array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    index = 0
+    started = False
+    empty = True
+    after_value = False
+    eof = False
+
+    while True:
+        while index < len(buffer) and buffer[index] in " \t\r\n":
+            index += 1
+        if index < len(buffer):
+            char = buffer[index]
+            if not started:
+                if char != "[":
+                    raise json.JSONDecodeError("Expecting '['", buffer, index)
+                index += 1
+                started = True
+                continue
+            if after_value:
+                if char == "]":
+                    return
+                if char != ",":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, index)
+                index += 1
+                after_value = False
+                continue
+            if char == "]" and empty:
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, index)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number cut by the end of the buffer ("12" of "12.5") continues in the next chunk
+                cut = end == len(buffer) or (isinstance(element, (int, float)) and buffer[end] in "0123456789.eE+-")
+                if eof or not cut:
+                    yield element
+                    index = end
+                    empty = False
+                    after_value = True
+                    continue
+        if eof:
+            raise json.JSONDecodeError("Unterminated array", buffer, index)
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[index:] + chunk
+        index = 0
@@ -1,11 +1,21 @@
 from abc import abstractmethod
 import json
 import logging
-from typing import List, Dict, Type, Optional
+import threading
+import time
+from typing import Any, List, Dict, Type, Optional, Union
 import openai
 from openai import OpenAI
 from openai import APIError, RateLimitError
+from gpt_worker import codec
+from gpt_worker.cancellation import CancelledError, CancelToken
 from gpt_worker.dataholder import DataHolder
+from gpt_worker.messages import MessageStore, to_api, tool_call_dict
+from gpt_worker.prefetch import prefetcher
+from gpt_worker.profiler import PHASE_API, PHASE_JSON, PHASE_SCHEMA, TOOL_PHASE_PREFIX, profiler
+from gpt_worker.routing import RoutingPolicy
+from gpt_worker.telemetry import usage_from_response, cached_ratio
+from gpt_worker.wire import encode_tool_result
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -54,24 +64,127 @@ class OpenAIConnector(Connector):
     MAX_RETRIES = 3
     RETRY_DELAY = 20  # seconds
 
+    # Shared across calls (and across jobs in `gptw serve`) so connections and schemas stay warm
+    _client: Optional[OpenAI] = None
+    _tool_schemas: Dict[Type, Dict] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> OpenAI:
+        """
+        Returns the shared OpenAI client, creating it on first use.
+        """
+        with cls._lock:
+            if cls._client is None:
+                cls._client = OpenAI()
+            return cls._client
+
+    @classmethod
+    def set_client(cls, client) -> None:
+        """
+        Replaces the shared client, e.g. with an EndpointPool spreading requests over several endpoints.
+        """
+        with cls._lock:
+            cls._client = client
+
+    @classmethod
+    def get_tool_schemas(cls, tools: List[Type]) -> List[Dict]:
+        """
+        Returns function tool schemas for the given tools. Schemas are generated once per tool class and reused.
+        """
+        schemas = []
+        for tool in tools:
+            schema = cls._tool_schemas.get(tool)
+            if schema is None:
+                with profiler.phase(PHASE_SCHEMA):
+                    schema = openai.pydantic_function_tool(tool)
+                cls._tool_schemas[tool] = schema
+            schemas.append(schema)
+        return schemas
+
+    @staticmethod
+    def _create(llm, cancel: CancelToken, **kwargs) -> Any:
+        """
+        Sends one chat completion request on a separate thread and waits for it or for the token, whichever
+        comes first. A cancelled request is left to finish or time out in the background; its result is dropped.
+        """
+        remaining = cancel.remaining()
+        if remaining is not None:
+            kwargs["timeout"] = max(remaining, 1.0)
+        outcome: Dict[str, Any] = {}
+        finished = threading.Event()
+
+        def send() -> None:
+            try:
+                outcome["response"] = llm.chat.completions.create(**kwargs)
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                finished.set()
+
+        threading.Thread(target=send, name="gptw-request", daemon=True).start()
+        unregister = cancel.on_cancel(finished.set)
+        try:
+            finished.wait()
+        finally:
+            unregister()
+        if "response" in outcome:
+            return outcome["response"]
+        if "error" in outcome:
+            raise outcome["error"]
+        raise CancelledError(cancel.reason)
+
     @classmethod
-    def CreateResponse(cls, messages: List[Dict], tools: List[Type], dataholder: DataHolder, model: str):
+    def CreateResponse(cls, messages: Union[MessageStore, List[Dict]], tools: List[Type], dataholder: DataHolder, model: str,
+                       routing: Optional[RoutingPolicy] = None, role: str = "worker", response: Optional[Any] = None,
+                       cancel: Optional[CancelToken] = None):
         """
         Communicates with the OpenAI API to generate a response based on input messages.
         Handles retries on rate limits and manages tool execution for enhanced task processing.
+        With a routing policy, the model is picked per turn from the agent role and the conversation,
+        and a failing model is retried once with the fallback model.
+        A response already obtained for `messages` elsewhere (e.g. from the Batch API) can be passed
+        to continue the tool loop from it; its usage is recorded by whoever obtained it.
+        Messages can be kept in a MessageStore, which is turned into API format only when a request is sent.
+        With a cancel token, the request in flight is abandoned and CancelledError raised as soon as the token
+        is cancelled; requests are given the time left until its deadline, and tools receive it as `cancel`.
         """
-        llm = OpenAI()
+        cancel = cancel if cancel is not None else CancelToken()
+        llm = cls.get_client()
         retry_count = 0
+        route, turn_model = routing.select(role, messages, model) if routing else ("default", model)
+        fallback_used = False
+
+        # Warm the read cache with files the model is likely to ask for while it is thinking
+        prefetcher.prefetch_for(dataholder, messages)
 
         while retry_count < cls.MAX_RETRIES:
             try:
-                response = llm.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    tools=[openai.pydantic_function_tool(tool) for tool in tools]
-                )
+                cancel.check()
+                if response is None:
+                    schemas = cls.get_tool_schemas(tools)
+                    started = time.perf_counter()
+                    with profiler.phase(PHASE_API):
+                        response = cls._create(
+                            llm,
+                            cancel,
+                            model=turn_model,
+                            messages=to_api(messages),
+                            tools=schemas
+                        )
+                    latency = time.perf_counter() - started
 
-                logger.debug(f"API Response: {response.choices[0]}")
+                    usage = usage_from_response(response, turn_model, route=route, latency=latency)
+                    dataholder.usage_log.append(usage)
+                    logger.info(
+                        f"Usage [{route}: {turn_model}]: prompt tokens {usage['prompt_tokens']} "
+                        f"(cached {usage['cached_tokens']}, {cached_ratio(usage):.0%}), "
+                        f"completion tokens {usage['completion_tokens']}, {latency:.1f}s"
+                    )
+                else:
+                    logger.info(f"Continuing [{route}] from a given response")
+
+                logger.debug(f"API Response: {response.choices[0] if response.choices else None}")
 
                 if not response.choices:
                     raise APIConnectionError("No response choices returned from API")
@@ -88,31 +201,38 @@ class OpenAIConnector(Connector):
                     tool_calls = response.choices[0].message.tool_calls
                     message = {
                         "role": response.choices[0].message.role,
-                        "tool_calls": [vars(tool_call) for tool_call in tool_calls]
+                        "tool_calls": [tool_call_dict(tool_call) for tool_call in tool_calls]
                     }
                     messages.append(message)
                     yield message
 
                     for tool_call in tool_calls:
                         try:
-                            arguments = json.loads(tool_call.function.arguments)
-                            arguments.update({"dataholder": dataholder})
+                            with profiler.phase(PHASE_JSON):
+                                arguments = codec.loads(tool_call.function.arguments)
+                            arguments.update({"dataholder": dataholder, "cancel": cancel})
 
                             tool = next((t for t in tools if t.__name__ == tool_call.function.name), None)
                             if not tool:
                                 raise ToolExecutionError(f"Tool not found: {tool_call.function.name}")
 
-                            content = tool.run(arguments)
+                            with profiler.phase(TOOL_PHASE_PREFIX + tool.__name__):
+                                content = tool.run(arguments)
                             if not content.get("success", False):
                                 logger.error(f"Tool execution failed: {content.get('content', 'Unknown error')}")
 
+                            with profiler.phase(PHASE_JSON):
+                                encoded = encode_tool_result(content)
                             message = {
                                 "role": "tool",
-                                "content": json.dumps(content),
+                                "content": encoded,
                                 "tool_call_id": tool_call.id
                             }
                             messages.append(message)
                             yield message
+                            cancel.check()
+                        except CancelledError:
+                            raise
                         except json.JSONDecodeError as e:
                             logger.error(f"Invalid tool arguments: {e}")
                             raise ToolExecutionError(f"Invalid tool arguments: {e}")
@@ -120,23 +240,32 @@ class OpenAIConnector(Connector):
                             logger.error(f"Tool execution error: {e}")
                             raise ToolExecutionError(f"Tool execution failed: {e}")
 
-                    for message in cls.CreateResponse(messages=messages, tools=tools, dataholder=dataholder, model=model):
+                    for message in cls.CreateResponse(messages=messages, tools=tools, dataholder=dataholder, model=model, routing=routing, role=role, cancel=cancel):
                         yield message
                     return  # ツール実行後は再帰呼び出しの結果を返して終了
 
                 return  # 正常終了時はループを抜ける
 
+            except CancelledError:
+                raise
+
             except RateLimitError as e:
                 retry_count += 1
                 if retry_count < cls.MAX_RETRIES:
                     logger.warning(f"Rate limit reached. Retrying in {cls.RETRY_DELAY} seconds...")
-                    import time
-                    time.sleep(cls.RETRY_DELAY)
+                    if cancel.wait(cls.RETRY_DELAY):
+                        raise CancelledError(cancel.reason)
                 else:
                     logger.error("Max retries reached for rate limit")
                     raise APIConnectionError(f"Rate limit exceeded after {cls.MAX_RETRIES} retries")
 
             except APIError as e:
+                fallback = routing.fallback_for(turn_model, model) if routing and not fallback_used else None
+                if fallback:
+                    logger.warning(f"Model {turn_model} failed on route {route} ({e}). Retrying with {fallback}")
+                    turn_model = fallback
+                    fallback_used = True
+                    continue
                 logger.error(f"OpenAI API error: {e}")
                 raise APIConnectionError(f"OpenAI API error: {e}")
 
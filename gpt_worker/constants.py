@@ -10,10 +10,105 @@ GPT_WORKER_DIR = ".gpt_worker"
 # ファイルパス
 PLAN_FILE = os.path.join(GPT_WORKER_DIR, "plan.json")
 STATE_SUMMARY_FILE = os.path.join(GPT_WORKER_DIR, "state_summary.md")
+SUMMARY_HISTORY_FILE = os.path.join(GPT_WORKER_DIR, "summary_history.jsonl")
+ROUTING_FILE = os.path.join(GPT_WORKER_DIR, "routing.json")
+ENDPOINTS_FILE = os.path.join("~", GPT_WORKER_DIR, "endpoints.json")  # in the home directory, as agents can write to the workspace
+FINGERPRINT_FILE = os.path.join(GPT_WORKER_DIR, "fingerprint.json")
+TASKQUEUE_FILE = os.path.join(GPT_WORKER_DIR, "queue.sqlite3")
+LOCK_FILE = os.path.join(GPT_WORKER_DIR, "lock")
+PROFILE_FOLDED_FILE = os.path.join(GPT_WORKER_DIR, "profile.folded")
+PROFILE_STATS_FILE = os.path.join(GPT_WORKER_DIR, "profile.pstats")
+INDEX_DIR = os.path.join(GPT_WORKER_DIR, "index")
 
 # OpenAI設定
 DEFAULT_MODEL = "gpt-4o"
 MAX_ITERATIONS = 10
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "o4-mini": (1.10, 0.275, 4.40),
+}
+STAGNATION_WINDOW = 1  # iterations without progress before a Worker run stops
+CARRY_OVER_MAX_CHARS = 12000  # size of the summary carried between Worker iterations
+TASKLIST_FRONTIER = 3  # incomplete tasks shown with full detail in prompts
+
+# 状態サマリー設定
+SUMMARY_MAX_CHARS = 6000  # size of the whole summary carried in prompts
+SUMMARY_SECTION_MAX_CHARS = 2000  # size of each section
+SUMMARY_MODEL = "gpt-4o-mini"  # model that condenses sections over their size
+SUMMARY_HISTORY_MAX = 100  # past updates kept on disk
 
 # ScriptExecutor設定
 COMMAND_TIMEOUT = 30  # seconds
+
+# キャンセル設定
+EXIT_CODE_INTERRUPTED = 130  # gptw run stopped by Ctrl-C
+EXIT_CODE_TIMEOUT = 124  # gptw run stopped by --timeout
+
+# サンドボックス設定
+SANDBOX_CPU_SECONDS = 60  # CPU time per command
+SANDBOX_MEMORY_BYTES = None  # address space per process; opt-in, as thread stacks reserve far more than they use
+SANDBOX_FILE_SIZE_BYTES = 1024 ** 3  # size of any file written
+SANDBOX_MAX_PROCESSES = None  # processes of the user, counted across the host; opt-in
+SANDBOX_NICE = 10
+
+# 読み込みキャッシュ設定
+READ_CACHE_MAX_BYTES = 32_000_000
+PREFETCH_MAX_FILE_BYTES = 1_000_000  # larger files are not prefetched
+PREFETCH_MAX_FILES = 16  # files prefetched per turn
+
+# ワークスペース監視設定
+WATCH_POLL_INTERVAL = 1.0  # seconds between rescans when inotify is unavailable
+WATCH_MAX_CHANGES = 50  # changed paths listed to the Worker per iteration
+
+# MultiFileReader設定
+MULTI_READ_MAX_BYTES = 60000  # total characters returned to the model
+MULTI_READ_MAX_FILES = 50
+
+# OutlineReader設定
+OUTLINE_MAX_BYTES = 8000  # size of the outlines returned to the model
+
+# CodeSearch設定
+INDEX_MAX_FILE_BYTES = 1_000_000  # larger files are not indexed
+SEARCH_MAX_BYTES = 4000  # size of the results returned to the model
+
+# エンドポイント設定
+ENDPOINT_LATENCY_WINDOW = 100  # latencies kept per endpoint for the p95
+ENDPOINT_FAILURE_THRESHOLD = 3  # consecutive failures before an endpoint is skipped
+ENDPOINT_COOLDOWN = 30.0  # seconds an unhealthy endpoint is skipped
+HEDGE_MIN_SAMPLES = 10  # latencies needed before the hedge delay follows the p95
+HEDGE_INITIAL_DELAY = 10.0  # hedge delay (seconds) until then
+
+# Batch API設定
+BATCH_POLL_INTERVAL = 60.0  # seconds between batch status checks
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_COST_FACTOR = 0.5  # batch requests are billed at half price
+
+# ワークスペースのロック設定
+LOCK_TIMEOUT = 30.0  # seconds to wait for another gptw process to release the workspace
+LOCK_POLL_INTERVAL = 0.05
+
+# タスクキュー設定
+TASKQUEUE_DEFAULT_QUEUE = "default"
+TASKQUEUE_LEASE_SECONDS = 300.0  # a task leased by a worker that stops renewing it is requeued after this
+TASKQUEUE_HEARTBEAT_INTERVAL = 60.0  # seconds between lease renewals
+TASKQUEUE_MAX_ATTEMPTS = 3  # leases per task before it is marked failed
+TASKQUEUE_POLL_INTERVAL = 5.0  # seconds between checks for new tasks with --wait
+
+# サーバー設定
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8765
+SERVER_MAX_JOBS = 4  # concurrently running jobs
+SERVER_JOB_TTL = 3600  # seconds a finished job stays queryable
+SERVER_MAX_FINISHED_JOBS = 100  # finished jobs kept, oldest evicted first
+SERVER_MAX_JOB_EVENTS = 1000  # latest message events kept per job
+SERVER_TOKEN_ENV = "GPTW_SERVER_TOKEN"  # token sent by clients, when not read from the token file
+SERVER_TOKEN_FILE = os.path.join("~", GPT_WORKER_DIR, "server-{port}.token")  # written by gptw serve with mode 0600
+
+# 承認ポリシー設定
+APPROVAL_FILE = os.path.join(GPT_WORKER_DIR, "approval.json")
+APPROVAL_TIMEOUT = 600  # seconds an approval request waits for an answer
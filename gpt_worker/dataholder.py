@@ -1,6 +1,14 @@
 from typing import List, Dict, Optional, Union
+import os
+import copy
+import hashlib
 import logging
+import threading
 from pathlib import Path
+from gpt_worker import codec
+from gpt_worker.constants import PLAN_FILE, STATE_SUMMARY_FILE
+from gpt_worker.locking import WorkspaceLock, write_atomic
+from gpt_worker.profiler import PHASE_PLAN_SAVE, profiler
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +24,14 @@ class InvalidTaskError(DataHolderError):
     """Raised when task data is invalid"""
     pass
 
+class ReadOnlyError(DataHolderError):
+    """Raised when saving a DataHolder opened read-only"""
+    pass
+
+def hash_plan(data: Optional[str]) -> str:
+    """plan.jsonの内容のハッシュ（ファイルがない場合は空文字列）"""
+    return hashlib.sha256(data.encode("utf-8")).hexdigest() if data is not None else ""
+
 class DataHolder:
     """
     タスクリストと状態サマリーを管理するクラス。
@@ -24,6 +40,17 @@ class DataHolder:
         tasklist (List[Dict]): タスクのリスト
         state_summary (str): 現在の状態のサマリー
         workspace_dir (str): ワークスペースディレクトリのパス
+        usage_log (List[Dict]): API呼び出しごとのトークン使用量の記録
+        watcher (Optional[WorkspaceWatcher]): ワークスペースの変更監視（未接続の場合はNone）
+        sandbox (Optional[SandboxLimits]): ScriptExecutorのリソース制限（Noneの場合は制限なし）
+        approval_policy (Optional[ApprovalPolicy]): ScriptExecutorの承認ポリシー（Noneの場合は組み込みのルール）
+        approver (Optional[Callable]): 承認が必要なコマンドの判断者（Noneの場合はコンソールで確認）
+        lock (threading.RLock): タスクリストと状態サマリーの更新を排他するロック（PlannerとWorkerを並行に動かす場合）
+        plan_version (int): タスクリストが保存された回数
+        merge_plans (bool): 保存するタスクリストを既存のタスクリストとマージするか（完了済みのタスクを失わないため）
+        persist_plan (bool): PlanMakerがタスクリストをファイルに保存するか（タスクキューで一部のタスクだけを実行する場合はFalse）
+        read_only (bool): 読み取り専用か（Trueの場合はファイルに保存しない）
+        plan_revision (Optional[str]): 最後に読み書きしたplan.jsonのハッシュ（Noneの場合は最初の保存まで他のプロセスによる変更を検出しない）
     """
     
     def __init__(self, tasklist: List[Dict], state_summary: str, workspace_dir: str):
@@ -42,8 +69,56 @@ class DataHolder:
         self.tasklist = tasklist
         self.state_summary = state_summary
         self.workspace_dir = workspace_dir
+        self.usage_log: List[Dict] = []
+        self.watcher = None
+        self.sandbox = None
+        self.approval_policy = None
+        self.approver = None
+        self.lock = threading.RLock()
+        self.plan_version = 0
+        self.merge_plans = False
+        self.persist_plan = True
+        self.read_only = False
+        self.plan_revision: Optional[str] = None
+        self._plan_base: List[Dict] = []
+        # タスクリストのうち、このスレッドで動くエージェントが最後に見た内容（並行実行時のマージの基準）
+        self._seen = threading.local()
         logger.info(f"DataHolder initialized with {len(tasklist)} tasks")
     
+    @classmethod
+    def from_workspace(cls, workspace_dir: str, read_only: bool = False) -> "DataHolder":
+        """
+        ワークスペースに保存されたタスクリストと状態サマリーからDataHolderを生成。
+        両ファイルは共有ロックを取って読み込むため、同じ時点の内容になる
+
+        Args:
+            workspace_dir: ワークスペースディレクトリのパス
+            read_only: 読み取り専用で開くか
+
+        Returns:
+            読み込んだ内容で初期化されたDataHolder
+        """
+        plan_data = None
+        state_summary = ""
+
+        with WorkspaceLock.for_workspace(workspace_dir).shared():
+            plan_path = os.path.join(workspace_dir, PLAN_FILE)
+            if os.path.isfile(plan_path):
+                with open(plan_path, encoding="utf-8") as f:
+                    plan_data = f.read()
+
+            summary_path = os.path.join(workspace_dir, STATE_SUMMARY_FILE)
+            if os.path.isfile(summary_path):
+                with open(summary_path, encoding="utf-8") as f:
+                    state_summary = f.read()
+
+        tasklist = codec.loads(plan_data) if plan_data is not None else []
+        dataholder = cls(tasklist=tasklist, state_summary=state_summary, workspace_dir=workspace_dir)
+        dataholder.read_only = read_only
+        dataholder.plan_revision = hash_plan(plan_data)
+        dataholder._plan_base = copy.deepcopy(tasklist)
+        return dataholder
+
     @staticmethod
     def _validate_tasklist(tasklist: List[Dict]) -> None:
         """タスクリストのバリデーション"""
@@ -60,6 +135,125 @@ class DataHolder:
             if "done_flg" not in task:
                 raise InvalidTaskError("Task must have 'done_flg'")
     
+    def remember_plan(self, tasklist: Optional[List[Dict]] = None) -> None:
+        """
+        このスレッドのエージェントが見たタスクリストを記録する。merge_tasklistはこれを基準に、
+        エージェントが意図して削除・改名したタスクと、その後に別のエージェントが追加したタスクを区別する。
+
+        Args:
+            tasklist: エージェントが見たタスクリスト（Noneの場合は現在のタスクリスト）
+        """
+        with self.lock:
+            self._seen.tasklist = copy.deepcopy(self.tasklist if tasklist is None else tasklist)
+
+    def merge_tasklist(self, tasklist: List[Dict]) -> List[Dict]:
+        """
+        新しいタスクリストを現在のタスクリストとマージする。
+        タスクは名前で対応付け、どちらかで完了済みのタスクは完了済みのままにする。
+        このスレッドのエージェントが最後に見たタスクリスト（remember_plan）があれば、それを基準に3方向マージする。
+        見た後で新しいタスクリストから消えたタスクは削除・改名されたものとして除き、別のエージェントが
+        その後に追加・変更したタスクは残す。基準がなければ、新しいタスクリストにないタスクはすべて残す。
+        どちらの場合も、完了済みのタスクは先頭に、残した未完了のタスクは末尾に置く。
+
+        Args:
+            tasklist: 新しいタスクのリスト
+
+        Returns:
+            マージしたタスクのリスト（task_idは未採番）
+        """
+        with self.lock:
+            base = getattr(self._seen, "tasklist", None)
+            if base is not None:
+                merged = self.merge_revisions(base, tasklist, self.tasklist)
+                merged_names = {task.get("name") for task in merged}
+                return [dict(task) for task in self.tasklist if task.get("done_flg") and task.get("name") not in merged_names] + merged
+
+            done_names = {task.get("name") for task in self.tasklist if task.get("done_flg")}
+            new_names = {task.get("name") for task in tasklist}
+            missing = [dict(task) for task in self.tasklist if task.get("name") not in new_names]
+            merged = [dict(task, done_flg=True) if task.get("name") in done_names else task for task in tasklist]
+            return [task for task in missing if task.get("done_flg")] + merged + [task for task in missing if not task.get("done_flg")]
+
+    @staticmethod
+    def merge_revisions(base: List[Dict], ours: List[Dict], theirs: List[Dict]) -> List[Dict]:
+        """
+        別のプロセスが保存したタスクリストと3方向マージする。
+        タスクは名前で対応付け、こちらで変更したタスクはこちらの内容、変更していないタスクは相手の内容にする。
+        どちらかで完了済みのタスクは完了済みのままにする。相手が追加したタスクは、完了済みのものは先頭に、
+        未完了のものは末尾に加える。変更されていないタスクの削除はどちらの削除も反映する。
+
+        Args:
+            base: 両者が最後に共有していたタスクリスト
+            ours: こちらのタスクリスト
+            theirs: ファイルに保存されている相手のタスクリスト
+
+        Returns:
+            マージしたタスクのリスト（task_idは未採番）
+        """
+        def content(task: Dict) -> Dict:
+            return {key: value for key, value in task.items() if key != "task_id"}
+
+        base_tasks = {task.get("name"): content(task) for task in base}
+        their_tasks = {task.get("name"): task for task in theirs}
+        our_names = {task.get("name") for task in ours}
+
+        merged = []
+        for task in ours:
+            name = task.get("name")
+            unchanged = base_tasks.get(name) == content(task)
+            if name in their_tasks:
+                other = their_tasks[name]
+                chosen = dict(other) if unchanged else dict(task)
+                if task.get("done_flg") or other.get("done_flg"):
+                    chosen["done_flg"] = True
+                merged.append(chosen)
+            elif not unchanged:
+                merged.append(dict(task))
+        added = [
+            dict(task) for task in theirs
+            if task.get("name") not in our_names and base_tasks.get(task.get("name")) != content(task)
+        ]
+        return [task for task in added if task.get("done_flg")] + merged + [task for task in added if not task.get("done_flg")]
+
+    def save_tasklist(self) -> bool:
+        """
+        タスクリストをワークスペースのファイルに保存する。
+        最後に読み書きしてから別のプロセスがファイルを変更していた場合は、その内容とマージしてから保存する
+
+        Returns:
+            マージした場合はTrue
+
+        Raises:
+            ReadOnlyError: 読み取り専用で開いた場合
+        """
+        if self.read_only:
+            raise ReadOnlyError("DataHolder was opened read-only")
+        with self.lock, WorkspaceLock.for_workspace(self.workspace_dir).exclusive(), profiler.phase(PHASE_PLAN_SAVE):
+            plan_file = os.path.join(self.workspace_dir, PLAN_FILE)
+            current = None
+            if os.path.isfile(plan_file):
+                with open(plan_file, encoding="utf-8") as f:
+                    current = f.read()
+
+            merged = self.plan_revision is not None and hash_plan(current) != self.plan_revision
+            if merged:
+                logger.info(f"{plan_file} was changed by another process; merging")
+                tasklist = self.merge_revisions(self._plan_base, self.tasklist, codec.loads(current) if current else [])
+                for i, task in enumerate(tasklist):
+                    task["task_id"] = i
+                self.tasklist = tasklist
+
+            data = codec.dumps(self.tasklist)
+            write_atomic(plan_file, data)
+            self.plan_revision = hash_plan(data)
+            self._plan_base = copy.deepcopy(self.tasklist)
+            return merged
+
+    def plan_saved(self) -> None:
+        """タスクリストの保存を記録する"""
+        with self.lock:
+            self.plan_version += 1
+
     def find_task(self, condition: Dict) -> List[Dict]:
         """
         条件に一致するタスクを検索
@@ -0,0 +1,322 @@
+"""
+Chat completions over several OpenAI-compatible endpoints.
+
+EndpointPool stands in for the OpenAI client of OpenAIConnector. Each request goes to the first
+healthy endpoint, in the configured order, and fails over to the next one on connection errors,
+timeouts, rate limits and server errors. An endpoint that fails ENDPOINT_FAILURE_THRESHOLD times in a
+row is skipped for ENDPOINT_COOLDOWN seconds. Other errors (e.g. an unknown model) are raised as they
+are, so the model fallback of the routing policy still applies.
+
+With hedging, a second request is sent to the next endpoint when the first has not answered
+within its p95 latency, and whichever answers first is used. The slower request is left to finish
+in the background; its tokens are still billed by the endpoint.
+
+Endpoints are configured in `~/.gpt_worker/endpoints.json`, or a file given with `--endpoints`. The file
+is never read from the workspace, where agents can write. Keys not written in the file itself (from
+`api_key_env` or OPENAI_API_KEY) are only sent over https, or to an endpoint on the same host:
+
+    {
+        "endpoints": [
+            {"name": "openai", "base_url": "https://api.openai.com/v1", "api_key_env": "OPENAI_API_KEY"},
+            {"name": "azure", "base_url": "https://example.openai.azure.com/openai/v1",
+             "api_key_env": "AZURE_OPENAI_API_KEY", "models": {"gpt-4o": "gpt-4o-deployment"}}
+        ],
+        "hedge": true
+    }
+"""
+import ipaddress
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+import openai
+from openai import OpenAI
+from gpt_worker.constants import (
+    ENDPOINT_COOLDOWN,
+    ENDPOINT_FAILURE_THRESHOLD,
+    ENDPOINT_LATENCY_WINDOW,
+    HEDGE_INITIAL_DELAY,
+    HEDGE_MIN_SAMPLES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the request is retried on another endpoint
+FAILOVER_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+class EndpointError(Exception):
+    """Raised when an endpoint configuration is invalid"""
+    pass
+
+def is_secure_url(url: str) -> bool:
+    """
+    Whether a key can be sent to url: it is https, or http to the local host.
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "https":
+        return True
+    if parts.scheme != "http" or not parts.hostname:
+        return False
+    if parts.hostname == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(parts.hostname).is_loopback
+    except ValueError:
+        return False
+
+class Endpoint:
+    """
+    One OpenAI-compatible endpoint.
+
+    Attributes:
+        models: model name used by the agents -> model (or deployment) name of this endpoint
+    """
+
+    def __init__(self, name: str, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 models: Optional[Dict[str, str]] = None, timeout: Optional[float] = None, client: Optional[Any] = None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.models = dict(models or {})
+        self.timeout = timeout
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> OpenAI:
+        with self._lock:
+            if self._client is None:
+                options: Dict[str, Any] = {"base_url": self.base_url, "api_key": self.api_key, "max_retries": 0}
+                if self.timeout is not None:
+                    options["timeout"] = self.timeout
+                # Failing over is faster than the SDK retrying the same endpoint
+                self._client = OpenAI(**options)
+            return self._client
+
+    def model_for(self, model: str) -> str:
+        return self.models.get(model, model)
+
+class EndpointHealth:
+    """
+    Recent latencies and failures of an endpoint.
+    """
+
+    def __init__(self, window: int = ENDPOINT_LATENCY_WINDOW):
+        self.latencies: deque = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def record_failure(self, now: float, threshold: int, cooldown: float) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= threshold:
+            self.down_until = now + cooldown
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def p95(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[max(math.ceil(len(latencies) * 0.95) - 1, 0)]
+
+class EndpointPool:
+    """
+    Client sending chat completions to several endpoints with failover and optional hedging.
+    It has the `chat.completions.create` method of the OpenAI client; other APIs are served by the
+    first endpoint.
+
+    Attributes:
+        hedges: Requests for which a hedge request was sent
+        hedge_wins: Hedge requests that answered first
+    """
+
+    def __init__(self, endpoints: List[Endpoint], hedge: bool = False,
+                 failure_threshold: int = ENDPOINT_FAILURE_THRESHOLD, cooldown: float = ENDPOINT_COOLDOWN,
+                 hedge_min_samples: int = HEDGE_MIN_SAMPLES, hedge_initial_delay: float = HEDGE_INITIAL_DELAY):
+        if not endpoints:
+            raise EndpointError("At least one endpoint is required")
+        self.endpoints = endpoints
+        self.hedge = hedge
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_initial_delay = hedge_initial_delay
+        self.health: Dict[str, EndpointHealth] = {endpoint.name: EndpointHealth() for endpoint in endpoints}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(endpoints), thread_name_prefix="gptw-endpoint")
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "EndpointPool":
+        endpoints = []
+        for index, entry in enumerate(config.get("endpoints", [])):
+            api_key = entry.get("api_key")
+            # The key of the environment must not leak to a host that was only named in a file
+            if api_key is None and entry.get("base_url") and not is_secure_url(entry["base_url"]):
+                raise EndpointError(f"Endpoint {entry.get('name', index)} must use https to be sent a key from the environment: {entry['base_url']}")
+            if api_key is None and entry.get("api_key_env"):
+                api_key = os.environ.get(entry["api_key_env"])
+                if api_key is None:
+                    raise EndpointError(f"Environment variable {entry['api_key_env']} is not set for endpoint {entry.get('name', index)}")
+            endpoints.append(Endpoint(
+                name=entry.get("name", f"endpoint{index}"),
+                base_url=entry.get("base_url"),
+                api_key=api_key,
+                models=entry.get("models"),
+                timeout=entry.get("timeout"),
+            ))
+        return cls(endpoints, hedge=config.get("hedge", False))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["EndpointPool"]:
+        """
+        Loads an endpoints file. Returns None when there is none.
+
+        Raises:
+            EndpointError: When the file is not valid
+        """
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_config(json.loads(f.read()))
+        except json.JSONDecodeError as e:
+            raise EndpointError(f"Invalid endpoints file {path}: {e}")
+
+    def __getattr__(self, name: str) -> Any:
+        # files, batches, models, ... are not spread over endpoints
+        if name.startswith("_") or "endpoints" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.endpoints[0].client, name)
+
+    def candidates(self) -> List[Endpoint]:
+        """
+        Endpoints in the order they are tried: healthy ones as configured, then the others by the end of their cooldown.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [endpoint for endpoint in self.endpoints if self.health[endpoint.name].healthy(now)]
+            down = sorted((endpoint for endpoint in self.endpoints if endpoint not in healthy),
+                          key=lambda endpoint: self.health[endpoint.name].down_until)
+        return healthy + down
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        """
+        Seconds to wait for an endpoint before hedging: its p95 latency once enough requests are known.
+        """
+        with self._lock:
+            health = self.health[endpoint.name]
+            if len(health.latencies) < self.hedge_min_samples:
+                return self.hedge_initial_delay
+            return health.p95()
+
+    def _call(self, endpoint: Endpoint, kwargs: Dict) -> Any:
+        started = time.monotonic()
+        try:
+            response = endpoint.client.chat.completions.create(**dict(kwargs, model=endpoint.model_for(kwargs["model"])))
+        except FAILOVER_ERRORS as e:
+            with self._lock:
+                self.health[endpoint.name].record_failure(time.monotonic(), self.failure_threshold, self.cooldown)
+            logger.warning(f"Endpoint {endpoint.name} failed: {e}")
+            raise
+        with self._lock:
+            self.health[endpoint.name].record_success(time.monotonic() - started)
+        return response
+
+    def create(self, **kwargs) -> Any:
+        """
+        Creates a chat completion on the endpoints.
+
+        Raises:
+            openai.OpenAIError: The error of the last endpoint tried when none succeeded
+        """
+        candidates = self.candidates()
+        if self.hedge and len(candidates) > 1:
+            return self._create_hedged(candidates, kwargs)
+
+        last_error: Optional[Exception] = None
+        for endpoint in candidates:
+            try:
+                return self._call(endpoint, kwargs)
+            except FAILOVER_ERRORS as e:
+                last_error = e
+        raise last_error
+
+    def _create_hedged(self, candidates: List[Endpoint], kwargs: Dict) -> Any:
+        remaining = list(candidates)
+        first = remaining.pop(0)
+        pending = {self._executor.submit(self._call, first, kwargs): first}
+        delay = self.hedge_delay(first)
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        while pending:
+            done, _ = wait(pending, timeout=delay if remaining and not hedged else None, return_when=FIRST_COMPLETED)
+            if not done:
+                endpoint = remaining.pop(0)
+                logger.info(f"Endpoint {first.name} slower than {delay:.1f}s; hedging on {endpoint.name}")
+                pending[self._executor.submit(self._call, endpoint, kwargs)] = endpoint
+                hedged = True
+                with self._lock:
+                    self.hedges += 1
+                continue
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    response = future.result()
+                except FAILOVER_ERRORS as e:
+                    last_error = e
+                    if not pending and remaining:
+                        # Both requests failed (or the first failed before hedging): fail over
+                        endpoint = remaining.pop(0)
+                        pending[self._executor.submit(self._call, endpoint, kwargs)] = endpoint
+                    continue
+                if endpoint is not first:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return response
+        raise last_error
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": endpoint.name,
+                "requests": self.health[endpoint.name].requests,
+                "failures": self.health[endpoint.name].failures,
+                "p95": self.health[endpoint.name].p95(),
+                "healthy": self.health[endpoint.name].healthy(now),
+            } for endpoint in self.endpoints]
+
+def format_endpoint_summary(pool: EndpointPool) -> str:
+    """
+    One line per endpoint, then the hedging counts.
+    """
+    lines = []
+    for stats in pool.stats():
+        p95 = f"{stats['p95']:.1f}s" if stats["p95"] is not None else "-"
+        status = "" if stats["healthy"] else ", unhealthy"
+        lines.append(f"Endpoint {stats['name']}: {stats['requests']} requests, {stats['failures']} failed, p95 {p95}{status}")
+    if pool.hedge:
+        lines.append(f"Hedged requests: {pool.hedges}, won by the hedge: {pool.hedge_wins}")
+    return "\n".join(lines)
@@ -0,0 +1,120 @@
+"""
+Fingerprint of the workspace a plan was made for.
+
+The fingerprint is a Merkle-style hash: every tracked file is hashed by content, every directory by
+the names and hashes of its entries, and the root hash covers the whole tree. Together with a hash
+of the order and of the task list it is stored next to the plan when a run ends. The next run can
+then tell whether anything changed since, and skip planning when nothing did.
+
+Content hashes are cached by size and mtime, so only files that changed are read again. Files are
+tracked with the same rules as progress.hash_workspace (hidden, dunder and gpt_worker directories
+are skipped).
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+from gpt_worker.constants import FINGERPRINT_FILE, GPT_WORKER_DIR
+from gpt_worker.locking import WorkspaceLock, write_atomic
+from gpt_worker.progress import hash_tasklist
+
+logger = logging.getLogger(__name__)
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def merkle_root(file_hashes: Dict[str, str]) -> str:
+    """
+    Root hash of a tree given the content hash of every file by relative path.
+    """
+    tree: Dict = {}
+    for rel_path, file_hash in file_hashes.items():
+        node = tree
+        parts = rel_path.split(os.sep)
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = file_hash
+
+    def hash_node(node: Dict) -> str:
+        entries = []
+        for name in sorted(node):
+            child = node[name]
+            entries.append(f"{'d' if isinstance(child, dict) else 'f'}\0{name}\0{hash_node(child) if isinstance(child, dict) else child}")
+        return hash_text("\n".join(entries))
+
+    return hash_node(tree)
+
+class WorkspaceFingerprint:
+    """
+    Computes the fingerprint of a workspace and compares it with the one stored with the plan.
+
+    Attributes:
+        stored: The stored fingerprint ({"root", "order", "plan", "files"}), or None
+    """
+
+    def __init__(self, workspace_dir: str):
+        self.workspace_dir = workspace_dir
+        self.path = os.path.join(workspace_dir, FINGERPRINT_FILE)
+        self.stored: Optional[Dict] = None
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self.stored = json.loads(f.read())
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Ignoring unreadable fingerprint {self.path}: {e}")
+
+    def compute(self) -> Tuple[str, Dict[str, List]]:
+        """
+        Hashes the workspace. Returns the root hash and the files as relative path -> [size, mtime_ns, content hash].
+        """
+        cached = (self.stored or {}).get("files", {})
+        files: Dict[str, List] = {}
+        for path, dirs, names in os.walk(self.workspace_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and not d.startswith("__") and d != GPT_WORKER_DIR)
+            for name in names:
+                file_path = os.path.join(path, name)
+                rel_path = os.path.relpath(file_path, self.workspace_dir)
+                try:
+                    stat = os.stat(file_path)
+                    entry = cached.get(rel_path)
+                    if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                        file_hash = entry[2]
+                    else:
+                        file_hash = hash_file(file_path)
+                except OSError:
+                    continue
+                files[rel_path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+        return merkle_root({rel_path: entry[2] for rel_path, entry in files.items()}), files
+
+    def matches(self, order: str, tasklist: List[Dict]) -> bool:
+        """
+        Whether the workspace, the task list and the order are the ones stored. An empty order
+        continues the stored one and always matches it.
+        """
+        if self.stored is None:
+            return False
+        if order and hash_text(order) != self.stored.get("order"):
+            return False
+        if hash_tasklist(tasklist) != self.stored.get("plan"):
+            return False
+        root, _ = self.compute()
+        return root == self.stored.get("root")
+
+    def save(self, order: str, tasklist: List[Dict]) -> str:
+        """
+        Stores the fingerprint of the workspace as it is now. Returns the root hash.
+        """
+        root, files = self.compute()
+        order_hash = hash_text(order) if order or self.stored is None else self.stored.get("order")
+        self.stored = {"root": root, "order": order_hash, "plan": hash_tasklist(tasklist), "files": files}
+        with WorkspaceLock.for_workspace(self.workspace_dir).exclusive():
+            write_atomic(self.path, json.dumps(self.stored))
+        return root
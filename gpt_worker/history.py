@@ -0,0 +1,86 @@
+"""
+Compaction of agent conversations.
+
+Used by `Worker.run(carry_over=True)` to carry what the model read and did in earlier iterations
+into the next one, as one bounded summary instead of the full tool outputs.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+from gpt_worker import codec
+from gpt_worker.wire import decode_tool_result
+
+# Characters of tool output kept per note
+NOTE_EXCERPT_CHARS = 1500
+
+def tool_call_function(tool_call: Any) -> Tuple[str, str]:
+    """
+    Returns (name, arguments) of a tool call stored either as a dict or as an SDK object.
+    """
+    function = tool_call["function"] if isinstance(tool_call, dict) else tool_call.function
+    if isinstance(function, dict):
+        return function["name"], function["arguments"]
+    return function.name, function.arguments
+
+def tool_call_id(tool_call: Any) -> str:
+    return tool_call["id"] if isinstance(tool_call, dict) else tool_call.id
+
+def _excerpt(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:limit] + f"\n... ({len(text) - limit} more characters)"
+
+def describe_tool_result(name: str, arguments: str, content: str, excerpt_chars: int = NOTE_EXCERPT_CHARS) -> str:
+    """
+    Describes one tool call and its outcome as a note.
+    """
+    try:
+        args = codec.loads(arguments)
+    except (TypeError, json.JSONDecodeError):
+        args = {}
+    result = decode_tool_result(content) if isinstance(content, str) else {"success": True, "content": content}
+
+    target = args.get("path") or ", ".join(args.get("paths") or []) or args.get("script") or args.get("query") or ""
+    header = f"{name}({target})" if target else name
+    if not result.get("success", False):
+        return f"{header} -> failed: {_excerpt(str(result.get('content', '')), 200)}"
+
+    output = result.get("content")
+    if not output:
+        return f"{header} -> ok"
+    return f"{header} -> ok:\n{_excerpt(str(output), excerpt_chars)}"
+
+def summarize_turns(messages: List[Dict], excerpt_chars: int = NOTE_EXCERPT_CHARS) -> List[str]:
+    """
+    Turns a conversation into notes: one per tool call and one per assistant text reply.
+    System and user messages are skipped since they are rebuilt for every iteration.
+    """
+    calls: Dict[str, Tuple[str, str]] = {}
+    notes = []
+    for message in messages:
+        if message["role"] == "assistant":
+            if message.get("content"):
+                notes.append("You said: " + _excerpt(message["content"], excerpt_chars))
+            for tool_call in message.get("tool_calls", []):
+                calls[tool_call_id(tool_call)] = tool_call_function(tool_call)
+        elif message["role"] == "tool":
+            name, arguments = calls.get(message.get("tool_call_id"), ("tool", "{}"))
+            notes.append(describe_tool_result(name, arguments, message["content"], excerpt_chars))
+    return notes
+
+def render_notes(notes: List[str], max_chars: int) -> str:
+    """
+    Renders notes within `max_chars`. Recent notes are kept in full; older ones are cut to their first
+    line, and the oldest are dropped when that is still not enough.
+    """
+    rendered: List[str] = []
+    total = 0
+    for index, note in enumerate(reversed(notes)):
+        line = "- " + note.replace("\n", "\n  ")
+        if total + len(line) + 1 > max_chars:
+            line = "- " + note.split("\n", 1)[0]
+        if total + len(line) + 1 > max_chars:
+            rendered.append(f"- ({len(notes) - index} earlier actions omitted)")
+            break
+        rendered.append(line)
+        total += len(line) + 1
+    return "\n".join(reversed(rendered))
@@ -0,0 +1,136 @@
+"""
+Advisory locking of the state files of a workspace.
+
+Several gptw processes may use one workspace at a time. Writers of `.gpt_worker/plan.json` and
+`.gpt_worker/state_summary.md` hold an exclusive fcntl lock on `.gpt_worker/lock` while they read,
+merge and write, and readers hold a shared lock, so a reader sees the plan and the summary of one
+point in time. Files are written to a temporary file and renamed, so even readers that do not lock
+never see a partial file.
+
+Locks are per process: threads of one process share the workspace lock, which is reentrant.
+"""
+import fcntl
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from gpt_worker.constants import LOCK_FILE, LOCK_POLL_INTERVAL, LOCK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+class WorkspaceLockError(Exception):
+    """Raised when the workspace stays locked by another process"""
+    pass
+
+class WorkspaceLock:
+    """
+    Shared/exclusive lock on a workspace, held by at most one thread of the process at a time.
+    A thread holding the shared lock that asks for the exclusive one upgrades it until it releases the outermost lock.
+    """
+
+    _locks: Dict[str, "WorkspaceLock"] = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, workspace_dir: str, timeout: float = LOCK_TIMEOUT):
+        self.path = os.path.join(workspace_dir, LOCK_FILE)
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+        self._exclusive = False
+
+    @classmethod
+    def for_workspace(cls, workspace_dir: str) -> "WorkspaceLock":
+        """
+        The lock of a workspace, shared by every DataHolder and SummaryStore of the process.
+        """
+        key = os.path.realpath(workspace_dir)
+        with cls._locks_guard:
+            if key not in cls._locks:
+                cls._locks[key] = cls(key)
+            return cls._locks[key]
+
+    def _open(self, exclusive: bool) -> Optional[int]:
+        if exclusive:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Readers never create files: without a lock file no writer has run yet
+        try:
+            return os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+
+    def _flock(self, exclusive: bool) -> None:
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise WorkspaceLockError(f"Workspace is locked by another process: {self.path}")
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def acquire(self, exclusive: bool) -> None:
+        self._thread_lock.acquire()
+        try:
+            if self._depth == 0:
+                self._fd = self._open(exclusive)
+                self._exclusive = exclusive
+                if self._fd is not None:
+                    self._flock(exclusive)
+            elif exclusive and not self._exclusive:
+                if self._fd is None:
+                    self._fd = self._open(True)
+                self._flock(True)
+                self._exclusive = True
+        except BaseException:
+            if self._depth == 0:
+                self._close()
+            self._thread_lock.release()
+            raise
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            self._close()
+        self._thread_lock.release()
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        """Lock for reading the state files"""
+        self.acquire(False)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """Lock for reading, merging and writing the state files"""
+        self.acquire(True)
+        try:
+            yield
+        finally:
+            self.release()
+
+def write_atomic(path: str, text: str) -> None:
+    """
+    Writes a file through a temporary file in the same directory, so it is replaced at once.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
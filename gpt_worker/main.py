@@ -1,8 +1,6 @@
-import os
 import argparse
-import json
 from gpt_worker.agents import DataHolder, Orchestrator
-from gpt_worker.constants import DEFAULT_WORKSPACE_DIR, PLAN_FILE, STATE_SUMMARY_FILE, DEFAULT_MODEL
+from gpt_worker.constants import DEFAULT_WORKSPACE_DIR, DEFAULT_MODEL
 
 # Main script for task automation
 # Orchestrates task execution by reading task lists and state summaries,
@@ -20,24 +18,8 @@ def main():
     model = args.model if args.model else DEFAULT_MODEL
     directory = args.directory if args.directory else DEFAULT_WORKSPACE_DIR
 
-    # Initialize task list and state summary
-    tasklist = []
-    state_summary = ""
-
-    # Retrieve task list from PLAN_FILE
-    plan_dir = os.path.join(directory, PLAN_FILE)
-    if os.path.isfile(plan_dir):
-        with open(plan_dir, encoding="utf-8") as f:
-            tasklist = json.loads(f.read())
-
-    # Retrieve state summary from STATE_SUMMARY_FILE
-    summary_dir = os.path.join(directory, STATE_SUMMARY_FILE)
-    if os.path.isfile(summary_dir):
-        with open(summary_dir, encoding="utf-8") as f:
-            state_summary = f.read()
-
-    # Initialize DataHolder and Orchestrator
-    dataholder = DataHolder(tasklist=tasklist, state_summary=state_summary, workspace_dir=directory)
+    # Initialize DataHolder from the task list and state summary stored in the workspace
+    dataholder = DataHolder.from_workspace(directory)
     orchestrator = Orchestrator(dataholder=dataholder)
 
     # Execute tasks using Orchestrator's run method
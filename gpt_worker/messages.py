@@ -0,0 +1,149 @@
+"""
+Compact store of agent conversations.
+
+A Worker iteration keeps every file content and command output it saw until the iteration ends, and
+in a plain list of dicts each of them costs a dict per message, per tool call and per function, plus
+a separate copy every time the same file is read again. MessageStore keeps the conversation instead as:
+
+- slotted records, with role names, tool names and tool call ids interned,
+- tool payloads (call arguments and results) kept once in a content-addressed BlobStore and
+  referenced by id, so a file read five times is held once,
+
+and builds the API format (a list of dicts) only when a request is sent. Indexing and iterating give
+API-format dicts too, so code written for a list of messages reads a MessageStore unchanged.
+"""
+import hashlib
+import sys
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from gpt_worker.history import tool_call_function, tool_call_id
+
+class BlobStore:
+    """
+    Content-addressed store of strings. Identical strings are kept once.
+    """
+    __slots__ = ("_blobs",)
+
+    def __init__(self):
+        self._blobs: Dict[str, str] = {}
+
+    @staticmethod
+    def blob_id(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+    def put(self, text: str) -> str:
+        """Stores text unless an identical string is stored already, and returns its id"""
+        key = self.blob_id(text)
+        self._blobs.setdefault(key, text)
+        return key
+
+    def get(self, key: str) -> str:
+        return self._blobs[key]
+
+    def __len__(self) -> int:
+        return len(self._blobs)
+
+    @property
+    def size(self) -> int:
+        """Characters held"""
+        return sum(len(text) for text in self._blobs.values())
+
+class ToolCallRecord:
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self, id: str, name: str, arguments: str):
+        self.id = id
+        self.name = name
+        self.arguments = arguments  # blob id
+
+class MessageRecord:
+    __slots__ = ("role", "content", "payload", "tool_calls", "tool_call_id", "extra")
+
+    def __init__(self, role: str, content: Optional[str] = None, payload: Optional[str] = None,
+                 tool_calls: Optional[Tuple[ToolCallRecord, ...]] = None, tool_call_id: Optional[str] = None,
+                 extra: Optional[Dict[str, Any]] = None):
+        self.role = role
+        self.content = content  # text of system, user and assistant messages
+        self.payload = payload  # blob id of the content of tool messages
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+        self.extra = extra  # any other fields, as given
+
+_FIELDS = {"role", "content", "tool_calls", "tool_call_id"}
+
+class MessageStore(Sequence):
+    """
+    Conversation with an agent, stored compactly. Append API-format messages (dicts, with tool calls as
+    dicts or SDK objects); read them back, or send them with to_api(), as API-format dicts.
+    """
+
+    def __init__(self, messages: Iterable[Dict] = (), blobs: Optional[BlobStore] = None):
+        self.blobs = blobs if blobs is not None else BlobStore()
+        self._records: List[MessageRecord] = []
+        self.extend(messages)
+
+    def append(self, message: Dict) -> None:
+        role = sys.intern(message["role"])
+        content = message.get("content")
+        tool_calls = message.get("tool_calls")
+        call_id = message.get("tool_call_id")
+        extra = {key: value for key, value in message.items() if key not in _FIELDS} or None
+
+        record = MessageRecord(role, extra=extra)
+        if role == "tool" and isinstance(content, str):
+            record.payload = self.blobs.put(content)
+        else:
+            record.content = content
+        if tool_calls:
+            record.tool_calls = tuple(self._tool_call_record(tool_call) for tool_call in tool_calls)
+        if call_id is not None:
+            record.tool_call_id = sys.intern(call_id)
+        self._records.append(record)
+
+    def extend(self, messages: Iterable[Dict]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def _tool_call_record(self, tool_call: Any) -> ToolCallRecord:
+        name, arguments = tool_call_function(tool_call)
+        return ToolCallRecord(sys.intern(tool_call_id(tool_call)), sys.intern(name), self.blobs.put(arguments))
+
+    def _to_api(self, record: MessageRecord) -> Dict:
+        message: Dict[str, Any] = {"role": record.role}
+        if record.payload is not None:
+            message["content"] = self.blobs.get(record.payload)
+        elif record.content is not None or not record.tool_calls:
+            message["content"] = record.content
+        if record.tool_calls:
+            message["tool_calls"] = [
+                {"id": call.id, "type": "function", "function": {"name": call.name, "arguments": self.blobs.get(call.arguments)}}
+                for call in record.tool_calls
+            ]
+        if record.tool_call_id is not None:
+            message["tool_call_id"] = record.tool_call_id
+        if record.extra:
+            message.update(record.extra)
+        return message
+
+    def to_api(self) -> List[Dict]:
+        """The conversation as the list of message dicts sent to the API"""
+        return [self._to_api(record) for record in self._records]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(index, slice):
+            return [self._to_api(record) for record in self._records[index]]
+        return self._to_api(self._records[index])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+def to_api(messages: Union[MessageStore, List[Dict]]) -> List[Dict]:
+    """Messages in API format, whether they are kept in a MessageStore or a list"""
+    return messages.to_api() if isinstance(messages, MessageStore) else messages
+
+def tool_call_dict(tool_call: Any) -> Dict:
+    """
+    Plain dict of a tool call given as a dict or an SDK object, so messages do not keep SDK objects alive.
+    """
+    name, arguments = tool_call_function(tool_call)
+    return {"id": tool_call_id(tool_call), "type": "function", "function": {"name": name, "arguments": arguments}}
@@ -0,0 +1,129 @@
+"""
+Compact outlines of source files, used by the OutlineReader tool.
+
+Python files are parsed with `ast`. Other files fall back to line-based regular expressions that
+catch the common declaration forms of C-like languages, Go, Rust and Markdown headings. Outlines are
+cached by content hash, so unchanged files are only parsed once per process.
+"""
+import ast
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+# Number of outlines kept in memory
+OUTLINE_CACHE_SIZE = 1024
+
+_FALLBACK_PATTERNS = [
+    re.compile(r"^\s*(export\s+)?(default\s+)?(async\s+)?function\s*\*?\s*[\w$]+\s*\("),
+    re.compile(r"^\s*(export\s+)?(const|let|var)\s+[\w$]+\s*=\s*(async\s+)?(\([^)]*\)|[\w$]+)\s*=>"),
+    re.compile(r"^\s*(export\s+)?(default\s+)?(public\s+|private\s+|protected\s+|internal\s+)?(abstract\s+|final\s+|sealed\s+|static\s+)*(class|interface|enum|struct|trait|record)\s+\w+"),
+    re.compile(r"^\s*(pub(\([\w:]+\))?\s+)?(async\s+)?(unsafe\s+)?(fn|impl|mod|type)\b"),
+    re.compile(r"^\s*func\s+"),
+    re.compile(r"^\s*type\s+\w+\s+(struct|interface)\b"),
+    re.compile(r"^\s*(public|private|protected|internal)\s+[\w<>\[\],.?\s]+\s+\w+\s*\([^;]*$"),
+    re.compile(r"^\s*(def|class|module)\s+\w+"),
+    re.compile(r"^#{1,6}\s+\S"),
+]
+
+_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _unparse(node: Optional[ast.AST]) -> str:
+    if node is None:
+        return ""
+    if hasattr(ast, "unparse"):
+        return ast.unparse(node)
+    return "..."
+
+def _format_arguments(args: ast.arguments) -> str:
+    parts = []
+    positional = getattr(args, "posonlyargs", []) + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    for arg, default in zip(positional, defaults):
+        text = arg.arg
+        if arg.annotation is not None:
+            text += ": " + _unparse(arg.annotation)
+        if default is not None:
+            text += "=" + _unparse(default)
+        parts.append(text)
+    if args.vararg:
+        parts.append("*" + args.vararg.arg)
+    elif args.kwonlyargs:
+        parts.append("*")
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        text = arg.arg
+        if arg.annotation is not None:
+            text += ": " + _unparse(arg.annotation)
+        if default is not None:
+            text += "=" + _unparse(default)
+        parts.append(text)
+    if args.kwarg:
+        parts.append("**" + args.kwarg.arg)
+    return ", ".join(parts)
+
+def _outline_body(body: List[ast.stmt], depth: int, lines: List[str]) -> None:
+    indent = "  " * depth
+    for node in body:
+        if isinstance(node, ast.ClassDef):
+            bases = ", ".join(_unparse(base) for base in node.bases)
+            lines.append(f"L{node.lineno} {indent}class {node.name}" + (f"({bases})" if bases else ""))
+            _outline_body(node.body, depth + 1, lines)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+            returns = f" -> {_unparse(node.returns)}" if node.returns is not None else ""
+            decorators = "".join(f"@{_unparse(d)} " for d in node.decorator_list)
+            lines.append(f"L{node.lineno} {indent}{decorators}{prefix} {node.name}({_format_arguments(node.args)}){returns}")
+        elif depth == 0 and isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [t.id for t in targets if isinstance(t, ast.Name) and t.id.isupper()]
+            if names:
+                lines.append(f"L{node.lineno} {', '.join(names)} = ...")
+
+def outline_python(source: str) -> List[str]:
+    """
+    Outlines classes, functions with signatures and UPPER_CASE module constants of a Python file.
+    """
+    tree = ast.parse(source)
+    lines: List[str] = []
+    docstring = ast.get_docstring(tree)
+    if docstring:
+        lines.append('"""' + docstring.strip().splitlines()[0] + '"""')
+    _outline_body(tree.body, 0, lines)
+    return lines
+
+def outline_generic(source: str) -> List[str]:
+    """
+    Outlines declaration-looking lines of a non-Python file.
+    """
+    lines = []
+    for line_no, line in enumerate(source.splitlines(), 1):
+        if any(pattern.match(line) for pattern in _FALLBACK_PATTERNS):
+            lines.append(f"L{line_no} {line.rstrip().rstrip('{').rstrip()[:160]}")
+    return lines
+
+def outline_source(path: str, source: str) -> List[str]:
+    """
+    Returns the outline of a file's content, from the cache when the same content was outlined before.
+    """
+    is_python = path.endswith((".py", ".pyi"))
+    key = ("py:" if is_python else "txt:") + hashlib.sha256(source.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    if is_python:
+        try:
+            lines = outline_python(source)
+        except SyntaxError:
+            lines = outline_generic(source)
+    else:
+        lines = outline_generic(source)
+
+    with _cache_lock:
+        _cache[key] = lines
+        if len(_cache) > OUTLINE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return lines
@@ -0,0 +1,196 @@
+"""
+Read cache and speculative prefetch of workspace files.
+
+While the connector waits for the model, files it is likely to read next are loaded into a shared
+read cache on background threads: files named in the tasks, files written recently in the conversation,
+and the usual project files at the workspace root. FileReader and MultiFileReader read through the
+cache, so predicted reads are served from memory. Entries are validated by mtime and size on every
+read, so a cached file is never stale.
+"""
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from gpt_worker.constants import READ_CACHE_MAX_BYTES, PREFETCH_MAX_FILE_BYTES, PREFETCH_MAX_FILES
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.history import tool_call_function
+
+logger = logging.getLogger(__name__)
+
+# Files at the workspace root that are worth reading early in most projects
+ROOT_FILES = ("README.md", "README.rst", "README.txt", "README", "pyproject.toml", "setup.py", "package.json", "requirements.txt", "Cargo.toml", "go.mod")
+
+_PATH_LIKE = re.compile(r"[\w./-]+\.\w+")
+
+class ReadCache:
+    """
+    Thread-safe, size-bounded cache of file contents keyed by path and validated by (mtime, size).
+    """
+
+    def __init__(self, max_bytes: int = READ_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[int, int, str, bool]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+        self.prefetch_hits = 0
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def _store(self, key: str, stat: os.stat_result, content: str, prefetched: bool) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[2])
+        self._entries[key] = (stat.st_mtime_ns, stat.st_size, content, prefetched)
+        self._size += len(content)
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted[2])
+
+    def _lookup(self, key: str, stat: os.stat_result) -> Optional[Tuple[int, int, str, bool]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def read(self, path: str) -> str:
+        """
+        Returns the content of a text file, from the cache when it has not changed since it was cached.
+
+        Raises:
+            OSError, UnicodeDecodeError: As open() and read() would
+        """
+        key = self._key(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._lookup(key, stat)
+            if entry is not None:
+                self.hits += 1
+                if entry[3]:
+                    # Count each prefetched entry once, then treat it like any other entry
+                    self.prefetch_hits += 1
+                    self._entries[key] = entry[:3] + (False,)
+                return entry[2]
+            self.misses += 1
+
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        with self._lock:
+            self._store(key, stat, content, prefetched=False)
+        return content
+
+    def warm(self, path: str) -> bool:
+        """
+        Loads a file into the cache ahead of use. Returns whether it was loaded.
+        """
+        key = self._key(path)
+        try:
+            stat = os.stat(path)
+            if stat.st_size > PREFETCH_MAX_FILE_BYTES or not os.path.isfile(path):
+                return False
+            with self._lock:
+                if self._lookup(key, stat) is not None:
+                    return False
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError):
+            return False
+        with self._lock:
+            self._store(key, stat, content, prefetched=True)
+            self.prefetched += 1
+        return True
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """
+        Drops one path, or everything when no path is given.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            entry = self._entries.pop(self._key(path), None)
+            if entry is not None:
+                self._size -= len(entry[2])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            reads = self.hits + self.misses
+            return {
+                "reads": reads,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / reads if reads else 0.0,
+                "prefetched": self.prefetched,
+                "prefetch_hits": self.prefetch_hits,
+                "prefetch_hit_rate": self.prefetch_hits / self.prefetched if self.prefetched else 0.0,
+            }
+
+read_cache = ReadCache()
+
+def predict_paths(dataholder: DataHolder, messages: List[Dict]) -> List[str]:
+    """
+    Predicts files the model is likely to read next, most likely first.
+    """
+    workspace_dir = dataholder.workspace_dir
+    candidates: List[str] = []
+
+    # Files written in this conversation are often read back to check or continue them
+    for message in reversed(messages):
+        for tool_call in message.get("tool_calls") or []:
+            name, arguments = tool_call_function(tool_call)
+            if name == "FileWriter":
+                match = re.search(r'"path"\s*:\s*"([^"]+)"', arguments)
+                if match:
+                    candidates.append(match.group(1))
+
+    # Files named in the incomplete tasks
+    for task in dataholder.tasklist:
+        if task.get("done_flg"):
+            continue
+        text = " ".join(str(task.get(key, "")) for key in ("next_step", "description", "name"))
+        candidates.extend(_PATH_LIKE.findall(text))
+
+    candidates.extend(ROOT_FILES)
+
+    paths = []
+    for candidate in candidates:
+        path = candidate if candidate.startswith(workspace_dir) else os.path.join(workspace_dir, candidate)
+        if path not in paths and os.path.isfile(path):
+            paths.append(path)
+        if len(paths) >= PREFETCH_MAX_FILES:
+            break
+    return paths
+
+class Prefetcher:
+    """
+    Warms a read cache on background threads.
+    """
+
+    def __init__(self, cache: ReadCache = read_cache, max_workers: int = 4):
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def prefetch(self, paths: List[str]) -> None:
+        """
+        Starts loading the given paths and returns immediately.
+        """
+        for path in paths:
+            self.executor.submit(self.cache.warm, path)
+
+    def prefetch_for(self, dataholder: DataHolder, messages: List[Dict]) -> None:
+        try:
+            self.prefetch(predict_paths(dataholder, messages))
+        except Exception as e:
+            # Prefetching is only an optimization; never let it break a turn
+            logger.debug(f"Prefetch failed: {e}")
+
+prefetcher = Prefetcher()
@@ -0,0 +1,195 @@
+"""
+Phase profiler for `gptw run --profile`.
+
+The agents, the connector and the tools wrap their phases (prompt building, tool schema generation,
+waiting for the API, JSON encoding and decoding, tool execution, ...) in `profiler.phase(name)`.
+While the profiler is stopped a phase is a shared no-op context manager, so the instrumentation
+costs one attribute check per phase.
+
+Phases nest per thread. For every stack of phases the self time (time not spent in nested phases) is
+accumulated; at the end it is written as a collapsed-stack file (`planner;api 1234567`, in
+microseconds) that flamegraph.pl, speedscope or inferno can render, and summarized in a table per
+phase. Optionally cProfile (thread that started the profiler only) and tracemalloc run alongside.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+# Phase names used by the instrumented code
+PHASE_PLANNER = "planner"
+PHASE_WORKER = "worker"
+PHASE_PROMPT = "prompt"
+PHASE_SCHEMA = "schema"
+PHASE_API = "api"
+PHASE_JSON = "json"
+PHASE_PROGRESS = "progress"
+PHASE_FINGERPRINT = "fingerprint"
+PHASE_PLAN_SAVE = "plan_save"
+TOOL_PHASE_PREFIX = "tool:"
+
+_NO_PHASE = nullcontext()
+
+class _Phase:
+    __slots__ = ("profiler", "name", "started", "children")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.children = 0.0
+
+    def __enter__(self) -> "_Phase":
+        self.profiler._stack().append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        elapsed = time.perf_counter() - self.started
+        stack = self.profiler._stack()
+        # A generator closed out of order leaves its phase above others; drop it from wherever it is
+        index = len(stack) - 1 - stack[::-1].index(self)
+        names = tuple(phase.name for phase in stack[:index + 1])
+        del stack[index]
+        if index > 0:
+            stack[index - 1].children += elapsed
+        self.profiler._record(names, elapsed, elapsed - self.children)
+
+class Profiler:
+    """
+    Accumulates the time spent per phase.
+
+    Attributes:
+        enabled: Whether phases are timed
+        stacks: Stack of phase names -> self time in seconds
+        phases: Phase name -> [calls, total seconds, self seconds]
+        top_level: Seconds spent in phases that are not nested in another phase
+        wall: Seconds between start() and stop()
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stacks: Dict[Tuple[str, ...], float] = {}
+        self.phases: Dict[str, List[float]] = {}
+        self.top_level = 0.0
+        self.wall = 0.0
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.memory: Optional[Dict] = None
+        self._trace_memory = False
+        self._started = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self, cprofile: bool = False, memory: bool = False) -> None:
+        """
+        Clears earlier results and starts timing phases, optionally with cProfile and tracemalloc.
+        """
+        with self._lock:
+            self.stacks = {}
+            self.phases = {}
+            self.top_level = 0.0
+        self.memory = None
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self._trace_memory = memory
+        if memory:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        self.enabled = True
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.enabled = False
+        self.wall = time.perf_counter() - self._started
+        if self._trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            self.memory = {
+                "current": current,
+                "peak": peak,
+                "top": [(str(stat.traceback), stat.size, stat.count) for stat in top],
+            }
+            self._trace_memory = False
+
+    def phase(self, name: str):
+        """
+        Context manager timing a phase. A no-op while the profiler is stopped.
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def _stack(self) -> List[_Phase]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, names: Tuple[str, ...], elapsed: float, self_time: float) -> None:
+        with self._lock:
+            self.stacks[names] = self.stacks.get(names, 0.0) + self_time
+            if len(names) == 1:
+                self.top_level += elapsed
+            entry = self.phases.setdefault(names[-1], [0, 0.0, 0.0])
+            entry[0] += 1
+            # Recursive phases count once towards the total
+            if names[-1] not in names[:-1]:
+                entry[1] += elapsed
+            entry[2] += self_time
+
+    def collapsed_stacks(self) -> str:
+        """
+        Self time per stack in the collapsed-stack format of flamegraph.pl, in microseconds.
+        """
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        return "".join(f"{';'.join(names)} {round(seconds * 1e6)}\n" for names, seconds in stacks if seconds > 0)
+
+    def write_collapsed(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, mode="w", encoding="utf-8") as f:
+            f.write(self.collapsed_stacks())
+
+    def write_cprofile(self, path: str) -> None:
+        if self.cprofile is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.cprofile.dump_stats(path)
+
+profiler = Profiler()
+
+def format_profile_summary(profiler: Profiler, top_functions: int = 10) -> str:
+    """
+    Table of the phases by total time, then the top cProfile functions and memory use when they were recorded.
+    Phases of threads running in parallel (e.g. with --pipeline) can add up to more than the run.
+    """
+    wall = profiler.wall or 1e-9
+    with profiler._lock:
+        phases = sorted(profiler.phases.items(), key=lambda item: item[1][1], reverse=True)
+        top_level = profiler.top_level
+
+    lines = [f"{'Phase':<24}{'Calls':>8}{'Total (s)':>12}{'Self (s)':>12}{'% of run':>10}"]
+    for name, (calls, total, self_time) in phases:
+        lines.append(f"{name:<24}{calls:>8}{total:>12.3f}{self_time:>12.3f}{total / wall:>10.1%}")
+    other = max(profiler.wall - top_level, 0.0)
+    lines.append(f"{'(outside phases)':<24}{'':>8}{other:>12.3f}{other:>12.3f}{other / wall:>10.1%}")
+    lines.append(f"{'run':<24}{'':>8}{profiler.wall:>12.3f}")
+
+    if profiler.cprofile is not None:
+        stream = io.StringIO()
+        pstats.Stats(profiler.cprofile, stream=stream).sort_stats("cumulative").print_stats(top_functions)
+        lines.append("")
+        lines.append(stream.getvalue().strip())
+
+    if profiler.memory is not None:
+        lines.append("")
+        lines.append(f"Memory: peak {profiler.memory['peak'] / 2**20:.1f} MiB, at the end {profiler.memory['current'] / 2**20:.1f} MiB")
+        for location, size, count in profiler.memory["top"]:
+            lines.append(f"  {size / 2**10:>10.1f} KiB in {count:>6} blocks  {location}")
+    return "\n".join(lines)
@@ -0,0 +1,166 @@
+"""
+Progress tracking for Worker iterations.
+
+An iteration counts as progress when it leaves the task list or the workspace files in a state that
+has not been seen before, or when its tool calls produced outcomes not seen before. Returning to an
+earlier state (e.g. flipping done_flg back and forth) is therefore not progress.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.constants import GPT_WORKER_DIR, MAX_ITERATIONS, STAGNATION_WINDOW
+from gpt_worker.wire import decode_tool_result
+
+# Measurements that differ between runs of the same command
+MEASUREMENT_FIELDS = ("cpu_seconds", "peak_rss_mb")
+
+def hash_tasklist(tasklist: List[Dict]) -> str:
+    """
+    Hashes the full content of the task list, so edits of next_step or descriptions are detected too.
+    """
+    return hashlib.sha256(json.dumps(tasklist, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def hash_workspace(workspace_dir: str) -> str:
+    """
+    Hashes path, size and mtime of every file in the workspace, skipping hidden and dunder directories
+    and the gpt_worker directory (its plan and summary are covered by the task hash).
+    """
+    digest = hashlib.sha256()
+    for path, dirs, files in os.walk(workspace_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and not d.startswith("__") and d != GPT_WORKER_DIR)
+        for name in sorted(files):
+            file_path = os.path.join(path, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(file_path, workspace_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+def hash_tool_outcomes(messages: List[Dict]) -> Optional[str]:
+    """
+    Hashes the tool results of one iteration, ignoring resource measurements. Returns None when no tool was called.
+    """
+    outcomes = []
+    for message in messages:
+        if message.get("role") != "tool":
+            continue
+        result = decode_tool_result(message["content"])
+        outcomes.append(json.dumps({k: v for k, v in result.items() if k not in MEASUREMENT_FIELDS}, sort_keys=True))
+    if not outcomes:
+        return None
+    return hashlib.sha256("\0".join(outcomes).encode("utf-8")).hexdigest()
+
+class ProgressTracker:
+    """
+    Decides when a Worker run should stop and explains why.
+
+    Attributes:
+        stop_reason: None while running, then one of "completed", "max_iterations", "token_budget",
+            "time_budget" or "stagnation"
+        explanation: Human-readable reason the run stopped
+    """
+
+    def __init__(
+        self,
+        dataholder: DataHolder,
+        max_iterations: int = MAX_ITERATIONS,
+        stagnation_window: int = STAGNATION_WINDOW,
+        token_budget: Optional[int] = None,
+        time_budget: Optional[float] = None,
+    ):
+        self.dataholder = dataholder
+        self.max_iterations = max_iterations
+        self.stagnation_window = stagnation_window
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+
+        self.iterations = 0
+        self.stagnant_iterations = 0
+        self.revisited = False
+        self.stop_reason: Optional[str] = None
+        self.explanation = ""
+
+        self._started_at = time.monotonic()
+        self._usage_start = len(dataholder.usage_log)
+        self._last_state = self._state()
+        self._seen_states: Set[Tuple[str, str]] = {self._last_state}
+        self._seen_outcomes: Set[str] = set()
+
+    def _state(self) -> Tuple[str, str]:
+        watcher = self.dataholder.watcher
+        workspace = watcher.fingerprint() if watcher is not None else hash_workspace(self.dataholder.workspace_dir)
+        return hash_tasklist(self.dataholder.tasklist), workspace
+
+    @property
+    def tokens_used(self) -> int:
+        usage_log = self.dataholder.usage_log[self._usage_start:]
+        return sum(record["prompt_tokens"] + record["completion_tokens"] for record in usage_log)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started_at
+
+    def record_iteration(self, messages: List[Dict]) -> bool:
+        """
+        Records the outcome of one iteration given the messages it produced. Returns whether it made progress.
+        """
+        self.iterations += 1
+        state = self._state()
+        outcomes = hash_tool_outcomes(messages)
+
+        new_state = state not in self._seen_states
+        new_outcomes = outcomes is not None and outcomes not in self._seen_outcomes
+        self.revisited = state != self._last_state and not new_state
+
+        self._seen_states.add(state)
+        if outcomes is not None:
+            self._seen_outcomes.add(outcomes)
+        self._last_state = state
+
+        if new_state or new_outcomes:
+            self.stagnant_iterations = 0
+            return True
+        self.stagnant_iterations += 1
+        return False
+
+    def _stop(self, reason: str, explanation: str) -> bool:
+        self.stop_reason = reason
+        self.explanation = explanation
+        return True
+
+    def should_stop(self) -> bool:
+        """
+        Checks the stop conditions before the next iteration. Sets stop_reason and explanation when stopping.
+        """
+        if self.iterations >= self.max_iterations:
+            return self._stop(
+                "max_iterations",
+                f"Warning: Reached maximum number of iterations ({self.max_iterations}). Stopping execution to prevent infinite loop. Some tasks may remain incomplete.",
+            )
+        if not self.dataholder.find_task({"done_flg": False}):
+            return self._stop("completed", "All tasks are completed.")
+        if self.token_budget is not None and self.tokens_used >= self.token_budget:
+            return self._stop(
+                "token_budget",
+                f"Warning: Token budget exhausted ({self.tokens_used} of {self.token_budget} tokens used). Stopping execution. Some tasks may remain incomplete.",
+            )
+        if self.time_budget is not None and self.elapsed >= self.time_budget:
+            return self._stop(
+                "time_budget",
+                f"Warning: Time budget exhausted ({self.elapsed:.0f} of {self.time_budget:.0f} seconds used). Stopping execution. Some tasks may remain incomplete.",
+            )
+        if self.stagnant_iterations >= self.stagnation_window:
+            detail = (
+                "The task list and workspace returned to an earlier state."
+                if self.revisited
+                else "Task contents, workspace files and tool outcomes did not change."
+            )
+            return self._stop(
+                "stagnation",
+                f"Warning: No progress detected in tasks between iterations for {self.stagnant_iterations} iteration(s). {detail} Stopping execution to prevent infinite loop.",
+            )
+        return False
@@ -0,0 +1,202 @@
+"""
+Prompt builders for the agents.
+
+Messages are laid out as a stable prefix followed by the volatile context. The system message
+holds the role and all static instructions and never changes within a workspace. The user
+messages that follow carry the order, state summary, task list and directory structure, ordered
+from least to most volatile. Together with the fixed tool schemas, this keeps the prefix
+byte-identical between turns and runs, so provider-side prompt caching can reuse it.
+"""
+import os
+from typing import Dict, List, Optional
+from gpt_worker.constants import TASKLIST_FRONTIER, WATCH_MAX_CHANGES
+from gpt_worker.dataholder import DataHolder
+
+PLANNER_SYSTEM_PROMPT = (
+    "You are a diligent worker good at making detailed plans. Use the supplied tools to assist the user.\n"
+    "Read the important files in the workspace directory. Use MultiFileReader tool to read several files (or glob patterns) in one call, and FileReader tool for a single file. Repeat this until you understand what is going on in the directory.\n"
+    "To see which classes and functions a file or directory contains, use OutlineReader tool instead of reading whole files. "
+    "To find where a name or text appears, use CodeSearch tool instead of reading files.\n"
+    "Then using StateUpdater tool, write a summary of what is going on in the directory.\n"
+    "Then using PlanMaker tool, make a plan that completes expected purpose of your work.\n"
+    "The user gives you the current situation and task list. If you think these are enough to perform your work, do not change these.\n"
+    "If tasks are all completed, delete all of them and make a new plan that makes progress.\n"
+    "Completed tasks may be listed by id and name only; keep them with done_flg true when you rewrite the plan.\n"
+    "The user also gives you the structure of the directory. Each line means ('path', ['files'], ['directories'])."
+)
+
+WORKER_SYSTEM_PROMPT = (
+    "You are a diligent worker working on Linux system directory :`{workspace_dir}`. Use the supplied tools to assist the user.\n"
+    "First, check whether you understand the current situation. If not, use tools to explore the directory until you understand. When you need several files, read them in one call with MultiFileReader tool. "
+    "To see which classes and functions a file or directory contains, use OutlineReader tool instead of reading whole files. "
+    "To find where a name or text appears, use CodeSearch tool instead of reading files.\n"
+    "Then, work on the task using tools. If possible, do not ask the user anything. Do your work as far as you can.\n"
+    "At the end of your work, update the situation of the task using PlanMaker, and update the current situation using StateUpdater if needed. "
+    "Make sure to set done_flg to true for tasks that are actually completed. "
+    "Completed tasks may be listed by id and name only; keep them with done_flg true when you rewrite the plan.\n"
+    "The user gives you the current situation and your plan of task. Focus on completing the remaining incomplete tasks."
+)
+
+class TaskListView:
+    """
+    How task lists are rendered in prompts.
+
+    Tasks are rendered as a table with one row per task and one column per field, so keys are not
+    repeated for every task. The compact view (the default) shows completed tasks as one line of ids
+    and names, gives the first `frontier` incomplete tasks a row each, and lists the incomplete tasks
+    after them by id and name only.
+
+    Attributes:
+        frontier: Number of incomplete tasks rendered in full, or None for all of them
+        fold_done: Whether completed tasks are folded into one line
+    """
+
+    def __init__(self, frontier: Optional[int] = TASKLIST_FRONTIER, fold_done: bool = True):
+        self.frontier = frontier
+        self.fold_done = fold_done
+
+    @classmethod
+    def full(cls) -> "TaskListView":
+        """
+        Every task in full, including completed ones.
+        """
+        return cls(frontier=None, fold_done=False)
+
+    @staticmethod
+    def _cell(value) -> str:
+        return str(value).replace("\n", " ").replace("|", "/")
+
+    def render(self, tasklist: List[Dict]) -> str:
+        if not tasklist:
+            return "(no tasks)\n"
+
+        done = [task for task in tasklist if task.get("done_flg")]
+        if self.fold_done:
+            rows = [task for task in tasklist if not task.get("done_flg")]
+        else:
+            rows = list(tasklist)
+        later: List[Dict] = []
+        if self.frontier is not None:
+            pending = [task for task in rows if not task.get("done_flg")]
+            later = pending[self.frontier:]
+            later_ids = {id(task) for task in later}
+            rows = [task for task in rows if id(task) not in later_ids]
+
+        lines = []
+        if self.fold_done:
+            lines.append(f"{len(done)} of {len(tasklist)} tasks done" + (
+                ": " + ", ".join(f"#{task.get('task_id')} {self._cell(task.get('name', ''))}" for task in done) if done else ""
+            ))
+        if rows:
+            columns = ["done_flg"] if not self.fold_done else []
+            skipped = {"task_id", "done_flg"}
+            for key in ("name", "next_step", "description"):
+                if any(key in task for task in rows):
+                    columns.append(key)
+            for task in rows:
+                columns += [key for key in task if key not in columns and key not in skipped]
+            lines.append("|".join(["task_id"] + columns))
+            for task in rows:
+                lines.append("|".join([str(task.get("task_id"))] + [self._cell(task.get(key, "")) for key in columns]))
+        if later:
+            lines.append("Later tasks: " + ", ".join(f"#{task.get('task_id')} {self._cell(task.get('name', ''))}" for task in later))
+        return "\n".join(lines) + "\n"
+
+def format_tasklist(tasklist: List[Dict], view: Optional[TaskListView] = None) -> str:
+    """
+    Renders the task list with the given view (the compact view by default).
+    """
+    return (view or TaskListView()).render(tasklist)
+
+def format_directory_structure(workspace_dir: str, watcher=None) -> str:
+    """
+    Lists the workspace as ('path', ['files'], ['directories']) lines, skipping hidden and dunder directories.
+    Entries are sorted so that an unchanged workspace always renders to the same text.
+    With a WorkspaceWatcher, its snapshot is listed instead of walking the directory again.
+    """
+    lines = []
+    for path, dirs, files in (watcher.walk() if watcher is not None else os.walk(workspace_dir)):
+        dirs.sort()
+        files.sort()
+        if ("/." in path) or ("/__" in path):
+            continue
+        lines.append(str((path, dirs, files)) + "\n")
+    return "".join(lines)
+
+def build_planner_messages(dataholder: DataHolder, order: str = "", tasklist_view: Optional[TaskListView] = None) -> List[Dict]:
+    """
+    Builds the Planner conversation: static system prompt, then the order, then the workspace context.
+    """
+    if order == "":
+        order = "Expect purpose of your work, then make a plan that completes it."
+    else:
+        order = "Follow instruction below:\n" + order
+
+    context = (
+        "current situation:\n"
+        + dataholder.state_summary
+        + "\n---\n"
+        "task list:\n"
+        + format_tasklist(dataholder.tasklist, tasklist_view)
+        + "---\n"
+        "structure of the directory:\n"
+        + format_directory_structure(dataholder.workspace_dir, dataholder.watcher)
+    )
+
+    return [
+        {"role": "system", "content": PLANNER_SYSTEM_PROMPT},
+        {"role": "user", "content": order},
+        {"role": "user", "content": context},
+    ]
+
+def format_changed_paths(changed_paths: List[str], max_paths: int = WATCH_MAX_CHANGES) -> str:
+    """
+    Lists changed workspace paths, one per line, up to max_paths.
+    """
+    lines = "".join(f"- {path}\n" for path in changed_paths[:max_paths])
+    if len(changed_paths) > max_paths:
+        lines += f"- ... and {len(changed_paths) - max_paths} more\n"
+    return lines
+
+def build_worker_messages(
+    dataholder: DataHolder,
+    order: str = "",
+    carried_over: str = "",
+    changed_paths: Optional[List[str]] = None,
+    tasklist_view: Optional[TaskListView] = None,
+) -> List[Dict]:
+    """
+    Builds one Worker iteration: static system prompt, then the order (if any), then what was carried over
+    from previous iterations (if any), then the current situation and plan, followed by the files changed
+    since the previous iteration when they are known.
+    """
+    messages = [
+        {"role": "system", "content": WORKER_SYSTEM_PROMPT.format(workspace_dir=dataholder.workspace_dir)},
+    ]
+    if order:
+        messages.append({"role": "user", "content": "Follow instruction below:\n" + order})
+    if carried_over:
+        messages.append({"role": "user", "content": (
+            "Below is what you already read and did in previous iterations. "
+            "You already know this, so do not explore these files again unless you need more than what is shown.\n"
+            "---\n"
+            + carried_over
+        )})
+
+    context = (
+        "Current situation is below:\n"
+        "---\n"
+        + dataholder.state_summary
+        + "\n---\n"
+        "Your plan of task is below:\n"
+        "---\n"
+        + format_tasklist(dataholder.tasklist, tasklist_view)
+    )
+    if changed_paths:
+        context += (
+            "\n---\n"
+            "Files created, modified or deleted since your previous iteration:\n"
+            + format_changed_paths(changed_paths)
+        )
+    messages.append({"role": "user", "content": context})
+    return messages
@@ -0,0 +1,138 @@
+"""
+Model routing per agent role and per turn.
+
+Routes:
+    planner         every Planner turn
+    worker_explore  Worker turns that follow read-only tool calls (FileReader, `ls`, ...)
+    worker_edit     all other Worker turns, including the first turn of each iteration
+
+Routes that are not configured use the model passed to the agent, so an empty policy behaves
+exactly like running everything on one model.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from gpt_worker import codec
+from gpt_worker.approval import READ_ONLY_COMMANDS, REDIRECTIONS, SAFE_TARGETS, normalize_command, split_commands, unwrap_command
+from gpt_worker.constants import ROUTING_FILE
+from gpt_worker.history import tool_call_function
+
+ROUTES = ("planner", "worker_explore", "worker_edit")
+
+# Tools that only look at the workspace
+READ_ONLY_TOOLS = {"FileReader", "MultiFileReader", "OutlineReader", "CodeSearch"}
+
+# Options that make a read-only command write or run something
+WRITING_OPTIONS = {
+    "find": {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"},
+    "tree": {"-o"},
+}
+
+class RoutingError(Exception):
+    """Raised when a routing configuration is invalid"""
+    pass
+
+def is_read_only_command(words: List[str]) -> bool:
+    """
+    Whether one command of a script (as split by approval.split_commands) only reads the workspace.
+    Wrappers such as `timeout 5` are looked through, and output redirections other than to /dev/null
+    or another descriptor count as writes.
+    """
+    command = normalize_command(unwrap_command(words))
+    if command[0] not in READ_ONLY_COMMANDS:
+        return False
+    if any(word in WRITING_OPTIONS.get(command[0], ()) for word in command[1:]):
+        return False
+    for index, word in enumerate(words):
+        if word in REDIRECTIONS and word not in ("<", "<&"):
+            target = words[index + 1] if index + 1 < len(words) else ""
+            if target not in SAFE_TARGETS and not (word == ">&" and target.isdigit()):
+                return False
+    return True
+
+def is_read_only_call(tool_call) -> bool:
+    """
+    Whether a tool call only reads the workspace.
+    """
+    name, arguments = tool_call_function(tool_call)
+    if name in READ_ONLY_TOOLS:
+        return True
+    if name != "ScriptExecutor":
+        return False
+    try:
+        script = codec.loads(arguments).get("script", "")
+        # Substitutions run commands that the split below does not see
+        if any(marker in script for marker in ("$(", "`", "<(", ">(")):
+            return False
+        return all(is_read_only_command(command) for command in split_commands(script))
+    except (ValueError, AttributeError):
+        return False
+
+class RoutingPolicy:
+    """
+    Picks the model for each turn.
+
+    Attributes:
+        routes: route name -> model
+        fallback_model: model to retry with when the routed model fails
+    """
+
+    def __init__(self, routes: Optional[Dict[str, str]] = None, fallback_model: Optional[str] = None):
+        routes = routes or {}
+        for route in routes:
+            if route not in ROUTES:
+                raise RoutingError(f"Unknown route: {route} (expected one of {', '.join(ROUTES)})")
+        self.routes = dict(routes)
+        self.fallback_model = fallback_model
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "RoutingPolicy":
+        config = dict(config)
+        fallback_model = config.pop("fallback", None)
+        return cls(routes=config, fallback_model=fallback_model)
+
+    @classmethod
+    def load(cls, workspace_dir: str, options: Iterable[str] = ()) -> "RoutingPolicy":
+        """
+        Loads the routing file of the workspace, then applies `route=model` options on top of it.
+        """
+        config: Dict[str, str] = {}
+        routing_file = os.path.join(workspace_dir, ROUTING_FILE)
+        if os.path.isfile(routing_file):
+            with open(routing_file, encoding="utf-8") as f:
+                config.update(json.loads(f.read()))
+        for option in options:
+            route, sep, model = option.partition("=")
+            if not sep or not model:
+                raise RoutingError(f"Invalid route option: {option} (expected route=model)")
+            config[route.strip()] = model.strip()
+        return cls.from_config(config)
+
+    def route_for(self, role: str, messages: List[Dict]) -> str:
+        """
+        Classifies the next turn of an agent with the given role.
+        """
+        if role == "planner":
+            return "planner"
+        for message in reversed(messages):
+            if message["role"] == "user":
+                break
+            if message["role"] == "assistant" and message.get("tool_calls"):
+                if all(is_read_only_call(tool_call) for tool_call in message["tool_calls"]):
+                    return "worker_explore"
+                break
+        return "worker_edit"
+
+    def select(self, role: str, messages: List[Dict], default_model: str) -> Tuple[str, str]:
+        """
+        Returns (route, model) for the next turn.
+        """
+        route = self.route_for(role, messages)
+        return route, self.routes.get(route, default_model)
+
+    def fallback_for(self, model: str, default_model: str) -> Optional[str]:
+        """
+        Returns the model to retry with after `model` failed, or None when there is nothing else to try.
+        """
+        fallback = self.fallback_model or default_model
+        return fallback if fallback != model else None
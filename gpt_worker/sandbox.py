@@ -0,0 +1,236 @@
+"""
+Resource-limited execution of ScriptExecutor commands.
+
+Commands run in their own process group, so a timeout or a cancelled run kills everything they started. With
+SandboxLimits they additionally run with lower CPU and I/O priority and with rlimits on CPU time,
+address space, file size and number of processes, and optionally inside new Linux namespaces
+(user, network, PID and mount) through `unshare`. The CPU time and peak RSS of every command are
+measured with `os.wait4` and reported back in the tool result.
+"""
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+from typing import List, Optional, Tuple
+from gpt_worker.cancellation import CancelToken
+from gpt_worker.constants import (
+    COMMAND_TIMEOUT,
+    SANDBOX_CPU_SECONDS,
+    SANDBOX_FILE_SIZE_BYTES,
+    SANDBOX_MAX_PROCESSES,
+    SANDBOX_MEMORY_BYTES,
+    SANDBOX_NICE,
+)
+
+# Namespaces entered with SandboxLimits(unshare=True); the command sees no network and only its own processes
+UNSHARE_COMMAND = ["unshare", "--user", "--map-root-user", "--net", "--pid", "--fork", "--mount-proc"]
+
+# Run as `python -c LIMITS_WRAPPER NICE NAME:SOFT:HARD,... COMMAND...`: applies the niceness and rlimits, then execs COMMAND
+LIMITS_WRAPPER = """
+import os, resource, sys
+nice, limits, command = int(sys.argv[1]), sys.argv[2], sys.argv[3:]
+if nice:
+    os.nice(nice)
+for limit in filter(None, limits.split(",")):
+    name, soft, hard = limit.split(":")
+    resource.setrlimit(getattr(resource, name), (int(soft), int(hard)))
+os.execvp(command[0], command)
+"""
+
+# Signals sent by the kernel when an rlimit is exceeded
+LIMIT_SIGNALS = {"SIGXCPU": "CPU time limit exceeded", "SIGXFSZ": "file size limit exceeded"}
+
+class SandboxError(Exception):
+    """Raised when a sandbox cannot be set up as requested"""
+    pass
+
+class SandboxLimits:
+    """
+    Limits applied to each command. A limit set to None is left as inherited.
+
+    Attributes:
+        cpu_seconds: CPU time (RLIMIT_CPU); the command gets SIGXCPU, then SIGKILL 5 seconds later
+        memory_bytes: Address space (RLIMIT_AS); off by default, as it also counts memory reserved but not used
+        file_size_bytes: Size of any file written (RLIMIT_FSIZE)
+        max_processes: Processes of the user (RLIMIT_NPROC); off by default, as they are counted across the host
+        nice: Niceness added to the command
+        ionice: Run with best-effort I/O priority 7 when the `ionice` command is available
+        unshare: Run in new user, network, PID and mount namespaces
+    """
+
+    def __init__(
+        self,
+        cpu_seconds: Optional[int] = SANDBOX_CPU_SECONDS,
+        memory_bytes: Optional[int] = SANDBOX_MEMORY_BYTES,
+        file_size_bytes: Optional[int] = SANDBOX_FILE_SIZE_BYTES,
+        max_processes: Optional[int] = SANDBOX_MAX_PROCESSES,
+        nice: int = SANDBOX_NICE,
+        ionice: bool = True,
+        unshare: bool = False,
+    ):
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.file_size_bytes = file_size_bytes
+        self.max_processes = max_processes
+        self.nice = nice
+        self.ionice = ionice
+        self.unshare = unshare
+
+    @classmethod
+    def from_options(cls, memory_mb: Optional[int] = None, max_processes: Optional[int] = None, **kwargs) -> "SandboxLimits":
+        """
+        Limits from the options of `gptw run`, `gptw queue work` and the jobs of `gptw serve`, with memory in MiB.
+        """
+        return cls(memory_bytes=memory_mb * 1024 ** 2 if memory_mb else None, max_processes=max_processes or None, **kwargs)
+
+    def command_prefix(self) -> List[str]:
+        """
+        Commands the shell is wrapped in. The first one sets the priority and rlimits and execs the rest,
+        so nothing but exec runs between fork and exec in the (possibly multi-threaded) parent.
+
+        Raises:
+            SandboxError: When namespaces are requested but `unshare` is not available
+        """
+        limits = ",".join(f"{name}:{soft}:{hard}" for name, soft, hard in self.rlimits())
+        prefix = [sys.executable, "-I", "-S", "-c", LIMITS_WRAPPER, str(self.nice), limits]
+        if self.ionice and shutil.which("ionice"):
+            prefix += ["ionice", "-c", "2", "-n", "7"]
+        if self.unshare:
+            if not shutil.which("unshare"):
+                raise SandboxError("unshare command not found; namespaces are not available on this host")
+            prefix += UNSHARE_COMMAND
+        return prefix
+
+    def rlimits(self) -> List[Tuple[str, int, int]]:
+        """
+        (resource name, soft limit, hard limit) of the rlimits to set.
+        """
+        limits = []
+        if self.cpu_seconds is not None:
+            limits.append(("RLIMIT_CPU", self.cpu_seconds, self.cpu_seconds + 5))
+        for name, value in (
+            ("RLIMIT_AS", self.memory_bytes),
+            ("RLIMIT_FSIZE", self.file_size_bytes),
+            ("RLIMIT_NPROC", self.max_processes),
+        ):
+            if value is not None:
+                limits.append((name, value, value))
+        return limits
+
+class CommandResult:
+    """
+    Outcome of one command.
+
+    Attributes:
+        returncode: Exit code, or -N when killed by signal N
+        cpu_seconds: User plus system CPU time of the command and the processes it waited for
+        peak_rss_mb: Peak resident set size in MiB
+        timed_out: Whether the command was killed for running longer than the timeout
+        cancelled: Whether the command was killed because the run was cancelled
+    """
+
+    def __init__(self, returncode: int, stdout: str, stderr: str, cpu_seconds: float, peak_rss_mb: float, timed_out: bool,
+                 cancelled: bool = False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.cpu_seconds = cpu_seconds
+        self.peak_rss_mb = peak_rss_mb
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+
+    @property
+    def signal_name(self) -> Optional[str]:
+        """
+        Name of the signal that killed the command, also when the shell reported it as exit code 128+N.
+        """
+        if self.returncode < 0:
+            number = -self.returncode
+        elif self.returncode > 128:
+            number = self.returncode - 128
+        else:
+            return None
+        try:
+            return signal.Signals(number).name
+        except ValueError:
+            return None if self.returncode > 0 else f"signal {number}"
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_command(script: str, cwd: str, timeout: float = COMMAND_TIMEOUT, limits: Optional[SandboxLimits] = None,
+                cancel: Optional[CancelToken] = None) -> CommandResult:
+    """
+    Runs a shell script, with limits when given, and measures what it used. The process group is killed
+    when the token is cancelled.
+
+    Raises:
+        SandboxError: When the requested sandbox cannot be set up
+    """
+    prefix = limits.command_prefix() if limits is not None else []
+    process = subprocess.Popen(
+        prefix + ["/bin/sh", "-c", script] if prefix else script,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=not prefix,
+        text=True,
+        cwd=cwd,
+        start_new_session=True,
+    )
+
+    output = {}
+    def read(name, stream):
+        output[name] = stream.read()
+    readers = [
+        threading.Thread(target=read, args=("stdout", process.stdout), daemon=True),
+        threading.Thread(target=read, args=("stderr", process.stderr), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timed_out = threading.Event()
+    def expire():
+        timed_out.set()
+        _kill_group(process.pid)
+    timer = threading.Timer(timeout, expire)
+    timer.start()
+    cancelled = threading.Event()
+    def abort():
+        cancelled.set()
+        _kill_group(process.pid)
+    unregister = cancel.on_cancel(abort) if cancel is not None else None
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    finally:
+        timer.cancel()
+        if unregister is not None:
+            unregister()
+    # Popen must not wait for the pid again
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+    # Background processes still holding the pipes would block the readers forever
+    for reader in readers:
+        reader.join(timeout=1)
+    if any(reader.is_alive() for reader in readers):
+        _kill_group(process.pid)
+        for reader in readers:
+            reader.join(timeout=1)
+    if not any(reader.is_alive() for reader in readers):
+        process.stdout.close()
+        process.stderr.close()
+
+    peak_rss = usage.ru_maxrss / 1024 if sys.platform != "darwin" else usage.ru_maxrss / (1024 * 1024)
+    return CommandResult(
+        returncode=process.returncode,
+        stdout=output.get("stdout", ""),
+        stderr=output.get("stderr", ""),
+        cpu_seconds=usage.ru_utime + usage.ru_stime,
+        peak_rss_mb=peak_rss,
+        timed_out=timed_out.is_set(),
+        cancelled=cancelled.is_set(),
+    )
@@ -0,0 +1,217 @@
+"""
+Persistent token inverted index of a workspace, used by the CodeSearch tool.
+
+The index maps every identifier-like token (and the parts of snake_case / CamelCase identifiers) to the
+files and line numbers it appears on. It is stored under `.gpt_worker/index` and updated incrementally:
+only files whose mtime or size changed since the last update are re-read.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+from gpt_worker.constants import GPT_WORKER_DIR, INDEX_DIR, INDEX_MAX_FILE_BYTES, SEARCH_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_FILENAME = "index.json"
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+_CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+class SearchIndexError(Exception):
+    """Raised when the search index cannot be read or written"""
+    pass
+
+def tokenize(text: str) -> Set[str]:
+    """
+    Splits text into lowercase tokens. Identifiers also yield their snake_case and CamelCase parts,
+    so `CreateResponse` matches a search for "response".
+    """
+    tokens = set()
+    for word in _IDENTIFIER.findall(text):
+        tokens.add(word.lower())
+        for part in word.split("_"):
+            for sub in _CAMEL_PART.findall(part):
+                tokens.add(sub.lower())
+    return {token for token in tokens if len(token) >= 2}
+
+def iter_workspace_files(workspace_dir: str) -> Iterable[str]:
+    """
+    Yields paths (relative to the workspace) of files to index, skipping hidden and dunder directories.
+    """
+    for path, dirs, files in os.walk(workspace_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(".") and not d.startswith("__") and d != GPT_WORKER_DIR)
+        for name in sorted(files):
+            if name.startswith("."):
+                continue
+            yield os.path.relpath(os.path.join(path, name), workspace_dir)
+
+class SearchIndex:
+    """
+    Inverted index of one workspace.
+
+    Attributes:
+        files: relative path -> {"mtime": mtime_ns, "size": bytes, "tokens": [tokens in the file]}
+        postings: token -> {relative path: [line numbers]}
+    """
+
+    # Open indexes by absolute workspace path, shared between tool calls
+    _open_indexes: Dict[str, "SearchIndex"] = {}
+    _open_lock = threading.Lock()
+
+    def __init__(self, workspace_dir: str):
+        self.workspace_dir = workspace_dir
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(workspace_dir, INDEX_DIR, INDEX_FILENAME)
+        self.files: Dict[str, Dict] = {}
+        self.postings: Dict[str, Dict[str, List[int]]] = {}
+
+    @classmethod
+    def open(cls, workspace_dir: str) -> "SearchIndex":
+        """
+        Returns the index of the workspace, brought up to date. The stored index is loaded on first use
+        and kept in memory afterwards.
+        """
+        key = os.path.abspath(workspace_dir)
+        with cls._open_lock:
+            index = cls._open_indexes.get(key)
+            if index is None:
+                index = cls(workspace_dir)
+                index.load()
+                cls._open_indexes[key] = index
+        with index.lock:
+            if any(index.update()):
+                index.save()
+        return index
+
+    def load(self) -> None:
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable search index {self.index_path}: {e}")
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        self.files = data["files"]
+        self.postings = data["postings"]
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, mode="w", encoding="utf-8") as f:
+                f.write(json.dumps({"version": INDEX_VERSION, "files": self.files, "postings": self.postings}))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            raise SearchIndexError(f"Error writing search index: {e}")
+
+    def _remove(self, rel_path: str) -> None:
+        for token in self.files.pop(rel_path, {}).get("tokens", []):
+            paths = self.postings.get(token)
+            if paths is None:
+                continue
+            paths.pop(rel_path, None)
+            if not paths:
+                del self.postings[token]
+
+    def _add(self, rel_path: str, stat: os.stat_result) -> None:
+        entry = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "tokens": []}
+        self.files[rel_path] = entry
+        if stat.st_size > INDEX_MAX_FILE_BYTES:
+            return
+        try:
+            with open(os.path.join(self.workspace_dir, rel_path), "rb") as f:
+                raw = f.read()
+        except OSError:
+            return
+        if b"\0" in raw[:1024]:
+            return  # binary file
+
+        file_tokens: Dict[str, List[int]] = {}
+        for line_no, line in enumerate(raw.decode("utf-8", errors="replace").splitlines(), 1):
+            for token in tokenize(line):
+                file_tokens.setdefault(token, []).append(line_no)
+        for token, lines in file_tokens.items():
+            self.postings.setdefault(token, {})[rel_path] = lines
+        entry["tokens"] = sorted(file_tokens)
+
+    def update(self) -> Tuple[int, int]:
+        """
+        Re-indexes new and modified files and drops deleted ones. Returns (indexed, removed) counts.
+        """
+        seen = set()
+        indexed = 0
+        for rel_path in iter_workspace_files(self.workspace_dir):
+            seen.add(rel_path)
+            try:
+                stat = os.stat(os.path.join(self.workspace_dir, rel_path))
+            except OSError:
+                continue
+            entry = self.files.get(rel_path)
+            if entry and entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                continue
+            self._remove(rel_path)
+            self._add(rel_path, stat)
+            indexed += 1
+
+        removed = [rel_path for rel_path in self.files if rel_path not in seen]
+        for rel_path in removed:
+            self._remove(rel_path)
+
+        if indexed or removed:
+            logger.info(f"Search index updated: {indexed} files indexed, {len(removed)} removed")
+        return indexed, len(removed)
+
+    def search(self, query: str, max_bytes: int = SEARCH_MAX_BYTES, max_results: int = 50) -> List[Dict]:
+        """
+        Ranks lines by the idf-weighted query tokens they contain, with a bonus for files that match
+        many query tokens. Returns results with path, line, score and snippet, within max_bytes of snippets.
+        """
+        query_tokens = [token for token in tokenize(query) if token in self.postings]
+        if not query_tokens:
+            return []
+
+        file_count = max(len(self.files), 1)
+        idf = {token: math.log(1 + file_count / len(self.postings[token])) for token in query_tokens}
+
+        line_scores: Dict[Tuple[str, int], float] = {}
+        file_scores: Dict[str, float] = {}
+        for token in query_tokens:
+            for rel_path, lines in self.postings[token].items():
+                file_scores[rel_path] = file_scores.get(rel_path, 0.0) + idf[token]
+                for line_no in lines:
+                    key = (rel_path, line_no)
+                    line_scores[key] = line_scores.get(key, 0.0) + idf[token]
+
+        ranked = sorted(
+            line_scores.items(),
+            key=lambda item: (-(item[1] + 0.1 * file_scores[item[0][0]]), item[0]),
+        )
+
+        results = []
+        used = 0
+        line_cache: Dict[str, List[str]] = {}
+        for (rel_path, line_no), score in ranked[:max_results * 4]:
+            if rel_path not in line_cache:
+                try:
+                    with open(os.path.join(self.workspace_dir, rel_path), encoding="utf-8", errors="replace") as f:
+                        line_cache[rel_path] = f.read().splitlines()
+                except OSError:
+                    line_cache[rel_path] = []
+            lines = line_cache[rel_path]
+            if line_no > len(lines):
+                continue
+            snippet = lines[line_no - 1].strip()[:200]
+            size = len(rel_path) + len(snippet) + 10
+            if used + size > max_bytes or len(results) >= max_results:
+                break
+            used += size
+            results.append({"path": rel_path, "line": line_no, "score": round(score, 3), "snippet": snippet})
+        return results
@@ -0,0 +1,551 @@
+"""
+Long-running gptw daemon exposing a local HTTP job API.
+
+Jobs run the Orchestrator inside one warm process, so the OpenAI client, tool schemas
+and caches are shared between jobs instead of being rebuilt by every `gptw run`.
+
+Endpoints:
+    GET  /health              -> {"status": "ok"}
+    GET  /jobs                -> list of job statuses
+    POST /jobs                -> submit a job ({"order", "model", "directory", "sandbox_memory", "sandbox_max_processes"})
+    GET  /jobs/<id>           -> job status
+    POST /jobs/<id>/cancel    -> cancel a queued or running job
+    GET  /jobs/<id>/events    -> message events as Server-Sent Events
+    GET  /approvals           -> commands waiting for approval
+    POST /approvals/<id>      -> answer an approval request ({"approve": true|false})
+
+Finished jobs are kept for SERVER_JOB_TTL seconds, at most SERVER_MAX_FINISHED_JOBS of them, and only
+the last SERVER_MAX_JOB_EVENTS events of a job are kept, so a long-lived daemon does not grow without bound.
+
+Commands that need approval wait in the ApprovalQueue of the JobManager; only the job that ran
+them is blocked until they are answered.
+
+Every endpoint but /health needs the token of the daemon (`Authorization: Bearer <token>`), which
+`gptw serve` writes to a file only the user can read. Requests whose Host is not a loopback address
+or an IP literal, or whose Origin is not the daemon itself, are refused, so a web page cannot reach
+the daemon through DNS rebinding; POST bodies must be sent as application/json.
+"""
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from functools import partial
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from gpt_worker.approval import ApprovalNotFoundError, ApprovalPolicy, ApprovalQueue, unattended_approver
+from gpt_worker.cancellation import CancelledError, CancelToken
+from gpt_worker.constants import (
+    DEFAULT_MODEL,
+    DEFAULT_SERVER_HOST,
+    DEFAULT_SERVER_PORT,
+    SERVER_JOB_TTL,
+    SERVER_MAX_FINISHED_JOBS,
+    SERVER_MAX_JOB_EVENTS,
+    SERVER_MAX_JOBS,
+    SERVER_TOKEN_ENV,
+    SERVER_TOKEN_FILE,
+)
+from gpt_worker.dataholder import DataHolder
+
+logger = logging.getLogger(__name__)
+
+# Optional integer fields of POST /jobs, passed to the runner: memory limit in MiB and process limit of ScriptExecutor
+JOB_OPTIONS = ("sandbox_memory", "sandbox_max_processes")
+
+class ServerError(Exception):
+    """Base exception class for Server errors"""
+    pass
+
+class JobNotFoundError(ServerError):
+    """Raised when a job is not found"""
+    pass
+
+def token_file(port: int) -> str:
+    """Path of the token file of the daemon listening on port"""
+    return os.path.expanduser(SERVER_TOKEN_FILE.format(port=port))
+
+def write_token(path: str, token: str) -> None:
+    """Writes the token to a file only the current user can read"""
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        os.fchmod(f.fileno(), 0o600)
+        f.write(token)
+
+def read_token(base_url: str) -> Optional[str]:
+    """
+    Token for the daemon at base_url: GPTW_SERVER_TOKEN, or the token file of its port when it exists.
+    """
+    token = os.environ.get(SERVER_TOKEN_ENV)
+    if token:
+        return token
+    port = urlsplit(base_url).port or DEFAULT_SERVER_PORT
+    try:
+        with open(token_file(port), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _is_local_host(host: str) -> bool:
+    """Whether a Host header names the daemon by a loopback name or an IP literal (not a DNS name)"""
+    hostname = urlsplit(f"//{host}").hostname
+    if not hostname:
+        return False
+    if hostname == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(hostname)
+    except ValueError:
+        return False
+    return True
+
+def to_jsonable(obj: Any) -> Any:
+    """
+    JSON fallback for objects found in agent messages (e.g. SDK tool call objects).
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "__dict__"):
+        return vars(obj)
+    return str(obj)
+
+def run_orchestrator(order: str, model: str, directory: str, approver: Optional[Callable[[str, str, str], bool]] = None,
+                     sandbox_memory: Optional[int] = None, sandbox_max_processes: Optional[int] = None,
+                     cancel: Optional[CancelToken] = None) -> Iterator[Dict]:
+    """
+    Default job runner: loads the workspace, watches it and runs the Orchestrator on it with
+    ScriptExecutor commands sandboxed, so one job cannot starve the others. Commands that need
+    approval are passed to `approver`; without one they are refused, as nobody is at the console.
+    Memory (MiB) and process limits are set from the job's options, and `cancel` stops the run.
+    """
+    from gpt_worker.agents import Orchestrator
+    from gpt_worker.sandbox import SandboxLimits
+    from gpt_worker.watcher import watch_workspace
+
+    dataholder = DataHolder.from_workspace(directory)
+    dataholder.sandbox = SandboxLimits.from_options(sandbox_memory, sandbox_max_processes)
+    dataholder.approval_policy = ApprovalPolicy.load(directory)
+    dataholder.approver = approver if approver is not None else unattended_approver
+    if isinstance(approver, ApprovalQueue) and cancel is not None:
+        # A cancelled job does not keep waiting for an answer
+        dataholder.approver = partial(approver.ask, cancel=cancel)
+    watcher = watch_workspace(dataholder)
+    try:
+        yield from Orchestrator(dataholder=dataholder).run(order=order, model=model, cancel=cancel)
+    finally:
+        watcher.stop()
+
+class Job:
+    """
+    A submitted Orchestrator run and the message events it produced.
+    """
+
+    def __init__(self, order: str, model: str, directory: str, options: Optional[Dict] = None):
+        self.job_id = uuid.uuid4().hex
+        self.order = order
+        self.model = model
+        self.directory = directory
+        self.options = dict(options or {})
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.error: Optional[str] = None
+        self.cancel_token = CancelToken()
+        self.events: List[Dict] = []
+        # Number of events before events[0] that were dropped to keep at most SERVER_MAX_JOB_EVENTS
+        self.dropped_events = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def start(self) -> None:
+        with self._cond:
+            self.status = "running"
+            self.started_at = time.time()
+            self._cond.notify_all()
+
+    def append(self, event: Dict) -> None:
+        with self._cond:
+            self.events.append(json.loads(json.dumps(event, default=to_jsonable)))
+            if len(self.events) > SERVER_MAX_JOB_EVENTS:
+                dropped = len(self.events) - SERVER_MAX_JOB_EVENTS
+                del self.events[:dropped]
+                self.dropped_events += dropped
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[str] = None, cancelled: bool = False) -> None:
+        with self._cond:
+            self.status = "cancelled" if cancelled else "failed" if error else "done"
+            self.error = error
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def iter_events(self, start: int = 0, timeout: float = 1.0) -> Iterator[Dict]:
+        """
+        Yields events from index `start`, blocking until new events arrive or the job finishes.
+        Events that were dropped meanwhile are skipped.
+        """
+        index = start
+        while True:
+            with self._cond:
+                index = max(index, self.dropped_events)
+                while index >= self.dropped_events + len(self.events) and not self.finished:
+                    self._cond.wait(timeout)
+                    index = max(index, self.dropped_events)
+                pending = self.events[index - self.dropped_events:]
+                finished = self.finished
+                total = self.dropped_events + len(self.events)
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= total:
+                return
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "order": self.order,
+            "model": self.model,
+            "directory": self.directory,
+            "options": self.options,
+            "error": self.error,
+            "events": self.dropped_events + len(self.events),
+            "dropped_events": self.dropped_events,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class JobManager:
+    """
+    Runs submitted jobs on a bounded thread pool inside the daemon process.
+    """
+
+    def __init__(self, runner: Optional[Callable[..., Iterator[Dict]]] = None, max_jobs: int = SERVER_MAX_JOBS,
+                 job_ttl: float = SERVER_JOB_TTL, max_finished_jobs: int = SERVER_MAX_FINISHED_JOBS):
+        self.approvals = ApprovalQueue()
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self.runner = runner if runner is not None else partial(run_orchestrator, approver=self.approvals)
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, order: str = "", model: str = DEFAULT_MODEL, directory: str = ".", **options) -> Job:
+        """
+        Queues a job. `options` are passed to the runner as keyword arguments (e.g. sandbox_memory),
+        together with the job's CancelToken as `cancel`.
+        """
+        job = Job(order=order, model=model, directory=directory, options=options)
+        with self._lock:
+            self._evict()
+            self.jobs[job.job_id] = job
+        self.executor.submit(self._run, job)
+        logger.info(f"Job submitted: {job.job_id} ({directory})")
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise JobNotFoundError(f"Job not found: {job_id}")
+        return job
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            self._evict()
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Cancels a job: a queued job will not run, and a running one stops at its next safe point.
+
+        Raises:
+            JobNotFoundError: When there is no job with the id
+        """
+        job = self.get(job_id)
+        job.cancel_token.cancel()
+        return job
+
+    def shutdown(self) -> None:
+        """
+        Cancels the jobs that are queued or running and waits for them to stop.
+        """
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if not job.finished:
+                job.cancel_token.cancel()
+        self.executor.shutdown(wait=True)
+
+    def _evict(self) -> None:
+        """
+        Forgets finished jobs older than job_ttl and the oldest beyond max_finished_jobs. Called with the lock held.
+        """
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.finished_at or 0)
+        for index, job in enumerate(finished):
+            if now - (job.finished_at or now) > self.job_ttl or index < len(finished) - self.max_finished_jobs:
+                del self.jobs[job.job_id]
+
+    def _run(self, job: Job) -> None:
+        if job.cancel_token.cancelled:
+            job.finish(cancelled=True)
+            return
+        job.start()
+        try:
+            for message in self.runner(job.order, job.model, job.directory, cancel=job.cancel_token, **job.options):
+                job.append(message)
+        except CancelledError as e:
+            logger.info(f"Job cancelled: {job.job_id}")
+            job.finish(error=str(e), cancelled=True)
+            return
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            job.finish(error=str(e))
+            return
+        logger.info(f"Job finished: {job.job_id}")
+        job.finish()
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the job API. The JobManager is taken from the server instance.
+    """
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def manager(self) -> JobManager:
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+    def _send_json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _path_parts(self) -> List[str]:
+        return [part for part in self.path.split("?")[0].split("/") if part]
+
+    def _refused(self, parts: List[str]) -> bool:
+        """
+        Checks Host, Origin and the token of the request, answering it with an error when one fails.
+        Returns whether the request was refused.
+        """
+        host = self.headers.get("Host", "")
+        if not _is_local_host(host):
+            self._send_json(403, {"error": f"Host not allowed: {host}"})
+            return True
+        origin = self.headers.get("Origin")
+        if origin is not None and urlsplit(origin).netloc != host:
+            self._send_json(403, {"error": f"Origin not allowed: {origin}"})
+            return True
+        if parts == ["health"]:
+            return False
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode("utf-8"), self.server.token.encode("utf-8")):
+            self._send_json(401, {"error": "Missing or invalid token"})
+            return True
+        return False
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if self._refused(parts):
+            return
+        try:
+            if parts == ["health"]:
+                self._send_json(200, {"status": "ok"})
+            elif parts == ["jobs"]:
+                self._send_json(200, [job.to_dict() for job in self.manager.list()])
+            elif len(parts) == 2 and parts[0] == "jobs":
+                self._send_json(200, self.manager.get(parts[1]).to_dict())
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+                self._stream_events(self.manager.get(parts[1]))
+            elif parts == ["approvals"]:
+                self._send_json(200, [request.to_dict() for request in self.manager.approvals.pending()])
+            else:
+                self._send_json(404, {"error": f"Not found: {self.path}"})
+        except JobNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+
+    def _read_json(self) -> Dict:
+        """
+        Raises:
+            ServerError: When the body is not a JSON object sent as application/json
+        """
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            raise ServerError("Content-Type must be application/json")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ServerError("Invalid Content-Length")
+        if length < 0:
+            raise ServerError("Invalid Content-Length")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise ServerError(f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise ServerError("Body must be a JSON object")
+        return body
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if self._refused(parts):
+            return
+        if len(parts) == 2 and parts[0] == "approvals":
+            self._answer_approval(parts[1])
+            return
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            try:
+                self._send_json(200, self.manager.cancel(parts[1]).to_dict())
+            except JobNotFoundError as e:
+                self._send_json(404, {"error": str(e)})
+            return
+        if parts != ["jobs"]:
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            body = self._read_json()
+            directory = body.get("directory", ".")
+            if not os.path.isdir(directory):
+                raise ServerError(f"Directory '{directory}' does not exist")
+            options = {}
+            for name in JOB_OPTIONS:
+                if body.get(name) is not None:
+                    if not isinstance(body[name], int) or isinstance(body[name], bool) or body[name] <= 0:
+                        raise ServerError(f"'{name}' must be a positive integer")
+                    options[name] = body[name]
+            job = self.manager.submit(
+                order=body.get("order", ""),
+                model=body.get("model", DEFAULT_MODEL),
+                directory=directory,
+                **options,
+            )
+            self._send_json(201, job.to_dict())
+        except ServerError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _answer_approval(self, request_id: str) -> None:
+        try:
+            body = self._read_json()
+            if not isinstance(body.get("approve"), bool):
+                raise ServerError("'approve' must be true or false")
+            request = self.manager.approvals.resolve(request_id, body["approve"])
+            self._send_json(200, request.to_dict())
+        except ApprovalNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+        except ServerError as e:
+            self._send_json(400, {"error": str(e)})
+
+    def _stream_events(self, job: Job) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event in job.iter_events():
+                self.wfile.write(f"event: message\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(f"event: end\ndata: {json.dumps(job.to_dict())}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"Event stream closed by client: {job.job_id}")
+
+def create_server(host: str = DEFAULT_SERVER_HOST, port: int = DEFAULT_SERVER_PORT, manager: Optional[JobManager] = None,
+                  token: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Creates the daemon HTTP server. Pass port 0 to bind an ephemeral port. Clients must send `server.token`,
+    a new random one unless given.
+    """
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.manager = manager if manager is not None else JobManager()
+    server.token = token or secrets.token_urlsafe(32)
+    return server
+
+class RemoteClient:
+    """
+    Client for a running `gptw serve` daemon.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30, token: Optional[str] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = token or read_token(self.base_url)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None) -> Any:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers=self._headers(),
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ServerError(json.loads(e.read()).get("error", str(e)))
+        except urllib.error.URLError as e:
+            raise ServerError(f"Cannot reach gptw server at {self.base_url}: {e.reason}")
+
+    def submit(self, order: str = "", model: str = DEFAULT_MODEL, directory: str = ".", **options) -> Dict:
+        body = {"order": order, "model": model, "directory": directory}
+        body.update({name: value for name, value in options.items() if value is not None})
+        return self._request("POST", "/jobs", body)
+
+    def status(self, job_id: str) -> Dict:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id: str) -> Dict:
+        return self._request("POST", f"/jobs/{job_id}/cancel", {})
+
+    def approvals(self) -> List[Dict]:
+        return self._request("GET", "/approvals")
+
+    def resolve_approval(self, request_id: str, approve: bool) -> Dict:
+        return self._request("POST", f"/approvals/{request_id}", {"approve": approve})
+
+    def events(self, job_id: str) -> Iterator[Dict]:
+        """
+        Streams message events of a job until it finishes.
+        """
+        request = urllib.request.Request(f"{self.base_url}/jobs/{job_id}/events", headers=self._headers())
+        with urllib.request.urlopen(request) as response:
+            event_type = "message"
+            for raw_line in response:
+                line = raw_line.decode("utf-8").rstrip("\n")
+                if line.startswith("event: "):
+                    event_type = line[len("event: "):]
+                elif line.startswith("data: "):
+                    if event_type == "end":
+                        return
+                    yield json.loads(line[len("data: "):])
@@ -0,0 +1,238 @@
+"""
+Structured, size-bounded state summary.
+
+The state summary is kept as Markdown sections (`## Title` headings). An update that contains headings
+replaces only the sections it names and keeps the others; an update without headings replaces the
+whole summary, as before. Sections larger than their cap, or a summary larger than its total budget,
+are condensed by a small model, with truncation as the fallback. Every update is appended to a history
+file, so condensed or replaced text can still be looked up later.
+
+`state_summary.md` always holds the current condensed view, which is what the prompts carry.
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from gpt_worker.constants import (
+    STATE_SUMMARY_FILE,
+    SUMMARY_HISTORY_FILE,
+    SUMMARY_HISTORY_MAX,
+    SUMMARY_MAX_CHARS,
+    SUMMARY_MODEL,
+    SUMMARY_SECTION_MAX_CHARS,
+)
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.locking import WorkspaceLock, write_atomic
+
+logger = logging.getLogger(__name__)
+
+# Section holding text that comes before the first heading
+DEFAULT_SECTION = "Overview"
+
+# condenser(title, text, max_chars) -> text of at most max_chars characters
+Condenser = Callable[[str, str, int], str]
+
+CONDENSE_PROMPT = (
+    "You condense sections of a project state summary written by an agent for itself. "
+    "Rewrite the section below in at most {max_chars} characters. Keep facts that are still needed to continue the work: "
+    "file paths, names, decisions, open problems and next steps. Drop narration and details of finished work. "
+    "Reply with the condensed text only, without the heading."
+)
+
+def parse_sections(text: str) -> "OrderedDict[str, str]":
+    """
+    Splits a Markdown summary into sections by `## ` headings. Text before the first heading goes to DEFAULT_SECTION.
+    """
+    sections: "OrderedDict[str, str]" = OrderedDict()
+    title = DEFAULT_SECTION
+    lines: List[str] = []
+    for line in text.splitlines():
+        if line.startswith("## "):
+            if lines or title != DEFAULT_SECTION:
+                sections[title] = "\n".join(lines).strip()
+            title = line[3:].strip() or DEFAULT_SECTION
+            lines = []
+        else:
+            lines.append(line)
+    if lines or title != DEFAULT_SECTION:
+        sections[title] = "\n".join(lines).strip()
+    return sections
+
+def render_sections(sections: Dict[str, str]) -> str:
+    """
+    Renders sections back to Markdown. A summary with only DEFAULT_SECTION renders as plain text.
+    """
+    if list(sections) == [DEFAULT_SECTION]:
+        return sections[DEFAULT_SECTION]
+    return "\n\n".join(f"## {title}\n{body}" if body else f"## {title}" for title, body in sections.items())
+
+def truncate_condenser(title: str, text: str, max_chars: int) -> str:
+    """
+    Keeps the first lines of a section that fit in max_chars.
+    """
+    if len(text) <= max_chars:
+        return text
+    marker = "\n(condensed)"
+    kept = text[:max(max_chars - len(marker), 0)]
+    if "\n" in kept:
+        kept = kept[:kept.rindex("\n")]
+    return kept + marker
+
+def llm_condenser(dataholder: Optional[DataHolder] = None, model: str = SUMMARY_MODEL) -> Condenser:
+    """
+    Returns a condenser that asks `model` to rewrite a section shorter. Usage is recorded on the
+    DataHolder under the "summary" route. Falls back to truncation when the call fails.
+    """
+    def condense(title: str, text: str, max_chars: int) -> str:
+        from gpt_worker.connector import OpenAIConnector
+        from gpt_worker.telemetry import usage_from_response
+
+        try:
+            started = time.perf_counter()
+            response = OpenAIConnector.get_client().chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": CONDENSE_PROMPT.format(max_chars=max_chars)},
+                    {"role": "user", "content": f"## {title}\n{text}"},
+                ],
+            )
+            if dataholder is not None:
+                dataholder.usage_log.append(usage_from_response(response, model, route="summary", latency=time.perf_counter() - started))
+            condensed = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            logger.warning(f"Failed to condense section '{title}' with {model}: {e}. Truncating instead")
+            condensed = text
+        return truncate_condenser(title, condensed, max_chars)
+
+    return condense
+
+class SummaryStore:
+    """
+    Reads, updates and condenses the state summary of a workspace.
+
+    Attributes:
+        section_max_chars: Size cap of each section
+        max_chars: Size budget of the whole summary
+        condensed: Whether the last update had to be condensed
+    """
+
+    def __init__(
+        self,
+        workspace_dir: str,
+        condenser: Optional[Condenser] = None,
+        section_max_chars: int = SUMMARY_SECTION_MAX_CHARS,
+        max_chars: int = SUMMARY_MAX_CHARS,
+    ):
+        self.workspace_dir = workspace_dir
+        self.condenser = condenser or truncate_condenser
+        self.section_max_chars = section_max_chars
+        self.max_chars = max_chars
+        self.summary_file = os.path.join(workspace_dir, STATE_SUMMARY_FILE)
+        self.history_file = os.path.join(workspace_dir, SUMMARY_HISTORY_FILE)
+        self.condensed = False
+
+    def load(self) -> "OrderedDict[str, str]":
+        if not os.path.isfile(self.summary_file):
+            return OrderedDict()
+        with open(self.summary_file, encoding="utf-8") as f:
+            return parse_sections(f.read())
+
+    def merge(self, sections: "OrderedDict[str, str]", text: str) -> "OrderedDict[str, str]":
+        """
+        Applies an update: sections named in `text` replace existing ones (an empty section removes it),
+        and text without headings replaces everything.
+        """
+        update = parse_sections(text)
+        if list(update) in ([], [DEFAULT_SECTION]):
+            return update
+        merged = OrderedDict(sections)
+        for title, body in update.items():
+            if body:
+                merged[title] = body
+            else:
+                merged.pop(title, None)
+        return merged
+
+    def condense(self, sections: "OrderedDict[str, str]", condenser: Optional[Condenser] = None) -> "OrderedDict[str, str]":
+        """
+        Brings every section under its cap, then condenses the largest sections until the summary fits its budget.
+        Uses the condenser of the store unless another one is given.
+        """
+        condenser = condenser or self.condenser
+        sections = OrderedDict(sections)
+        for title, body in sections.items():
+            if len(body) > self.section_max_chars:
+                sections[title] = condenser(title, body, self.section_max_chars)
+
+        while len(render_sections(sections)) > self.max_chars:
+            title = max(sections, key=lambda t: len(sections[t]))
+            body = sections[title]
+            target = max(len(body) - (len(render_sections(sections)) - self.max_chars), 0)
+            condensed = condenser(title, body, target)
+            if len(condensed) >= len(body):
+                condensed = truncate_condenser(title, body, target)
+            if len(condensed) >= len(body):
+                break
+            sections[title] = condensed
+        return sections
+
+    def update(self, text: str) -> str:
+        """
+        Merges an update into the summary, condenses it, saves it and records it in the history.
+        Returns the new summary.
+        """
+        # Condensing may call a model, so it runs before the workspace lock is taken
+        base = self.load()
+        written = self.merge(base, text)
+        condensed = self.condense(written)
+
+        # The summary is read again under the lock, so sections written meanwhile by other gptw processes are kept
+        with WorkspaceLock.for_workspace(self.workspace_dir).exclusive():
+            current = self.load()
+            sections = self._rebase(base, current, text, condensed)
+            if len(render_sections(sections)) > self.max_chars:
+                sections = self.condense(sections, truncate_condenser)
+            self.condensed = sections != self.merge(current, text)
+            summary = render_sections(sections)
+
+            write_atomic(self.summary_file, summary)
+            self._append_history({"time": time.time(), "update": text, "summary": summary})
+        return summary
+
+    @staticmethod
+    def _rebase(base: "OrderedDict[str, str]", current: "OrderedDict[str, str]", text: str,
+                condensed: "OrderedDict[str, str]") -> "OrderedDict[str, str]":
+        """
+        Applies an update condensed against `base` to `current`, the summary as saved now. Sections named in
+        the update take their condensed text; other sections take it only when nobody changed them since `base`.
+        """
+        update = parse_sections(text)
+        if list(update) in ([], [DEFAULT_SECTION]):
+            return condensed
+        sections = OrderedDict()
+        for title, body in current.items():
+            if title in update:
+                if title in condensed:
+                    sections[title] = condensed[title]
+            else:
+                sections[title] = condensed.get(title, body) if base.get(title) == body else body
+        for title in condensed:
+            if title in update and title not in sections:
+                sections[title] = condensed[title]
+        return sections
+
+    def _append_history(self, record: Dict) -> None:
+        records = self.history()
+        records.append(record)
+        write_atomic(self.history_file, "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in records[-SUMMARY_HISTORY_MAX:]))
+
+    def history(self) -> List[Dict]:
+        """
+        Past updates, oldest first: what was written ("update") and the summary it resulted in ("summary").
+        """
+        if not os.path.isfile(self.history_file):
+            return []
+        with open(self.history_file, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
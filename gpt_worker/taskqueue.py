@@ -0,0 +1,506 @@
+"""
+Queue-backed execution of a plan across processes and hosts.
+
+The incomplete tasks of `plan.json` are published to a broker. Workers on any host with a checkout
+of the workspace lease one task at a time, run a Worker on that task alone and report the result.
+A lease is renewed by heartbeats while the task runs; a task whose lease expires (the worker died or
+lost its connection) is requeued, up to TASKQUEUE_MAX_ATTEMPTS leases. Results are collected back
+into the plan with collect_results.
+
+Brokers:
+    MemoryBroker  in-process and thread-safe, for tests and for workers running as threads
+    SQLiteBroker  a SQLite file, shared by hosts over a shared file system. SQLite relies on file
+                  locks, which some network file systems do not implement reliably; use a local
+                  file or a file system with working POSIX locks
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from gpt_worker.constants import (
+    TASKQUEUE_DEFAULT_QUEUE,
+    TASKQUEUE_HEARTBEAT_INTERVAL,
+    TASKQUEUE_LEASE_SECONDS,
+    TASKQUEUE_MAX_ATTEMPTS,
+    TASKQUEUE_POLL_INTERVAL,
+)
+from gpt_worker.cancellation import CancelledError, CancelToken
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.telemetry import summarize_usage
+
+logger = logging.getLogger(__name__)
+
+# Status of a queued task
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+# Reason a task is cancelled with when its lease could not be renewed
+REASON_LEASE_LOST = "lease lost"
+
+class TaskQueueError(Exception):
+    """Base exception class for task queue errors"""
+    pass
+
+class Lease:
+    """
+    A task leased by a worker until expires_at.
+    """
+
+    def __init__(self, queue: str, task_id: int, lease_id: str, worker_id: str, task: Dict, expires_at: float):
+        self.queue = queue
+        self.task_id = task_id
+        self.lease_id = lease_id
+        self.worker_id = worker_id
+        self.task = task
+        self.expires_at = expires_at
+
+class Broker(ABC):
+    """
+    Shared store of queued tasks. Every method is atomic, also between processes for brokers that
+    support them. Methods taking a lease return False when the lease is no longer held.
+    """
+
+    def __init__(self, max_attempts: int = TASKQUEUE_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    def publish(self, queue: str, tasks: List[Dict]) -> int:
+        """
+        Adds tasks that are not queued yet (by task_id). Returns the number of tasks added.
+        """
+        pass
+
+    @abstractmethod
+    def acquire(self, queue: str, worker_id: str, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> Optional[Lease]:
+        """
+        Leases the pending task with the lowest task_id, after requeueing expired leases. Returns None when none is pending.
+        """
+        pass
+
+    @abstractmethod
+    def heartbeat(self, lease: Lease, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> bool:
+        """
+        Extends a lease.
+        """
+        pass
+
+    @abstractmethod
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        """
+        Marks a leased task done with its result.
+        """
+        pass
+
+    @abstractmethod
+    def fail(self, lease: Lease, result: Dict) -> bool:
+        """
+        Gives a leased task back: it is requeued, or marked failed once it was leased max_attempts times.
+        """
+        pass
+
+    @abstractmethod
+    def requeue_expired(self, queue: str) -> int:
+        """
+        Requeues tasks whose lease expired. Returns the number of tasks requeued or failed.
+        """
+        pass
+
+    @abstractmethod
+    def entries(self, queue: str) -> List[Dict]:
+        """
+        All tasks of a queue by task_id: {"task_id", "task", "status", "worker_id", "attempts", "expires_at", "result"}.
+        """
+        pass
+
+    def _next_status(self, attempts: int) -> str:
+        return FAILED if attempts >= self.max_attempts else PENDING
+
+class MemoryBroker(Broker):
+    """
+    Broker kept in memory, shared by threads of one process.
+    """
+
+    def __init__(self, max_attempts: int = TASKQUEUE_MAX_ATTEMPTS):
+        super().__init__(max_attempts)
+        self.queues: Dict[str, Dict[int, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, queue: str, tasks: List[Dict]) -> int:
+        with self._lock:
+            entries = self.queues.setdefault(queue, {})
+            added = 0
+            for task in tasks:
+                if task["task_id"] not in entries:
+                    entries[task["task_id"]] = {
+                        "task_id": task["task_id"], "task": dict(task), "status": PENDING, "worker_id": None,
+                        "lease_id": None, "attempts": 0, "expires_at": None, "result": None,
+                    }
+                    added += 1
+            return added
+
+    def _requeue_expired(self, queue: str, now: float) -> int:
+        count = 0
+        for entry in self.queues.get(queue, {}).values():
+            if entry["status"] == LEASED and entry["expires_at"] < now:
+                logger.warning(f"Lease of task {entry['task_id']} held by {entry['worker_id']} expired")
+                entry.update(status=self._next_status(entry["attempts"]), lease_id=None, expires_at=None)
+                count += 1
+        return count
+
+    def requeue_expired(self, queue: str) -> int:
+        with self._lock:
+            return self._requeue_expired(queue, time.time())
+
+    def acquire(self, queue: str, worker_id: str, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> Optional[Lease]:
+        with self._lock:
+            now = time.time()
+            self._requeue_expired(queue, now)
+            pending = sorted(task_id for task_id, entry in self.queues.get(queue, {}).items() if entry["status"] == PENDING)
+            if not pending:
+                return None
+            entry = self.queues[queue][pending[0]]
+            entry.update(status=LEASED, worker_id=worker_id, lease_id=uuid.uuid4().hex,
+                         attempts=entry["attempts"] + 1, expires_at=now + lease_seconds)
+            return Lease(queue, entry["task_id"], entry["lease_id"], worker_id, dict(entry["task"]), entry["expires_at"])
+
+    def _held(self, lease: Lease) -> Optional[Dict]:
+        entry = self.queues.get(lease.queue, {}).get(lease.task_id)
+        if entry is None or entry["status"] != LEASED or entry["lease_id"] != lease.lease_id:
+            return None
+        return entry
+
+    def heartbeat(self, lease: Lease, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> bool:
+        with self._lock:
+            entry = self._held(lease)
+            if entry is None:
+                return False
+            entry["expires_at"] = lease.expires_at = time.time() + lease_seconds
+            return True
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        with self._lock:
+            entry = self._held(lease)
+            if entry is None:
+                return False
+            entry.update(status=DONE, lease_id=None, expires_at=None, result=result)
+            return True
+
+    def fail(self, lease: Lease, result: Dict) -> bool:
+        with self._lock:
+            entry = self._held(lease)
+            if entry is None:
+                return False
+            entry.update(status=self._next_status(entry["attempts"]), lease_id=None, expires_at=None, result=result)
+            return True
+
+    def entries(self, queue: str) -> List[Dict]:
+        with self._lock:
+            return [
+                {key: value for key, value in entry.items() if key != "lease_id"}
+                for _, entry in sorted(self.queues.get(queue, {}).items())
+            ]
+
+class SQLiteBroker(Broker):
+    """
+    Broker stored in a SQLite file. Every operation runs in its own IMMEDIATE transaction, so workers in
+    other processes or on other hosts sharing the file never lease the same task.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            queue TEXT NOT NULL,
+            task_id INTEGER NOT NULL,
+            task TEXT NOT NULL,
+            status TEXT NOT NULL,
+            worker_id TEXT,
+            lease_id TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            expires_at REAL,
+            result TEXT,
+            PRIMARY KEY (queue, task_id)
+        )
+    """
+
+    def __init__(self, path: str, max_attempts: int = TASKQUEUE_MAX_ATTEMPTS, timeout: float = 30.0):
+        super().__init__(max_attempts)
+        self.path = path
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._transaction() as db:
+            db.execute(self.SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def publish(self, queue: str, tasks: List[Dict]) -> int:
+        with self._transaction() as db:
+            added = 0
+            for task in tasks:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO tasks (queue, task_id, task, status) VALUES (?, ?, ?, ?)",
+                    (queue, task["task_id"], json.dumps(task, ensure_ascii=False), PENDING),
+                )
+                added += cursor.rowcount
+            return added
+
+    def _requeue_expired(self, db, queue: str, now: float) -> int:
+        expired = db.execute(
+            "SELECT task_id, worker_id, attempts FROM tasks WHERE queue = ? AND status = ? AND expires_at < ?",
+            (queue, LEASED, now),
+        ).fetchall()
+        for task_id, worker_id, attempts in expired:
+            logger.warning(f"Lease of task {task_id} held by {worker_id} expired")
+            db.execute(
+                "UPDATE tasks SET status = ?, lease_id = NULL, expires_at = NULL WHERE queue = ? AND task_id = ?",
+                (self._next_status(attempts), queue, task_id),
+            )
+        return len(expired)
+
+    def requeue_expired(self, queue: str) -> int:
+        with self._transaction() as db:
+            return self._requeue_expired(db, queue, time.time())
+
+    def acquire(self, queue: str, worker_id: str, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> Optional[Lease]:
+        with self._transaction() as db:
+            now = time.time()
+            self._requeue_expired(db, queue, now)
+            row = db.execute(
+                "SELECT task_id, task FROM tasks WHERE queue = ? AND status = ? ORDER BY task_id LIMIT 1",
+                (queue, PENDING),
+            ).fetchone()
+            if row is None:
+                return None
+            lease = Lease(queue, row[0], uuid.uuid4().hex, worker_id, json.loads(row[1]), now + lease_seconds)
+            db.execute(
+                "UPDATE tasks SET status = ?, worker_id = ?, lease_id = ?, attempts = attempts + 1, expires_at = ? "
+                "WHERE queue = ? AND task_id = ?",
+                (LEASED, worker_id, lease.lease_id, lease.expires_at, queue, lease.task_id),
+            )
+            return lease
+
+    def _held(self, db, lease: Lease) -> Optional[Tuple]:
+        return db.execute(
+            "SELECT attempts FROM tasks WHERE queue = ? AND task_id = ? AND status = ? AND lease_id = ?",
+            (lease.queue, lease.task_id, LEASED, lease.lease_id),
+        ).fetchone()
+
+    def _release(self, db, lease: Lease, status: str, result: Dict) -> None:
+        db.execute(
+            "UPDATE tasks SET status = ?, lease_id = NULL, expires_at = NULL, result = ? WHERE queue = ? AND task_id = ?",
+            (status, json.dumps(result, ensure_ascii=False), lease.queue, lease.task_id),
+        )
+
+    def heartbeat(self, lease: Lease, lease_seconds: float = TASKQUEUE_LEASE_SECONDS) -> bool:
+        with self._transaction() as db:
+            if self._held(db, lease) is None:
+                return False
+            lease.expires_at = time.time() + lease_seconds
+            db.execute("UPDATE tasks SET expires_at = ? WHERE queue = ? AND task_id = ?", (lease.expires_at, lease.queue, lease.task_id))
+            return True
+
+    def complete(self, lease: Lease, result: Dict) -> bool:
+        with self._transaction() as db:
+            if self._held(db, lease) is None:
+                return False
+            self._release(db, lease, DONE, result)
+            return True
+
+    def fail(self, lease: Lease, result: Dict) -> bool:
+        with self._transaction() as db:
+            row = self._held(db, lease)
+            if row is None:
+                return False
+            self._release(db, lease, self._next_status(row[0]), result)
+            return True
+
+    def entries(self, queue: str) -> List[Dict]:
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT task_id, task, status, worker_id, attempts, expires_at, result FROM tasks WHERE queue = ? ORDER BY task_id",
+                (queue,),
+            ).fetchall()
+        return [{
+            "task_id": task_id, "task": json.loads(task), "status": status, "worker_id": worker_id,
+            "attempts": attempts, "expires_at": expires_at, "result": json.loads(result) if result else None,
+        } for task_id, task, status, worker_id, attempts, expires_at, result in rows]
+
+def publish_plan(broker: Broker, dataholder: DataHolder, queue: str = TASKQUEUE_DEFAULT_QUEUE) -> int:
+    """
+    Publishes the incomplete tasks of the plan. Tasks already queued are left as they are.
+    """
+    return broker.publish(queue, dataholder.find_task({"done_flg": False}))
+
+def collect_results(broker: Broker, dataholder: DataHolder, queue: str = TASKQUEUE_DEFAULT_QUEUE) -> int:
+    """
+    Marks tasks done in the plan from the results of the queue and saves the plan.
+    Tasks are matched by task_id and name, so results of a plan that was rewritten since are not applied
+    to other tasks. Returns the number of tasks updated.
+    """
+    updated = 0
+    with dataholder.lock:
+        tasks = {task["task_id"]: task for task in dataholder.tasklist}
+        for entry in broker.entries(queue):
+            task = tasks.get(entry["task_id"])
+            if entry["status"] != DONE or task is None or task.get("name") != entry["task"].get("name") or task["done_flg"]:
+                continue
+            task["done_flg"] = True
+            if entry["result"] and entry["result"].get("next_step"):
+                task["next_step"] = entry["result"]["next_step"]
+            updated += 1
+        if updated:
+            dataholder.save_tasklist()
+            dataholder.plan_saved()
+    logger.info(f"Collected {updated} completed tasks from queue {queue}")
+    return updated
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+class Heartbeat:
+    """
+    Renews a lease on a thread until stopped. `lost` is set, and `cancel` cancelled, when the lease could not be renewed.
+    """
+
+    def __init__(self, broker: Broker, lease: Lease, lease_seconds: float, interval: float, cancel: Optional[CancelToken] = None):
+        self.broker = broker
+        self.lease = lease
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.cancel = cancel
+        self.lost = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"gptw-heartbeat-{lease.task_id}", daemon=True)
+
+    def start(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                renewed = self.broker.heartbeat(self.lease, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Heartbeat for task {self.lease.task_id} failed: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lease of task {self.lease.task_id} was lost")
+                self.lost.set()
+                if self.cancel is not None:
+                    self.cancel.cancel(REASON_LEASE_LOST)
+                return
+
+class QueueWorker:
+    """
+    Leases tasks from a queue and runs a Worker on each of them in a local checkout of the workspace.
+    Each task runs in its own DataHolder holding only that task, which does not write plan.json; the
+    plan is updated by collect_results.
+
+    Attributes:
+        prepare: Called with each task's DataHolder before the Worker runs (e.g. to set sandbox limits or an approver)
+    """
+
+    def __init__(self, broker: Broker, workspace_dir: str, queue: str = TASKQUEUE_DEFAULT_QUEUE, worker_id: Optional[str] = None,
+                 lease_seconds: float = TASKQUEUE_LEASE_SECONDS, heartbeat_interval: float = TASKQUEUE_HEARTBEAT_INTERVAL,
+                 prepare: Optional[Callable[[DataHolder], None]] = None, **worker_options):
+        self.broker = broker
+        self.workspace_dir = workspace_dir
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.prepare = prepare
+        self.worker_options = worker_options
+
+    def run(self, max_tasks: Optional[int] = None, wait: bool = False,
+            poll_interval: float = TASKQUEUE_POLL_INTERVAL) -> Iterator[Tuple[int, Dict]]:
+        """
+        Runs tasks until the queue has no pending task (or, with wait, forever) or max_tasks were run.
+        Yields (task_id, message) pairs.
+        """
+        processed = 0
+        while max_tasks is None or processed < max_tasks:
+            lease = self.broker.acquire(self.queue, self.worker_id, self.lease_seconds)
+            if lease is None:
+                if not wait:
+                    return
+                time.sleep(poll_interval)
+                continue
+            for message in self.run_task(lease):
+                yield lease.task_id, message
+            processed += 1
+
+    def run_task(self, lease: Lease) -> Iterator[Dict]:
+        from gpt_worker.agents import Worker
+
+        logger.info(f"Worker {self.worker_id} leased task {lease.task_id}: {lease.task.get('name')}")
+        dataholder = DataHolder.from_workspace(self.workspace_dir)
+        dataholder.tasklist = [lease.task]
+        dataholder.persist_plan = False
+        if self.prepare is not None:
+            self.prepare(dataholder)
+
+        # The Worker stops at its next iteration when the lease is lost or the caller cancels
+        cancel = CancelToken()
+        parent: Optional[CancelToken] = self.worker_options.get("cancel")
+        unregister = parent.on_cancel(lambda: cancel.cancel(parent.reason)) if parent is not None else None
+        heartbeat = Heartbeat(self.broker, lease, self.lease_seconds, self.heartbeat_interval, cancel=cancel).start()
+        worker = Worker(dataholder)
+        try:
+            try:
+                for message in worker.run(**dict(self.worker_options, cancel=cancel)):
+                    yield message
+            finally:
+                heartbeat.stop()
+                if unregister is not None:
+                    unregister()
+        except CancelledError as e:
+            if not heartbeat.lost.is_set():
+                self.broker.fail(lease, {"error": str(e), "worker_id": self.worker_id})
+                raise
+            logger.warning(f"Task {lease.task_id} stopped: its lease expired and it was requeued")
+            yield {"role": "assistant", "content": f"Task {lease.task_id} stopped: its lease was lost"}
+            return
+        except Exception as e:
+            logger.error(f"Task {lease.task_id} failed: {e}")
+            self.broker.fail(lease, {"error": str(e), "worker_id": self.worker_id})
+            yield {"role": "assistant", "content": f"Task {lease.task_id} failed: {e}"}
+            return
+
+        done = bool(dataholder.tasklist) and all(task["done_flg"] for task in dataholder.tasklist)
+        result = {
+            "done_flg": done,
+            "next_step": dataholder.tasklist[0].get("next_step") if dataholder.tasklist else None,
+            "stop_reason": worker.progress.stop_reason,
+            "explanation": worker.progress.explanation,
+            "worker_id": self.worker_id,
+            "usage": summarize_usage(dataholder.usage_log),
+        }
+        reported = self.broker.complete(lease, result) if done else self.broker.fail(lease, result)
+        if not reported:
+            logger.warning(f"Result of task {lease.task_id} discarded: its lease expired and it was requeued")
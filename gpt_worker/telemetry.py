@@ -0,0 +1,121 @@
+"""
+Per-turn usage records and their summaries.
+
+Each API turn appends one record to `DataHolder.usage_log`:
+    {"model", "route", "prompt_tokens", "cached_tokens", "completion_tokens", "tool_calls", "latency", "cost"}
+"""
+from typing import Any, Dict, List, Optional
+from gpt_worker.constants import MODEL_PRICES
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> Optional[float]:
+    """
+    Estimates the cost of one turn in USD from MODEL_PRICES. Dated model names (e.g. gpt-4o-2024-08-06)
+    use the price of their longest matching prefix. Returns None for unknown models.
+    """
+    prefix = max((name for name in MODEL_PRICES if model.startswith(name)), key=len, default=None)
+    if prefix is None:
+        return None
+    input_price, cached_price, output_price = MODEL_PRICES[prefix]
+    return (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + completion_tokens * output_price
+    ) / 1_000_000
+
+def usage_from_response(response: Any, model: str, route: str = "default", latency: float = 0.0) -> Dict:
+    """
+    Extracts a usage record from a chat completion response. Missing fields count as zero.
+    """
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    choices = getattr(response, "choices", None) or []
+    tool_calls = getattr(choices[0].message, "tool_calls", None) if choices else None
+    record = {
+        "model": model,
+        "route": route,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "tool_calls": len(tool_calls) if tool_calls else 0,
+        "latency": latency,
+    }
+    record["cost"] = estimate_cost(model, record["prompt_tokens"], record["cached_tokens"], record["completion_tokens"])
+    return record
+
+def cached_ratio(record: Dict) -> float:
+    """
+    Share of prompt tokens that were served from the provider's prompt cache.
+    """
+    if not record["prompt_tokens"]:
+        return 0.0
+    return record["cached_tokens"] / record["prompt_tokens"]
+
+def summarize_usage(usage_log: List[Dict]) -> Dict:
+    """
+    Totals a usage log.
+    """
+    summary = {
+        "turns": len(usage_log),
+        "prompt_tokens": sum(record["prompt_tokens"] for record in usage_log),
+        "cached_tokens": sum(record["cached_tokens"] for record in usage_log),
+        "completion_tokens": sum(record["completion_tokens"] for record in usage_log),
+        "tool_calls": sum(record.get("tool_calls", 0) for record in usage_log),
+        "latency": sum(record.get("latency", 0.0) for record in usage_log),
+        "cost": sum(record.get("cost") or 0.0 for record in usage_log),
+    }
+    summary["cached_ratio"] = cached_ratio(summary)
+    return summary
+
+def summarize_by_route(usage_log: List[Dict]) -> Dict[str, Dict]:
+    """
+    Totals a usage log per route, with the models used on each route.
+    """
+    routes: Dict[str, List[Dict]] = {}
+    for record in usage_log:
+        routes.setdefault(record.get("route", "default"), []).append(record)
+
+    summaries = {}
+    for route, records in routes.items():
+        summary = summarize_usage(records)
+        summary["models"] = sorted({record["model"] for record in records})
+        summary["avg_latency"] = summary["latency"] / summary["turns"]
+        summaries[route] = summary
+    return summaries
+
+def per_task_metrics(usage_log: List[Dict], completed_tasks: int) -> Dict:
+    """
+    Tokens and tool calls spent per completed task. Used to compare Worker modes such as carry-over
+    against cold restarts.
+    """
+    summary = summarize_usage(usage_log)
+    total_tokens = summary["prompt_tokens"] + summary["completion_tokens"]
+    if completed_tasks <= 0:
+        return {"completed_tasks": 0, "tokens_per_task": None, "tool_calls_per_task": None}
+    return {
+        "completed_tasks": completed_tasks,
+        "tokens_per_task": total_tokens / completed_tasks,
+        "tool_calls_per_task": summary["tool_calls"] / completed_tasks,
+    }
+
+def format_usage_summary(usage_log: List[Dict]) -> str:
+    summary = summarize_usage(usage_log)
+    return (
+        f"turns: {summary['turns']}, "
+        f"prompt tokens: {summary['prompt_tokens']} "
+        f"(cached: {summary['cached_tokens']}, {summary['cached_ratio']:.0%}), "
+        f"completion tokens: {summary['completion_tokens']}, "
+        f"tool calls: {summary['tool_calls']}, "
+        f"cost: ${summary['cost']:.4f}"
+    )
+
+def format_route_summary(usage_log: List[Dict]) -> str:
+    lines = []
+    for route, summary in summarize_by_route(usage_log).items():
+        lines.append(
+            f"{route} ({', '.join(summary['models'])}): "
+            f"turns: {summary['turns']}, "
+            f"tokens: {summary['prompt_tokens'] + summary['completion_tokens']}, "
+            f"cost: ${summary['cost']:.4f}, "
+            f"latency: {summary['latency']:.1f}s (avg {summary['avg_latency']:.1f}s)"
+        )
+    return "\n".join(lines)
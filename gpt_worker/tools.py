@@ -1,11 +1,19 @@
 from abc import abstractmethod
 import os
-import json
+import copy
+import glob
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 from pydantic import BaseModel, Field
-import subprocess
-from gpt_worker.constants import STATE_SUMMARY_FILE, PLAN_FILE, COMMAND_TIMEOUT
+from gpt_worker.approval import ASK, DENY, MODEL, ApprovalPolicy, console_approver
+from gpt_worker.constants import COMMAND_TIMEOUT, GPT_WORKER_DIR, OUTLINE_MAX_BYTES, MULTI_READ_MAX_BYTES, MULTI_READ_MAX_FILES
+from gpt_worker.outline import outline_source
+from gpt_worker.prefetch import read_cache
+from gpt_worker.sandbox import LIMIT_SIGNALS, run_command
+from gpt_worker.search import SearchIndex, iter_workspace_files
+from gpt_worker.summary import SummaryStore, llm_condenser
+from gpt_worker.wire import diff_tasklist
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -74,6 +82,40 @@ class Tool(BaseModel):
         """
         if not path or not isinstance(path, str):
             raise ValidationError("Invalid file path")
+
+    @staticmethod
+    def resolve_path(path: str, dataholder) -> str:
+        """
+        Resolve a path given by the model against the workspace directory.
+
+        Args:
+            path: Path relative to the workspace, or already prefixed with it
+            dataholder: DataHolder instance
+
+        Returns:
+            Path usable from the current directory
+        """
+        if not path.startswith(dataholder.workspace_dir):
+            return os.path.join(dataholder.workspace_dir, path)
+        return path
+
+    @staticmethod
+    def validate_writable(path: str, dataholder) -> None:
+        """
+        Validate that the agent may write a resolved path. The gptw directory of the workspace holds the
+        approval rules, endpoints and routes, so agents must not change it behind the user's back.
+
+        Args:
+            path: Path returned by resolve_path
+            dataholder: DataHolder instance
+
+        Raises:
+            ValidationError: When path is inside the gptw directory of the workspace
+        """
+        config_dir = os.path.realpath(os.path.join(dataholder.workspace_dir, GPT_WORKER_DIR))
+        resolved = os.path.realpath(path)
+        if resolved == config_dir or resolved.startswith(config_dir + os.sep):
+            raise ValidationError(f"{GPT_WORKER_DIR} is managed by gptw and cannot be written by agents")
         
 
 class FileReader(Tool):
@@ -102,24 +144,18 @@ class FileReader(Tool):
         """
         try:
             Tool.validate_path(args["path"])
-            dataholder = args["dataholder"]
-
-            if not args["path"].startswith(dataholder.workspace_dir):
-                path = os.path.join(dataholder.workspace_dir, args["path"])
-            else:
-                path = args["path"]
+            path = Tool.resolve_path(args["path"], args["dataholder"])
 
             if not os.path.exists(path):
                 raise FileOperationError(f"File not found: {path}")
                 
-            with open(path, encoding="utf-8") as f:
-                content = f.read()
-                logger.debug(f"Successfully read file: {path}")
-                return {
-                    "success": True,
-                    "path": path,
-                    "content": content
-                }
+            content = read_cache.read(path)
+            logger.debug(f"Successfully read file: {path}")
+            return {
+                "success": True,
+                "path": path,
+                "content": content
+            }
         except (ValidationError, FileOperationError) as e:
             logger.error(f"Error reading file: {e}")
             return {
@@ -162,12 +198,8 @@ class FileWriter(Tool):
         """
         try:
             Tool.validate_path(args["path"])
-            dataholder = args["dataholder"]
-
-            if not args["path"].startswith(dataholder.workspace_dir):
-                path = os.path.join(dataholder.workspace_dir, args["path"])
-            else:
-                path = args["path"]
+            path = Tool.resolve_path(args["path"], args["dataholder"])
+            Tool.validate_writable(path, args["dataholder"])
 
             dir = os.path.dirname(path)
             if dir:
@@ -175,6 +207,7 @@ class FileWriter(Tool):
                 
             with open(path, mode="w", encoding="utf-8") as f:
                 f.write(args["content"])
+            read_cache.invalidate(path)
                 
             logger.debug(f"Successfully wrote to file: {path}")
             return {
@@ -194,12 +227,268 @@ class FileWriter(Tool):
                 "content": f"Unexpected error: {str(e)}"
             }
 
+class MultiFileReader(Tool):
+    """
+    Tool for reading several files at once.
+    Paths may be glob patterns (e.g. 'src/*.py', 'docs/**/*.md'). Files are read in parallel and returned under
+    a total size budget; when they do not fit, the budget is shared fairly and long files are truncated.
+    """
+    paths: List[str] = Field(..., description="relative paths or glob patterns of target files to read. note that paths should be in working directory.")
+
+    @staticmethod
+    def allocate(sizes: List[int], budget: int) -> List[int]:
+        """
+        Share a budget between files: small files are kept whole and the rest is split evenly among larger files.
+
+        Args:
+            sizes: Size of each file
+            budget: Total size available
+
+        Returns:
+            Size allotted to each file, in the same order
+        """
+        allotted = [0] * len(sizes)
+        remaining = budget
+        pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+        while pending:
+            share = remaining // len(pending)
+            i = pending.pop(0)
+            allotted[i] = min(sizes[i], share)
+            remaining -= allotted[i]
+        return allotted
+
+    @staticmethod
+    def expand(patterns: List[str], dataholder) -> List[str]:
+        """
+        Expand paths and glob patterns into existing file paths, without duplicates.
+        """
+        targets = []
+        for pattern in patterns:
+            path = Tool.resolve_path(pattern, dataholder)
+            matches = sorted(glob.glob(path, recursive=True)) if glob.has_magic(pattern) else [path]
+            for match in matches:
+                if not os.path.isdir(match) and match not in targets:
+                    targets.append(match)
+        return targets[:MULTI_READ_MAX_FILES]
+
+    def run(args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Read and return the contents of several files.
+
+        Args:
+            args: Dictionary containing required parameters
+                - paths: Paths or glob patterns of the files to read
+                - dataholder: DataHolder instance
+
+        Returns:
+            Dictionary containing execution results
+            - success: Whether execution was successful
+            - paths: Paths of the read files (only on success)
+            - content: File contents, each preceded by a '=== path ===' header, or error message on failure
+
+        Raises:
+            ValidationError: When path validation fails
+        """
+        try:
+            paths = args.get("paths")
+            if not paths or not isinstance(paths, list):
+                raise ValidationError("paths must be a non-empty list")
+            for path in paths:
+                Tool.validate_path(path)
+            dataholder = args["dataholder"]
+
+            targets = MultiFileReader.expand(paths, dataholder)
+            if not targets:
+                raise FileOperationError(f"No files matched: {', '.join(paths)}")
+
+            def read(path: str):
+                try:
+                    return read_cache.read(path)
+                except FileNotFoundError:
+                    return None
+                except (OSError, UnicodeDecodeError) as e:
+                    return e
+
+            with ThreadPoolExecutor(max_workers=min(8, len(targets))) as executor:
+                contents = list(executor.map(read, targets))
+
+            texts = [c if isinstance(c, str) else "" for c in contents]
+            allotted = MultiFileReader.allocate([len(t) for t in texts], MULTI_READ_MAX_BYTES)
+
+            sections = []
+            for path, content, text, size in zip(targets, contents, texts, allotted):
+                if content is None:
+                    sections.append(f"=== {path}: File not found ===\n")
+                elif not isinstance(content, str):
+                    sections.append(f"=== {path}: {content} ===\n")
+                elif size < len(text):
+                    sections.append(f"=== {path} (truncated to {size} of {len(text)} characters) ===\n{text[:size]}\n")
+                else:
+                    sections.append(f"=== {path} ===\n{text}\n")
+
+            logger.debug(f"Successfully read {len(targets)} files")
+            return {
+                "success": True,
+                "paths": targets,
+                "content": "".join(sections)
+            }
+        except (ValidationError, FileOperationError) as e:
+            logger.error(f"Error reading files: {e}")
+            return {
+                "success": False,
+                "content": str(e)
+            }
+        except Exception as e:
+            logger.error(f"Unexpected error reading files: {e}")
+            return {
+                "success": False,
+                "content": f"Unexpected error: {str(e)}"
+            }
+
+class OutlineReader(Tool):
+    """
+    Tool for listing the classes and functions of a file, with signatures and line numbers, without reading it in full.
+    Given a directory, outlines every file under it.
+    """
+    path: str = Field(..., description="relative path of target file or directory to outline. note that path should be in working directory.")
+
+    def run(args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Return compact outlines of a file or of all files under a directory.
+
+        Args:
+            args: Dictionary containing required parameters
+                - path: Path of the file or directory to outline
+                - dataholder: DataHolder instance
+
+        Returns:
+            Dictionary containing execution results
+            - success: Whether execution was successful
+            - path: Path of the outlined file or directory (only on success)
+            - content: Outlines ('L<line> <declaration>' per line) or error message on failure
+
+        Raises:
+            FileOperationError: When file operation fails
+            ValidationError: When path validation fails
+        """
+        try:
+            Tool.validate_path(args["path"])
+            dataholder = args["dataholder"]
+            path = Tool.resolve_path(args["path"], dataholder)
+
+            if not os.path.exists(path):
+                raise FileOperationError(f"File not found: {path}")
+
+            if os.path.isdir(path):
+                targets = [os.path.join(path, rel_path) for rel_path in iter_workspace_files(path)]
+            else:
+                targets = [path]
+
+            sections = []
+            used = 0
+            for target in targets:
+                try:
+                    with open(target, encoding="utf-8") as f:
+                        source = f.read()
+                except (UnicodeDecodeError, OSError):
+                    continue
+                line_count = len(source.splitlines())
+                header = f"{os.path.relpath(target, dataholder.workspace_dir)} ({line_count} lines)\n"
+                section = header + "".join(f"  {line}\n" for line in outline_source(target, source))
+                if used + len(section) > OUTLINE_MAX_BYTES:
+                    sections.append(f"... ({len(targets) - len(sections)} more files not shown)\n")
+                    break
+                used += len(section)
+                sections.append(section)
+
+            logger.debug(f"Successfully outlined: {path}")
+            return {
+                "success": True,
+                "path": path,
+                "content": "".join(sections)
+            }
+        except (ValidationError, FileOperationError) as e:
+            logger.error(f"Error outlining file: {e}")
+            return {
+                "success": False,
+                "content": str(e)
+            }
+        except Exception as e:
+            logger.error(f"Unexpected error outlining file: {e}")
+            return {
+                "success": False,
+                "content": f"Unexpected error: {str(e)}"
+            }
+
+class CodeSearch(Tool):
+    """
+    Tool for finding where words and identifiers appear in the workspace.
+    Returns ranked matching lines as 'path:line: text', which is much cheaper than reading files one by one.
+    """
+    query: str = Field(..., description="words or identifiers to search for, e.g. 'CreateResponse retry'.")
+
+    def run(args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Search the workspace index.
+
+        Args:
+            args: Dictionary containing required parameters
+                - query: Words or identifiers to search for
+                - dataholder: DataHolder instance
+
+        Returns:
+            Dictionary containing execution results
+            - success: Whether execution was successful
+            - content: Matching lines as 'path:line: text', or error message on failure
+
+        Raises:
+            ValidationError: When the query is empty
+        """
+        try:
+            if not args.get("query"):
+                raise ValidationError("query is required")
+            dataholder = args["dataholder"]
+
+            index = SearchIndex.open(dataholder.workspace_dir)
+            with index.lock:
+                results = index.search(args["query"])
+            logger.debug(f"Search for '{args['query']}' returned {len(results)} lines")
+
+            if not results:
+                return {
+                    "success": True,
+                    "content": "No matches found"
+                }
+            return {
+                "success": True,
+                "content": "\n".join(f"{r['path']}:{r['line']}: {r['snippet']}" for r in results)
+            }
+        except ValidationError as e:
+            logger.error(f"Validation error: {e}")
+            return {
+                "success": False,
+                "content": str(e)
+            }
+        except Exception as e:
+            logger.error(f"Unexpected error searching workspace: {e}")
+            return {
+                "success": False,
+                "content": f"Unexpected error: {str(e)}"
+            }
+
 class StateUpdater(Tool):
     """
     Tool for updating the current state summary.
-    Updates are saved to a file and reflected in the DataHolder.
+    Updates are merged by section, condensed when over size, saved to a file and reflected in the DataHolder.
     """
-    state_summary: str = Field(..., description="summary of current situation.")
+    state_summary: str = Field(
+        ...,
+        description=(
+            "summary of current situation. "
+            "Use '## Section' headings to update only those sections and keep the others (an empty section removes it). "
+            "Text without headings replaces the whole summary."
+        ),
+    )
 
     def run(args: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -213,7 +502,7 @@ class StateUpdater(Tool):
         Returns:
             Dictionary containing execution results
             - success: Whether execution was successful
-            - content: Error message on failure
+            - content: Note when the summary was condensed, error message on failure
 
         Raises:
             FileOperationError: When file operation fails
@@ -223,14 +512,19 @@ class StateUpdater(Tool):
             if not args.get("state_summary"):
                 raise ValidationError("state_summary is required")
                 
-            dataholder.state_summary = args["state_summary"]
-            
-            summery_file = os.path.join(dataholder.workspace_dir, STATE_SUMMARY_FILE)
-            os.makedirs(os.path.dirname(summery_file), exist_ok=True)
-            with open(summery_file, mode="w", encoding="utf-8") as f:
-                f.write(args["state_summary"])
+            # Condensing may call a model; the DataHolder is only locked to publish the result, so the
+            # other agent of a pipelined run is not held up
+            store = SummaryStore(dataholder.workspace_dir, condenser=llm_condenser(dataholder))
+            summary = store.update(args["state_summary"])
+            with dataholder.lock:
+                dataholder.state_summary = summary
                 
             logger.debug("Successfully updated state summary")
+            if store.condensed:
+                return {
+                    "success": True,
+                    "content": f"Summary condensed to {len(dataholder.state_summary)} characters"
+                }
             return {
                 "success": True 
             }
@@ -289,17 +583,23 @@ class PlanMaker(Tool):
             if not isinstance(tasklist, list):
                 raise ValidationError("tasklist must be a list")
             
-            # Assign task IDs
-            for i, task in enumerate(tasklist):
-                task["task_id"] = i
-            
-            # Save to file
-            plan_file = os.path.join(dataholder.workspace_dir, PLAN_FILE)
-            os.makedirs(os.path.dirname(plan_file), exist_ok=True)
-            with open(plan_file, mode="w", encoding="utf-8") as f:
-                f.write(json.dumps(tasklist))
-            
-            dataholder.tasklist = tasklist
+            with dataholder.lock:
+                # Keep tasks completed or added by another agent since this plan was read
+                if dataholder.merge_plans:
+                    written = copy.deepcopy(tasklist)
+                    tasklist = dataholder.merge_tasklist(tasklist)
+                    # The agent knows what it wrote, but not what was merged in
+                    dataholder.remember_plan(written)
+
+                # Assign task IDs
+                for i, task in enumerate(tasklist):
+                    task["task_id"] = i
+                
+                # Save to file
+                dataholder.tasklist = tasklist
+                if dataholder.persist_plan:
+                    dataholder.save_tasklist()
+                dataholder.plan_saved()
             logger.info(f"Successfully created plan with {len(tasklist)} tasks")
             
             return {
@@ -337,7 +637,7 @@ class PlanUpdater(Tool):
         Returns:
             Dictionary containing execution results
             - success: Whether execution was successful
-            - content: Updated task list or error message
+            - content: Changes made to the task list, or error message
 
         Raises:
             ValidationError: When task list validation fails
@@ -349,17 +649,23 @@ class PlanUpdater(Tool):
             if not isinstance(tasklist, list):
                 raise ValidationError("tasklist must be a list")
             
-            update_count = 0
-            for original_task in dataholder.tasklist:
-                update_task = next((task for task in tasklist if task.get("task_id") == original_task.get("task_id")), None)
-                if update_task:
-                    original_task.update(update_task)
-                    update_count += 1
+            with dataholder.lock:
+                before = copy.deepcopy(dataholder.tasklist)
+                update_count = 0
+                for original_task in dataholder.tasklist:
+                    update_task = next((task for task in tasklist if task.get("task_id") == original_task.get("task_id")), None)
+                    if update_task:
+                        original_task.update(update_task)
+                        update_count += 1
+                if update_count and dataholder.persist_plan:
+                    # Other gptw processes on the workspace see the update, and their changes are merged in
+                    dataholder.save_tasklist()
+                diff = diff_tasklist(before, dataholder.tasklist)
             
             logger.info(f"Successfully updated {update_count} tasks")
             return {
                 "success": True,
-                "content": str(dataholder.tasklist),
+                "content": diff,
             }
         except ValidationError as e:
             logger.error(f"Validation error: {e}")
@@ -382,7 +688,9 @@ class ScriptExecutor(Tool):
     Current directory is already set to the workspace directory.
     The following security restrictions apply:
     1. Execution time limit through timeout
-    2. Destructive commands require user approval
+    2. Commands are checked against the approval policy; those it does not allow require user approval
+    3. CPU, memory, file size and process limits when the DataHolder has sandbox limits
+    4. The command is killed when the run is cancelled
     """
     script: str = Field(..., description="Linux shell script to execute")
     ask_user: bool = Field(
@@ -402,11 +710,14 @@ class ScriptExecutor(Tool):
         Args:
             args: Dictionary containing required parameters
                 - script: Script to execute
+                - cancel: CancelToken of the run (optional); the command is killed when it is cancelled
 
         Returns:
             Dictionary containing execution results
             - success: Whether execution was successful
             - content: Execution output or error message
+            - cpu_seconds: CPU time used by the command (when it ran)
+            - peak_rss_mb: Peak resident memory of the command in MiB (when it ran)
 
         Raises:
             ValidationError: When script validation fails
@@ -419,62 +730,78 @@ class ScriptExecutor(Tool):
             script = args["script"].strip()
             logger.info(f"Validating script: {script}")
             
-            #check if approval is required
-            requires_approval = args["ask_user"]
-            
+            # The approval policy decides first; commands it leaves open fall back to the ask_user flag
+            dataholder = args.get("dataholder")
+            policy = dataholder.approval_policy or ApprovalPolicy(dataholder.workspace_dir)
+            decision = policy.decide(script)
+            if decision.action == DENY:
+                logger.info(f"Script denied by approval policy: {decision.reason}")
+                return {
+                    "success": False,
+                    "content": f"Denied by approval policy: {decision.reason}"
+                }
+            requires_approval = decision.action == ASK or (decision.action == MODEL and args["ask_user"])
+
             if requires_approval:
-                print("The agent wants to execute the following non-allowed script that requires approval:")
-                print("---")
-                print(script)
-                print("---")
-                print("Enter 'y' to permit execution. Any other input will abort.")
-                
-                usr_permit = input().strip().lower()
-                if usr_permit != "y":
+                approver = dataholder.approver or console_approver
+                if not approver(script, dataholder.workspace_dir, decision.reason):
                     logger.info("User aborted script execution")
                     return {
                         "success": False,
                         "content": "User aborted execution"
                     }
             else:
-                logger.info(f"Executing allowed command without approval: {script}")
+                logger.info(f"Executing allowed command without approval: {script} ({decision.reason})")
             
             logger.info(f"Executing script: {script}")
             
-            # Execute subprocess (with shell features disabled)
-            process = subprocess.Popen(
-                script,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=True,
-                text=True,
-                cwd=args.get("dataholder").workspace_dir
-            )
-            
-            # Execute with timeout
-            try:
-                stdout, stderr = process.communicate(timeout=COMMAND_TIMEOUT)
-                
-                if process.returncode != 0:
-                    logger.error(f"Command failed: {stderr}")
-                    return {
-                        "success": False,
-                        "content": f"Command failed with error: {stderr}"
-                    }
-                
-                logger.info("Command executed successfully")
+            cancel = args.get("cancel")
+            if cancel is not None and cancel.cancelled:
                 return {
-                    "success": True,
-                    "content": stdout
+                    "success": False,
+                    "content": f"Command not run: run {cancel.reason}"
                 }
-                
-            except subprocess.TimeoutExpired:
-                process.kill()
+
+            # Execute in its own process group, with the sandbox limits of the workspace if any
+            result = run_command(script, cwd=dataholder.workspace_dir, timeout=COMMAND_TIMEOUT, limits=dataholder.sandbox, cancel=cancel)
+            usage = {"cpu_seconds": round(result.cpu_seconds, 2), "peak_rss_mb": round(result.peak_rss_mb, 1)}
+            logger.info(f"Command used {usage['cpu_seconds']}s CPU, {usage['peak_rss_mb']} MiB peak RSS")
+
+            if result.cancelled:
+                logger.info(f"Command killed: run {cancel.reason}")
+                return {
+                    "success": False,
+                    "content": f"Command killed: run {cancel.reason}",
+                    **usage
+                }
+
+            if result.timed_out:
                 logger.error(f"Command timed out after {COMMAND_TIMEOUT} seconds")
                 return {
                     "success": False,
-                    "content": f"Command timed out after {COMMAND_TIMEOUT} seconds"
+                    "content": f"Command timed out after {COMMAND_TIMEOUT} seconds",
+                    **usage
+                }
+
+            if result.returncode != 0:
+                if result.signal_name:
+                    reason = LIMIT_SIGNALS.get(result.signal_name)
+                    content = f"Command killed by {result.signal_name}" + (f" ({reason})" if reason else "") + f": {result.stderr}"
+                else:
+                    content = f"Command failed with error: {result.stderr}"
+                logger.error(content)
+                return {
+                    "success": False,
+                    "content": content,
+                    **usage
                 }
+
+            logger.info("Command executed successfully")
+            return {
+                "success": True,
+                "content": result.stdout,
+                **usage
+            }
                 
         except ValidationError as e:
             logger.error(f"Validation error: {e}")
@@ -0,0 +1,336 @@
+"""
+Live view of a workspace directory.
+
+WorkspaceWatcher keeps a snapshot of the workspace tree (directories, file sizes and mtimes) and the set of
+paths changed since the last time they were drained. On Linux it follows inotify events; elsewhere, or when
+inotify is unavailable, it rescans the tree periodically. Changes made by any process are seen, including
+commands run through ScriptExecutor.
+
+Once attached to a DataHolder, the directory listing in prompts, the progress fingerprint and the read cache
+use the watcher instead of walking the tree again.
+"""
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
+import os
+import select
+import struct
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from gpt_worker.constants import GPT_WORKER_DIR, WATCH_POLL_INTERVAL
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.prefetch import read_cache
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+class WatcherError(Exception):
+    """Raised when the watcher cannot be started"""
+    pass
+
+def _ignored(name: str) -> bool:
+    return name.startswith(".") or name.startswith("__") or name == GPT_WORKER_DIR
+
+def _load_libc():
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+class WorkspaceWatcher:
+    """
+    Watches one workspace directory.
+
+    Attributes:
+        backend: "inotify" or "polling" once started
+        files: relative path -> (mtime_ns, size) of every watched file
+        dirs: relative paths of every watched directory ("" is the workspace itself)
+    """
+
+    def __init__(
+        self,
+        workspace_dir: str,
+        poll_interval: float = WATCH_POLL_INTERVAL,
+        use_inotify: bool = True,
+        on_change: Optional[Callable[[str], None]] = None,
+    ):
+        self.workspace_dir = workspace_dir
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.on_change = on_change
+        self.backend: Optional[str] = None
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.dirs: Set[str] = set()
+
+        self._changed: Set[str] = set()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._libc = None
+        self._fd = -1
+        self._wd_dirs: Dict[int, str] = {}
+
+    # Snapshot helpers
+
+    def _abs(self, rel_path: str) -> str:
+        return os.path.join(self.workspace_dir, rel_path) if rel_path else self.workspace_dir
+
+    def _scan(self, rel_dir: str = "") -> Tuple[Dict[str, Tuple[int, int]], Set[str]]:
+        files: Dict[str, Tuple[int, int]] = {}
+        dirs: Set[str] = set()
+        for path, subdirs, names in os.walk(self._abs(rel_dir)):
+            subdirs[:] = [d for d in subdirs if not _ignored(d)]
+            rel = os.path.relpath(path, self.workspace_dir)
+            dirs.add("" if rel == "." else rel)
+            for name in names:
+                file_path = os.path.join(path, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files[os.path.relpath(file_path, self.workspace_dir)] = (stat.st_mtime_ns, stat.st_size)
+        return files, dirs
+
+    def _mark(self, rel_path: str) -> None:
+        self._changed.add(rel_path)
+        if self.on_change is not None:
+            try:
+                self.on_change(self._abs(rel_path))
+            except Exception as e:
+                logger.debug(f"on_change callback failed for {rel_path}: {e}")
+
+    def _rescan(self) -> None:
+        files, dirs = self._scan()
+        with self._lock:
+            for rel_path in set(self.files) | set(files):
+                if self.files.get(rel_path) != files.get(rel_path):
+                    self._mark(rel_path)
+            for rel_dir in self.dirs ^ dirs:
+                self._mark(rel_dir)
+            self.files, self.dirs = files, dirs
+
+    # inotify backend
+
+    def _add_watch(self, rel_dir: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, self._abs(rel_dir).encode(), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise WatcherError(f"inotify_add_watch failed for {self._abs(rel_dir)}: {os.strerror(err)}")
+        self._wd_dirs[wd] = rel_dir
+
+    def _start_inotify(self) -> bool:
+        self._libc = _load_libc()
+        if self._libc is None:
+            return False
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._fd = fd
+        try:
+            for rel_dir in sorted(self.dirs):
+                self._add_watch(rel_dir)
+        except WatcherError as e:
+            logger.warning(f"{e}. Falling back to polling")
+            os.close(self._fd)
+            self._fd = -1
+            self._wd_dirs.clear()
+            return False
+        return True
+
+    def _handle_event(self, wd: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self._rescan()
+            return
+        if mask & IN_IGNORED:
+            self._wd_dirs.pop(wd, None)
+            return
+        rel_dir = self._wd_dirs.get(wd)
+        if rel_dir is None or not name or (mask & IN_ISDIR and _ignored(name)):
+            return
+        rel_path = os.path.join(rel_dir, name) if rel_dir else name
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                files, dirs = self._scan(rel_path)
+                self.dirs |= dirs
+                self.files.update(files)
+                for new_dir in sorted(dirs):
+                    try:
+                        self._add_watch(new_dir)
+                    except WatcherError as e:
+                        logger.warning(str(e))
+                for changed in [rel_path] + sorted(files):
+                    self._mark(changed)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                prefix = rel_path + os.sep
+                self.dirs = {d for d in self.dirs if d != rel_path and not d.startswith(prefix)}
+                for gone in [p for p in self.files if p.startswith(prefix)]:
+                    del self.files[gone]
+                    self._mark(gone)
+                self._mark(rel_path)
+            return
+
+        try:
+            stat = os.stat(self._abs(rel_path))
+            state = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            state = None
+        if state is None:
+            if self.files.pop(rel_path, None) is not None or mask & (IN_DELETE | IN_MOVED_FROM):
+                self._mark(rel_path)
+        elif self.files.get(rel_path) != state:
+            self.files[rel_path] = state
+            self._mark(rel_path)
+
+    def _read_events(self) -> None:
+        """
+        Applies every pending inotify event.
+        """
+        with self._lock:
+            while True:
+                try:
+                    data = os.read(self._fd, 65536)
+                except BlockingIOError:
+                    return
+                except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                offset = 0
+                while offset + _EVENT_HEADER.size <= len(data):
+                    wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size
+                    name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", errors="surrogateescape")
+                    offset += length
+                    self._handle_event(wd, mask, name)
+
+    def _run_inotify(self) -> None:
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._fd], [], [], 0.2)
+            if readable:
+                self._read_events()
+
+    def _run_polling(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            self._rescan()
+
+    # Public API
+
+    def start(self) -> "WorkspaceWatcher":
+        if not os.path.isdir(self.workspace_dir):
+            raise WatcherError(f"Directory '{self.workspace_dir}' does not exist")
+        self.files, self.dirs = self._scan()
+        if self.use_inotify and self._start_inotify():
+            self.backend = "inotify"
+            target = self._run_inotify
+        else:
+            self.backend = "polling"
+            target = self._run_polling
+        self._stop.clear()
+        self._thread = threading.Thread(target=target, name="workspace-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.workspace_dir} with {self.backend} ({len(self.files)} files)")
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._wd_dirs.clear()
+
+    def attach(self, dataholder: DataHolder) -> "WorkspaceWatcher":
+        """
+        Starts the watcher (if needed) and makes it the workspace view of the DataHolder.
+        """
+        if self._thread is None:
+            self.start()
+        dataholder.watcher = self
+        return self
+
+    def sync(self) -> None:
+        """
+        Brings the snapshot up to date with changes that happened so far.
+        """
+        if self.backend == "inotify":
+            self._read_events()
+        else:
+            self._rescan()
+
+    def drain_changes(self) -> List[str]:
+        """
+        Returns the relative paths changed since the previous call, and forgets them.
+        """
+        self.sync()
+        with self._lock:
+            changed = sorted(self._changed)
+            self._changed.clear()
+        return changed
+
+    def walk(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        os.walk-like (path, dirs, files) tuples from the snapshot, sorted, without touching the disk.
+        """
+        self.sync()
+        with self._lock:
+            children: Dict[str, Tuple[List[str], List[str]]] = {d: ([], []) for d in self.dirs}
+            for rel_dir in self.dirs:
+                if rel_dir:
+                    parent = os.path.dirname(rel_dir)
+                    if parent in children:
+                        children[parent][0].append(os.path.basename(rel_dir))
+            for rel_path in self.files:
+                parent = os.path.dirname(rel_path)
+                if parent in children:
+                    children[parent][1].append(os.path.basename(rel_path))
+        for rel_dir in sorted(children):
+            dirs, files = children[rel_dir]
+            yield self._abs(rel_dir), sorted(dirs), sorted(files)
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the snapshot, equal to progress.hash_workspace() for the same tree.
+        """
+        self.sync()
+        digest = hashlib.sha256()
+        with self._lock:
+            # Same order as os.walk: files of a directory before its subdirectories
+            for rel_path in sorted(self.files, key=lambda p: (os.path.dirname(p).split(os.sep), os.path.basename(p))):
+                mtime, size = self.files[rel_path]
+                digest.update(f"{rel_path}\0{size}\0{mtime}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+def watch_workspace(dataholder: DataHolder, use_inotify: bool = True) -> WorkspaceWatcher:
+    """
+    Starts a watcher on the DataHolder's workspace that drops changed files from the read cache.
+    """
+    watcher = WorkspaceWatcher(dataholder.workspace_dir, use_inotify=use_inotify, on_change=read_cache.invalidate)
+    return watcher.attach(dataholder)
@@ -0,0 +1,126 @@
+"""
+Wire format of tool results sent back to the model.
+
+`json.dumps` of a tool result escapes every newline and quote of file contents and command output,
+which costs tokens on code. Results are instead framed as one header line followed by the content as is:
+
+    ok path=src/app.py
+    def main():
+        print("hello")
+
+The header holds the status ("ok" or "error") and the other fields of the result as `key=value`
+pairs. Values that contain spaces, newlines or quotes are JSON-quoted so the header stays one line
+and can be decoded again. Content that is not a string is written as compact JSON.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+from gpt_worker import codec
+
+OK = "ok"
+ERROR = "error"
+
+def _format_value(value: Any) -> str:
+    text = value if isinstance(value, str) else codec.dumps(value)
+    if not text or any(c in text for c in ' \t\n\r"='):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+def encode_tool_result(result: Dict[str, Any]) -> str:
+    """
+    Encodes a tool result dict ({"success": ..., "content": ..., other fields}) as a message content string.
+    """
+    header = [OK if result.get("success", False) else ERROR]
+    for key, value in result.items():
+        if key in ("success", "content") or value is None:
+            continue
+        header.append(f"{key}={_format_value(value)}")
+
+    content = result.get("content")
+    if content is None or content == "":
+        return " ".join(header)
+    if not isinstance(content, str):
+        content = codec.dumps(content)
+    return " ".join(header) + "\n" + content
+
+def _parse_header(line: str) -> Tuple[str, Dict[str, Any]]:
+    status, _, rest = line.partition(" ")
+    fields: Dict[str, Any] = {}
+    decoder = json.JSONDecoder()
+    index = 0
+    while index < len(rest):
+        if rest[index] == " ":
+            index += 1
+            continue
+        key_end = rest.find("=", index)
+        if key_end < 0:
+            raise ValueError(f"Invalid header field: {rest[index:]}")
+        key = rest[index:key_end]
+        if rest.startswith('"', key_end + 1):
+            value, index = decoder.raw_decode(rest, key_end + 1)
+        else:
+            index = rest.find(" ", key_end)
+            index = len(rest) if index < 0 else index
+            value = rest[key_end + 1:index]
+        fields[key] = value
+    return status, fields
+
+def decode_tool_result(text: str) -> Dict[str, Any]:
+    """
+    Decodes a message content string back into a tool result dict. Contents written as JSON by earlier
+    versions are decoded too. Header values come back as strings.
+    """
+    if text.startswith("{"):
+        try:
+            return codec.loads(text)
+        except json.JSONDecodeError:
+            pass
+
+    header, _, content = text.partition("\n")
+    try:
+        status, fields = _parse_header(header)
+    except ValueError:
+        status, fields = "", {}
+    if status not in (OK, ERROR):
+        return {"success": True, "content": text}
+
+    result: Dict[str, Any] = {"success": status == OK}
+    result.update(fields)
+    if content:
+        result["content"] = content
+    return result
+
+def _format_field(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def diff_tasklist(before: List[Dict], after: List[Dict]) -> str:
+    """
+    Describes the changes between two task lists, one line per changed field, added or removed task.
+    Tasks are matched by task_id.
+    """
+    old_tasks = {task.get("task_id"): task for task in before}
+    new_tasks = {task.get("task_id"): task for task in after}
+    lines = []
+    unchanged = 0
+    for task_id, task in new_tasks.items():
+        old = old_tasks.get(task_id)
+        if old is None:
+            lines.append(f"+#{task_id} {_format_field({k: v for k, v in task.items() if k != 'task_id'})}")
+            continue
+        changes = [
+            f"#{task_id} {key}: {_format_field(old.get(key))} -> {_format_field(task.get(key))}"
+            for key in list(task) + [k for k in old if k not in task]
+            if old.get(key) != task.get(key)
+        ]
+        if changes:
+            lines.extend(changes)
+        else:
+            unchanged += 1
+    for task_id in old_tasks:
+        if task_id not in new_tasks:
+            lines.append(f"-#{task_id}")
+
+    if not lines:
+        return "no changes"
+    if unchanged:
+        lines.append(f"({unchanged} tasks unchanged)")
+    return "\n".join(lines)
@@ -9,6 +9,9 @@ setup(
         'Click',
         'openai',
     ],
+    extras_require={
+        'fast-json': ['orjson'],
+    },
     entry_points={
         'console_scripts': [
             'gptw=gpt_worker.cli:cli',
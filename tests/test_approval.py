@@ -0,0 +1,141 @@
+import json
+import threading
+import pytest
+from gpt_worker.approval import (
+    ALLOW, ASK, DENY, MODEL,
+    ApprovalError, ApprovalNotFoundError, ApprovalPolicy, ApprovalQueue, normalize_command, split_commands, unwrap_command,
+)
+from gpt_worker.cancellation import CancelToken
+from gpt_worker.constants import APPROVAL_FILE
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.tools import ScriptExecutor
+
+def test_split_commands():
+    assert split_commands("ls -la && cat 'a b.txt' | grep x; echo done > out.txt\npwd") == [
+        ["ls", "-la"], ["cat", "a b.txt"], ["grep", "x"], ["echo", "done", ">", "out.txt"], ["pwd"],
+    ]
+
+def test_default_policy(tmp_path):
+    policy = ApprovalPolicy(str(tmp_path))
+
+    assert policy.decide("ls -la && cat README.md | grep x").action == ALLOW
+    assert policy.decide("echo hi > notes/out.txt").action == ALLOW
+    assert policy.decide("git status").action == ALLOW
+    # ルールにないコマンドはツール呼び出しのask_userに従う
+    assert policy.decide("python main.py").action == MODEL
+    assert policy.decide("rm -rf build").action == ASK
+    assert policy.decide("find . -name '*.pyc' -delete").action == ASK
+    assert policy.decide("ls && sudo reboot").action == DENY
+
+def test_wrapped_commands(tmp_path):
+    policy = ApprovalPolicy(str(tmp_path))
+
+    assert unwrap_command(["env", "-u", "X", "A=1", "nice", "-n", "5", "nohup", "timeout", "-s", "KILL", "5", "ls"]) == ["ls"]
+    assert unwrap_command(["env"]) == ["env"]
+    assert normalize_command(["/bin/rm", "-vRf", "--recursive", "x"]) == ["rm", "-v", "-r", "-f", "-r", "x"]
+    # ラッパーコマンドやフラグの書き方を変えてもdenyとaskのルールは回避できない
+    for script in ("env sudo reboot", "timeout 5 sudo ls", "env FOO=1 nice -n 5 nohup sudo ls", "stdbuf -oL sudo ls",
+                   "command sudo ls", "exec sudo ls", "/usr/bin/sudo ls", "ls | xargs -I{} sudo rm {}"):
+        assert policy.decide(script).action == DENY, script
+    for script in ("rm -Rf build", "rm --recursive build", "rm --force x", "rm -vR build", "xargs -n 1 rm -rf",
+                   "sh -c 'sudo reboot'", "bash -xc 'ls'", "eval ls", "env -S 'sudo ls'"):
+        assert policy.decide(script).action == ASK, script
+    assert policy.decide("timeout 5 ls && nice git status").action == ALLOW
+    assert policy.decide("env -C /etc ls").action == ASK
+
+def test_path_scoping(tmp_path):
+    policy = ApprovalPolicy(str(tmp_path))
+
+    assert policy.decide("cat src/main.py").action == ALLOW
+    decision = policy.decide("cat /etc/passwd")
+    assert decision.action == ASK
+    assert "/etc/passwd" in decision.reason
+    assert policy.decide("ls ../other").action == ASK
+    assert policy.decide("echo x > ~/.bashrc").action == ASK
+    assert policy.decide("cat $(echo /etc/passwd)").action == ASK
+    # 展開やプロセス置換はどのパスを指すか分からないので承認が必要
+    for script in ("echo x > $HOME/.bashrc", "cat $HOME/.ssh/id_rsa", "cat ${HOME}/x", 'echo a >> "$HOME"/x',
+                   "touch $HOME", "cat <(rm -rf x)", "ls >(cat)"):
+        assert policy.decide(script).action == ASK, script
+    assert policy.decide("ls src 2>/dev/null").action == ALLOW
+    assert policy.decide("echo 'unbalanced").action == ASK
+
+def test_config_dir_needs_approval(tmp_path):
+    policy = ApprovalPolicy(str(tmp_path))
+    # エージェントが承認ルールを書き換えて自分の権限を広げることはできない
+    for script in ("""echo '{"default":"allow"}' > .gpt_worker/approval.json""", "cp rules.json .gpt_worker/approval.json",
+                   "touch .gpt_worker", "cd .gpt_worker && echo x > approval.json", f"cat x > {tmp_path}/.gpt_worker/endpoints.json",
+                   "cp x .gpt*/approval.json", "tee ./.gpt_worker/routing.json"):
+        assert policy.decide(script).action == ASK, script
+    assert policy.decide("ls .gpt_workers_notes").action == ALLOW
+
+def test_rules_file(tmp_path):
+    (tmp_path / ".gpt_worker").mkdir()
+    (tmp_path / APPROVAL_FILE).write_text(json.dumps({
+        "allow": ["ls", "python -m pytest*"],
+        "deny": ["curl"],
+        "paths": ["/tmp"],
+        "default": "ask",
+    }))
+    policy = ApprovalPolicy.load(str(tmp_path))
+
+    assert policy.decide("python -m pytest -q").action == ALLOW
+    assert policy.decide("ls /tmp").action == ALLOW
+    assert policy.decide("python main.py").action == ASK
+    assert policy.decide("curl -s https://example.com").action == DENY
+
+    (tmp_path / APPROVAL_FILE).write_text(json.dumps({"default": "never"}))
+    with pytest.raises(ApprovalError):
+        ApprovalPolicy.load(str(tmp_path))
+
+def test_approval_queue():
+    queue = ApprovalQueue(timeout=5)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(queue("make install", "/work", "no rule")))
+    thread.start()
+
+    while not queue.pending():
+        pass
+    request = queue.pending()[0]
+    assert request.to_dict()["script"] == "make install"
+    queue.resolve(request.request_id, True)
+    thread.join()
+
+    assert results == [True]
+    assert queue.pending() == []
+    with pytest.raises(ApprovalNotFoundError):
+        queue.resolve(request.request_id, False)
+
+def test_approval_queue_expires():
+    queue = ApprovalQueue(timeout=0.05)
+    assert queue("make install", "/work", "no rule") == False
+    assert queue.requests == {}
+
+    # キャンセルされたジョブは回答を待たずに拒否される
+    queue = ApprovalQueue()
+    token = CancelToken(timeout=0.05)
+    assert queue.ask("make install", "/work", "no rule", cancel=token) == False
+    assert queue.requests == {}
+
+def test_script_executor_uses_policy(monkeypatch, tmp_path):
+    dataholder = DataHolder(
+        tasklist=[],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+    asked = []
+    dataholder.approver = lambda script, directory, reason: asked.append(script) or False
+
+    # ポリシーで拒否されたコマンドは承認を求めずに拒否する
+    result = ScriptExecutor.run({"script": "sudo ls", "ask_user": False, "dataholder": dataholder})
+    assert result["success"] == False
+    assert "Denied by approval policy" in result["content"]
+
+    # ポリシーで許可されたコマンドはask_userに関わらず実行する
+    result = ScriptExecutor.run({"script": "echo ok", "ask_user": True, "dataholder": dataholder})
+    assert result["success"] == True
+
+    # ask_userがFalseでも要承認のコマンドは承認者に確認する
+    result = ScriptExecutor.run({"script": "rm -rf build", "ask_user": False, "dataholder": dataholder})
+    assert result["content"] == "User aborted execution"
+    assert asked == ["rm -rf build"]
@@ -0,0 +1,100 @@
+import json
+from openai import OpenAI
+from gpt_worker.batch import BatchPlanner
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.constants import PLAN_FILE
+from gpt_worker.telemetry import estimate_cost
+from tests.openai_stub import OpenAIStub, chat_completion
+
+PLAN_CALL = [{
+    "id": "call_0",
+    "type": "function",
+    "function": {"name": "PlanMaker", "arguments": json.dumps({"tasklist": [
+        {"name": "テスト", "description": "テストを書く", "next_step": "tests/を作る", "done_flg": False},
+    ]})},
+}]
+
+class BatchBackend:
+    """
+    Stand-in for /v1/files and /v1/batches: answers the first workspace and fails the others.
+    """
+
+    def __init__(self):
+        self.uploaded = []
+        self.polls = 0
+
+    def __call__(self, method, path, body):
+        if path == "/v1/files" and method == "POST":
+            self.uploaded = [json.loads(line) for line in body.splitlines() if line.startswith(b'{"custom_id"')]
+            return 200, {"id": "file-input", "object": "file", "bytes": len(body), "created_at": 0, "filename": "planner_batch.jsonl", "purpose": "batch", "status": "processed"}
+        if path == "/v1/batches" and method == "POST":
+            return 200, self.batch("validating")
+        if path == "/v1/batches/batch_1":
+            self.polls += 1
+            return 200, self.batch("in_progress" if self.polls < 2 else "completed")
+        if path == "/v1/files/file-output/content":
+            lines = []
+            for index, request in enumerate(self.uploaded):
+                if index == 0:
+                    response = {"status_code": 200, "request_id": "req_0", "body": chat_completion(request["body"]["model"], content=None, tool_calls=PLAN_CALL)}
+                else:
+                    response = {"status_code": 500, "request_id": f"req_{index}", "body": {"error": {"message": "server error"}}}
+                lines.append(json.dumps({"id": f"batch_req_{index}", "custom_id": request["custom_id"], "response": response, "error": None}))
+            return 200, "\n".join(lines).encode("utf-8")
+        if path == "/v1/chat/completions":
+            return 200, chat_completion(body["model"], content="計画完了")
+        return 404, {"error": {"message": f"unexpected {method} {path}"}}
+
+    def batch(self, status):
+        return {
+            "id": "batch_1", "object": "batch", "endpoint": "/v1/chat/completions", "input_file_id": "file-input",
+            "completion_window": "24h", "created_at": 0, "status": status,
+            "output_file_id": "file-output" if status == "completed" else None,
+            "request_counts": {"total": 2, "completed": 2 if status == "completed" else 0, "failed": 0},
+        }
+
+def test_batch_planning(monkeypatch, tmp_path):
+    workspaces = [tmp_path / "a", tmp_path / "b"]
+    for workspace in workspaces:
+        workspace.mkdir()
+    backend = BatchBackend()
+
+    with OpenAIStub(backend) as stub:
+        client = OpenAI(base_url=stub.base_url, api_key="test", max_retries=0)
+        # 後続のターンは通常のクライアントで送られる
+        monkeypatch.setattr(OpenAIConnector, "_client", client)
+        planner = BatchPlanner([str(workspace) for workspace in workspaces], order="計画して", model="gpt-4o", poll_interval=0)
+        messages = list(planner.run(batch_file=str(tmp_path / "batch.jsonl")))
+
+    # 各ワークスペースの最初のリクエストが1つのバッチで送られる
+    assert [request["custom_id"] for request in backend.uploaded] == [str(workspace) for workspace in workspaces]
+    assert backend.uploaded[0]["url"] == "/v1/chat/completions"
+    assert "PlanMaker" in json.dumps(backend.uploaded[0]["body"]["tools"])
+    assert (tmp_path / "batch.jsonl").read_text().count("\n") == 2
+
+    # aはバッチの結果からツールループを再開し、失敗したbは通常どおり計画する
+    a_messages = [message for workspace, message in messages if workspace == str(workspaces[0])]
+    assert a_messages[0]["tool_calls"][0]["function"]["name"] == "PlanMaker"
+    assert a_messages[1]["role"] == "tool"
+    assert a_messages[-1]["content"] == "計画完了"
+    assert json.loads((workspaces[0] / PLAN_FILE).read_text())[0]["name"] == "テスト"
+    b_messages = [message for workspace, message in messages if workspace == str(workspaces[1])]
+    assert [message["content"] for message in b_messages] == ["計画完了"]
+
+    usage = planner.dataholders[str(workspaces[0])].usage_log
+    assert usage[0]["cost"] == estimate_cost("gpt-4o", 10, 0, 2) * 0.5
+    chat_paths = [path for _, path, _ in stub.requests if path == "/v1/chat/completions"]
+    assert len(chat_paths) == 2
+
+def test_resume_submitted_batch(tmp_path):
+    backend = BatchBackend()
+    with OpenAIStub(backend) as stub:
+        client = OpenAI(base_url=stub.base_url, api_key="test", max_retries=0)
+        planner = BatchPlanner([str(tmp_path)], client=client, poll_interval=0)
+        backend.uploaded = [{"custom_id": str(tmp_path), "body": {"model": "gpt-4o"}}]
+        batch = planner.wait("batch_1")
+        responses = planner.results(batch)
+
+    assert batch.status == "completed"
+    assert list(responses) == [str(tmp_path)]
+    assert not any(path == "/v1/files" for _, path, _ in stub.requests)
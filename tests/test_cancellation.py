@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+import pytest
+from openai import OpenAI
+from gpt_worker.agents import Orchestrator, Worker
+from gpt_worker.cancellation import REASON_CANCELLED, REASON_DEADLINE, CancelledError, CancelToken
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.sandbox import run_command
+from gpt_worker.wire import decode_tool_result
+from tests.openai_stub import OpenAIStub, chat_completion
+
+def test_token():
+    token = CancelToken()
+    calls = []
+    unregister = token.on_cancel(lambda: calls.append("a"))
+    token.on_cancel(lambda: calls.append("b"))
+    unregister()
+    assert not token.cancelled and token.remaining() is None
+    token.check()
+
+    token.cancel()
+    token.cancel("ignored")
+    assert token.cancelled and token.reason == REASON_CANCELLED
+    assert calls == ["b"]
+    with pytest.raises(CancelledError):
+        token.check()
+
+    # キャンセル済みのトークンに登録したコールバックはすぐに呼ばれる
+    token.on_cancel(lambda: calls.append("c"))
+    assert calls == ["b", "c"]
+
+def test_deadline():
+    token = CancelToken(timeout=0.1)
+    assert 0 < token.remaining() <= 0.1
+    assert token.wait(5)
+    assert token.reason == REASON_DEADLINE
+    assert token.remaining() == 0
+
+def test_cancel_kills_command(tmp_path):
+    token = CancelToken()
+    threading.Timer(0.3, token.cancel).start()
+    started = time.monotonic()
+    result = run_command("sleep 30 & sleep 30", cwd=str(tmp_path), timeout=60, cancel=token)
+    assert result.cancelled and not result.timed_out
+    assert time.monotonic() - started < 10
+
+def test_cancel_in_flight_request(monkeypatch, tmp_path):
+    release = threading.Event()
+
+    def slow(method, path, body):
+        release.wait(10)
+        return 200, chat_completion("m")
+
+    dataholder = DataHolder(tasklist=[{"task_id": 0, "name": "t", "done_flg": False}], state_summary="", workspace_dir=str(tmp_path))
+    with OpenAIStub(slow) as stub:
+        monkeypatch.setattr(OpenAIConnector, "_client", OpenAI(base_url=stub.base_url, api_key="test", max_retries=0))
+        token = CancelToken(timeout=0.3)
+        started = time.monotonic()
+        with pytest.raises(CancelledError) as e:
+            list(Orchestrator(dataholder).run(order="作業して", model="m", cancel=token))
+        release.set()
+
+    # 応答を待たずに期限で中断する
+    assert e.value.reason == REASON_DEADLINE
+    assert time.monotonic() - started < 5
+
+def test_worker_deadline_kills_command(monkeypatch, tmp_path):
+    call = {"id": "call_1", "type": "function", "function": {"name": "ScriptExecutor", "arguments": json.dumps({"script": "sleep 30", "ask_user": False})}}
+    dataholder = DataHolder(tasklist=[{"task_id": 0, "name": "t", "done_flg": False}], state_summary="", workspace_dir=str(tmp_path))
+    messages = []
+
+    with OpenAIStub(lambda method, path, body: (200, chat_completion("m", content=None, tool_calls=[call]))) as stub:
+        monkeypatch.setattr(OpenAIConnector, "_client", OpenAI(base_url=stub.base_url, api_key="test", max_retries=0))
+        started = time.monotonic()
+        with pytest.raises(CancelledError):
+            for message in Worker(dataholder).run(model="m", cancel=CancelToken(timeout=1)):
+                messages.append(message)
+
+    # 実行中のコマンドは強制終了され、その結果を返してから中断する
+    assert time.monotonic() - started < 10
+    result = decode_tool_result(messages[-1]["content"])
+    assert not result["success"] and "deadline exceeded" in result["content"]
@@ -0,0 +1,53 @@
+import io
+import json
+import pytest
+from gpt_worker import codec
+from gpt_worker.constants import PLAN_FILE
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.wire import decode_tool_result, encode_tool_result
+
+@pytest.fixture(params=codec.available_backends())
+def backend(request):
+    codec.use(request.param)
+    yield request.param
+    codec.use()
+
+def test_backends_agree(backend):
+    value = {"name": "タスク", "items": [1, 2.5, None, True, "a\nb\"c"], "nested": {"done_flg": False}}
+    text = codec.dumps(value)
+
+    # どのバックエンドも同じ形式で書き、互いに読める
+    assert text == json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    assert codec.loads(text) == value
+    assert codec.loads(text.encode("utf-8")) == value
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads("{invalid")
+
+def test_plan_round_trip(backend, tmp_path):
+    dataholder = DataHolder(tasklist=[{"task_id": 0, "name": "テスト", "done_flg": False}], state_summary="", workspace_dir=str(tmp_path))
+    dataholder.save_tasklist()
+
+    assert json.loads((tmp_path / PLAN_FILE).read_text(encoding="utf-8")) == dataholder.tasklist
+    assert DataHolder.from_workspace(str(tmp_path)).tasklist == dataholder.tasklist
+
+def test_tool_results(backend):
+    result = {"success": True, "content": {"matches": [{"path": "a.py", "line": 3}]}}
+    assert decode_tool_result(encode_tool_result(result))["content"] == '{"matches":[{"path":"a.py","line":3}]}'
+    assert decode_tool_result('{"success": false, "content": "legacy"}') == {"success": False, "content": "legacy"}
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        codec.use("yaml")
+    assert codec.backend_name() in codec.available_backends()
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 64, 1 << 16])
+def test_iter_json_array(chunk_size):
+    tasks = [{"task_id": i, "name": f"タスク {i}", "cost": i * 1.25, "tags": ["a", "b"]} for i in range(50)] + [12.5e3, -7, "s", []]
+    for text in (json.dumps(tasks), json.dumps(tasks, indent=2), codec.dumps(tasks)):
+        assert list(codec.iter_json_array(io.StringIO(text), chunk_size)) == tasks
+    assert list(codec.iter_json_array(io.StringIO(" [ ] "), chunk_size)) == []
+
+@pytest.mark.parametrize("text", ["", "{}", "[1,", "[1 2]", "[1,]", "[,1]", '["a'])
+def test_iter_json_array_invalid(text):
+    with pytest.raises(json.JSONDecodeError):
+        list(codec.iter_json_array(io.StringIO(text), 2))
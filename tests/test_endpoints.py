@@ -0,0 +1,120 @@
+import json
+import time
+import pytest
+from openai import BadRequestError
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.endpoints import Endpoint, EndpointError, EndpointPool, format_endpoint_summary, is_secure_url
+from tests.openai_stub import OpenAIStub, chat_completion
+
+def endpoint(name, stub, **kwargs):
+    return Endpoint(name, base_url=stub.base_url, api_key="test", **kwargs)
+
+def failing(method, path, body):
+    return 500, {"error": {"message": "overloaded", "type": "server_error"}}
+
+def slow(method, path, body):
+    time.sleep(1.0)
+    return 200, chat_completion(body["model"], content="slow")
+
+def fast(method, path, body):
+    return 200, chat_completion(body["model"], content="fast")
+
+def test_failover_and_health():
+    with OpenAIStub(failing) as down, OpenAIStub(fast) as up:
+        pool = EndpointPool([endpoint("down", down), endpoint("up", up)], failure_threshold=2, cooldown=60)
+
+        for _ in range(3):
+            response = pool.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+            assert response.choices[0].message.content == "fast"
+
+    # 連続で失敗したエンドポイントはクールダウン中は後回しにされる
+    assert len(down.requests) == 2
+    assert len(up.requests) == 3
+    assert [endpoint.name for endpoint in pool.candidates()] == ["up", "down"]
+    stats = {entry["name"]: entry for entry in pool.stats()}
+    assert stats["down"]["failures"] == 2 and not stats["down"]["healthy"]
+    assert stats["up"]["requests"] == 3 and stats["up"]["p95"] is not None
+
+def test_all_endpoints_fail():
+    with OpenAIStub(failing) as first, OpenAIStub(failing) as second:
+        pool = EndpointPool([endpoint("first", first), endpoint("second", second)])
+        with pytest.raises(Exception) as error:
+            pool.chat.completions.create(model="gpt-4o", messages=[])
+    assert "overloaded" in str(error.value)
+
+def test_client_errors_are_not_failed_over():
+    def bad_request(method, path, body):
+        return 400, {"error": {"message": "model not available", "type": "invalid_request_error"}}
+
+    with OpenAIStub(bad_request) as first, OpenAIStub(fast) as second:
+        pool = EndpointPool([endpoint("first", first), endpoint("second", second)])
+        with pytest.raises(BadRequestError):
+            pool.chat.completions.create(model="unknown", messages=[])
+    assert second.requests == []
+
+def test_hedged_request_takes_first_response():
+    with OpenAIStub(slow) as primary, OpenAIStub(fast) as secondary:
+        pool = EndpointPool([endpoint("primary", primary), endpoint("secondary", secondary)], hedge=True, hedge_initial_delay=0.1)
+
+        started = time.monotonic()
+        response = pool.chat.completions.create(model="gpt-4o", messages=[])
+        elapsed = time.monotonic() - started
+
+        assert response.choices[0].message.content == "fast"
+        assert elapsed < 0.9
+        assert pool.hedges == 1 and pool.hedge_wins == 1
+        assert "Hedged requests: 1, won by the hedge: 1" in format_endpoint_summary(pool)
+
+def test_hedge_delay_follows_p95():
+    with OpenAIStub(fast) as stub:
+        pool = EndpointPool([endpoint("only", stub)], hedge=True, hedge_min_samples=3, hedge_initial_delay=5.0)
+        assert pool.hedge_delay(pool.endpoints[0]) == 5.0
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            pool.health["only"].record_success(latency)
+        assert pool.hedge_delay(pool.endpoints[0]) == 0.4
+
+def test_model_mapping_through_connector(monkeypatch, tmp_path):
+    with OpenAIStub(failing) as down, OpenAIStub(fast) as up:
+        pool = EndpointPool([endpoint("down", down), endpoint("azure", up, models={"gpt-4o": "gpt-4o-deployment"})])
+        monkeypatch.setattr(OpenAIConnector, "_client", pool)
+        dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+
+        replies = list(OpenAIConnector.CreateResponse([{"role": "user", "content": "hi"}], [], dataholder, "gpt-4o"))
+
+    assert replies[0]["content"] == "fast"
+    assert up.requests[0][2]["model"] == "gpt-4o-deployment"
+    assert dataholder.usage_log[0]["model"] == "gpt-4o"
+
+def test_load_config(monkeypatch, tmp_path):
+    monkeypatch.setenv("SECOND_KEY", "secret")
+    path = tmp_path / "endpoints.json"
+    path.write_text(json.dumps({
+        "endpoints": [
+            {"name": "first", "base_url": "http://127.0.0.1:1/v1", "api_key": "key"},
+            {"base_url": "http://127.0.0.1:2/v1", "api_key_env": "SECOND_KEY", "models": {"gpt-4o": "other"}},
+        ],
+        "hedge": True,
+    }))
+    pool = EndpointPool.load(str(path))
+    assert pool.hedge
+    assert [endpoint.name for endpoint in pool.endpoints] == ["first", "endpoint1"]
+    assert pool.endpoints[1].api_key == "secret"
+    assert pool.endpoints[1].model_for("gpt-4o") == "other"
+
+    assert EndpointPool.load(str(tmp_path / "missing.json")) is None
+    monkeypatch.delenv("SECOND_KEY")
+    with pytest.raises(EndpointError):
+        EndpointPool.load(str(path))
+
+def test_environment_keys_need_https(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "secret")
+    assert is_secure_url("https://example.com/v1") and is_secure_url("http://localhost:8000/v1") and is_secure_url("http://[::1]/v1")
+    assert not is_secure_url("http://example.com/v1") and not is_secure_url("ftp://example.com")
+
+    # 環境変数のキーは平文のHTTPで外部のホストに送らない
+    for entry in ({"base_url": "http://attacker.example/v1", "api_key_env": "OPENAI_API_KEY"}, {"base_url": "http://attacker.example/v1"}):
+        with pytest.raises(EndpointError):
+            EndpointPool.from_config({"endpoints": [entry]})
+    pool = EndpointPool.from_config({"endpoints": [{"base_url": "http://10.0.0.2/v1", "api_key": "local"}]})
+    assert pool.endpoints[0].api_key == "local"
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from gpt_worker.agents import Orchestrator, Planner, Worker
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.fingerprint import WorkspaceFingerprint, merkle_root
+from gpt_worker.locking import WorkspaceLock
+
+TASKLIST = [
+    {"task_id": 0, "name": "a", "description": "", "next_step": "", "done_flg": True},
+    {"task_id": 1, "name": "b", "description": "", "next_step": "", "done_flg": False},
+]
+
+def test_merkle_root():
+    root = merkle_root({"a.py": "1", os.path.join("src", "b.py"): "2"})
+    assert root == merkle_root({os.path.join("src", "b.py"): "2", "a.py": "1"})
+    assert root != merkle_root({"a.py": "1", os.path.join("src", "b.py"): "3"})
+    # 同じファイルでも置かれたディレクトリが違えば別のハッシュになる
+    assert root != merkle_root({"a.py": "1", os.path.join("lib", "b.py"): "2"})
+
+def test_fingerprint_matches(tmp_path):
+    (tmp_path / "main.py").write_text("print('hello')\n")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_text("ref")
+    WorkspaceFingerprint(str(tmp_path)).save("アプリを作る", TASKLIST)
+
+    fingerprint = WorkspaceFingerprint(str(tmp_path))
+    assert fingerprint.matches("アプリを作る", TASKLIST)
+    # 空の指示は前回の指示の続きとみなす
+    assert fingerprint.matches("", TASKLIST)
+    assert not fingerprint.matches("別の指示", TASKLIST)
+    assert not fingerprint.matches("アプリを作る", TASKLIST[:1])
+
+    # 追跡対象外のディレクトリの変更は無視する
+    (tmp_path / ".git" / "HEAD").write_text("other")
+    assert fingerprint.matches("アプリを作る", TASKLIST)
+
+    (tmp_path / "main.py").write_text("print('changed')\n")
+    assert not fingerprint.matches("アプリを作る", TASKLIST)
+
+def test_save_waits_for_workspace_lock(tmp_path):
+    fingerprint = WorkspaceFingerprint(str(tmp_path))
+    other = WorkspaceLock(str(tmp_path))
+    # 別プロセスがワークスペースをロックしている間は書き込まない
+    with other.exclusive():
+        thread = threading.Thread(target=fingerprint.save, args=("作る", TASKLIST))
+        thread.start()
+        time.sleep(0.2)
+        assert not os.path.exists(fingerprint.path)
+    thread.join()
+
+    assert WorkspaceFingerprint(str(tmp_path)).matches("作る", TASKLIST)
+    assert not [name for name in os.listdir(os.path.dirname(fingerprint.path)) if name.endswith(".tmp")]
+
+def test_unchanged_content_is_not_reread(tmp_path, monkeypatch):
+    (tmp_path / "main.py").write_text("x = 1\n")
+    WorkspaceFingerprint(str(tmp_path)).save("", TASKLIST)
+
+    def fail(path):
+        raise AssertionError(f"{path} was read again")
+    monkeypatch.setattr("gpt_worker.fingerprint.hash_file", fail)
+    assert WorkspaceFingerprint(str(tmp_path)).matches("", TASKLIST)
+
+def test_orchestrator_skips_planner_when_unchanged(tmp_path, monkeypatch):
+    calls = []
+    def planner_run(self, **kwargs):
+        calls.append("planner")
+        yield {"role": "assistant", "content": "planned"}
+    def worker_run(self, **kwargs):
+        calls.append("worker")
+        yield {"role": "assistant", "content": "worked"}
+    monkeypatch.setattr(Planner, "run", planner_run)
+    monkeypatch.setattr(Worker, "run", worker_run)
+    (tmp_path / "main.py").write_text("x = 1\n")
+
+    def run(**kwargs):
+        dataholder = DataHolder(tasklist=[dict(task) for task in TASKLIST], state_summary="", workspace_dir=str(tmp_path))
+        return list(Orchestrator(dataholder).run(order="作る", **kwargs))
+
+    run()
+    assert calls == ["planner", "worker"]
+
+    calls.clear()
+    messages = run()
+    assert calls == ["worker"]
+    assert "Nothing changed" in messages[0]["content"]
+
+    calls.clear()
+    run(replan=True)
+    assert calls == ["planner", "worker"]
+
+    calls.clear()
+    (tmp_path / "main.py").write_text("x = 2\n")
+    run()
+    assert calls == ["planner", "worker"]
@@ -0,0 +1,38 @@
+import json
+from gpt_worker.history import summarize_turns, render_notes
+
+def make_tool_call(call_id, name, arguments):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+def test_summarize_turns():
+    messages = [
+        {"role": "assistant", "tool_calls": [
+            make_tool_call("c1", "FileReader", {"path": "main.py"}),
+            make_tool_call("c2", "ScriptExecutor", {"script": "ls", "ask_user": False}),
+        ]},
+        {"role": "tool", "tool_call_id": "c1", "content": json.dumps({"success": True, "path": "main.py", "content": "print('hello')"})},
+        {"role": "tool", "tool_call_id": "c2", "content": json.dumps({"success": False, "content": "not found"})},
+        {"role": "assistant", "content": "完了しました"},
+    ]
+
+    notes = summarize_turns(messages)
+    assert notes[0] == "FileReader(main.py) -> ok:\nprint('hello')"
+    assert notes[1] == "ScriptExecutor(ls) -> failed: not found"
+    assert notes[2] == "You said: 完了しました"
+
+def test_render_notes_within_budget():
+    notes = ["old note\n" + "x" * 100, "recent note\n" + "y" * 100]
+
+    # 予算内なら全文を残す
+    assert "x" * 100 in render_notes(notes, 1000)
+
+    # 予算が足りない場合は古いノートを1行目だけにする
+    rendered = render_notes(notes, 140)
+    assert "y" * 100 in rendered
+    assert "- old note" in rendered
+    assert "x" * 100 not in rendered
+    assert len(rendered) <= 140
+
+    # さらに足りない場合は古いノートを省略する
+    rendered = render_notes(notes, 20)
+    assert "1 earlier actions omitted" in rendered
@@ -0,0 +1,134 @@
+import json
+import threading
+import pytest
+from gpt_worker.constants import PLAN_FILE, STATE_SUMMARY_FILE
+from gpt_worker.dataholder import DataHolder, ReadOnlyError
+from gpt_worker.locking import WorkspaceLock, WorkspaceLockError
+from gpt_worker.summary import SummaryStore
+from gpt_worker.tools import PlanMaker, PlanUpdater
+
+def task(name, done=False, next_step=""):
+    return {"name": name, "description": "", "next_step": next_step, "done_flg": done}
+
+def make_workspace(tmp_path, tasklist):
+    (tmp_path / ".gpt_worker").mkdir()
+    (tmp_path / PLAN_FILE).write_text(json.dumps([dict(t, task_id=i) for i, t in enumerate(tasklist)]))
+    return str(tmp_path)
+
+def test_lock_excludes_other_processes(tmp_path):
+    lock = WorkspaceLock.for_workspace(str(tmp_path))
+    # 別のインスタンスは別のファイル記述子でロックするため、別プロセスと同じく競合する
+    other = WorkspaceLock(str(tmp_path), timeout=0.1)
+
+    with lock.exclusive():
+        with lock.shared():
+            pass
+        with pytest.raises(WorkspaceLockError):
+            with other.shared():
+                pass
+
+    with lock.shared():
+        with other.shared():
+            pass
+        with pytest.raises(WorkspaceLockError):
+            with other.exclusive():
+                pass
+
+    with other.exclusive():
+        pass
+
+def test_lock_is_shared_by_threads(tmp_path):
+    lock = WorkspaceLock.for_workspace(str(tmp_path))
+    assert WorkspaceLock.for_workspace(str(tmp_path / ".")) is lock
+    order = []
+
+    def reader():
+        with lock.shared():
+            order.append("reader")
+
+    with lock.exclusive():
+        thread = threading.Thread(target=reader)
+        thread.start()
+        thread.join(0.1)
+        order.append("writer")
+    thread.join()
+    assert order == ["writer", "reader"]
+
+def test_concurrent_plan_updates_are_merged(tmp_path):
+    workspace = make_workspace(tmp_path, [task("a"), task("b"), task("c")])
+    first = DataHolder.from_workspace(workspace)
+    second = DataHolder.from_workspace(workspace)
+
+    PlanUpdater.run({"tasklist": [{"task_id": 0, "done_flg": True}], "dataholder": first})
+    # 2つ目のプロセスは古い計画から更新するが、1つ目の更新は失われない
+    PlanUpdater.run({"tasklist": [{"task_id": 1, "next_step": "write tests"}], "dataholder": second})
+
+    saved = json.loads((tmp_path / PLAN_FILE).read_text())
+    assert [(t["name"], t["done_flg"], t["next_step"]) for t in saved] == [
+        ("a", True, ""), ("b", False, "write tests"), ("c", False, ""),
+    ]
+    assert second.tasklist == saved
+
+def test_concurrent_plans_keep_added_and_done_tasks(tmp_path):
+    workspace = make_workspace(tmp_path, [task("a"), task("b")])
+    first = DataHolder.from_workspace(workspace)
+    second = DataHolder.from_workspace(workspace)
+
+    PlanMaker.run({"tasklist": [task("a", done=True), task("b"), task("x")], "dataholder": first})
+    # 変更していないタスク"b"の削除は反映し、相手が完了・追加したタスクは残す
+    PlanMaker.run({"tasklist": [task("a"), task("y")], "dataholder": second})
+
+    saved = json.loads((tmp_path / PLAN_FILE).read_text())
+    assert [(t["task_id"], t["name"], t["done_flg"]) for t in saved] == [
+        (0, "a", True), (1, "y", False), (2, "x", False),
+    ]
+
+def test_merge_revisions_prefers_changed_side():
+    base = [task("a"), task("b")]
+    ours = [task("a", next_step="ours"), task("b")]
+    theirs = [task("a", next_step="theirs"), task("b", next_step="theirs")]
+
+    merged = DataHolder.merge_revisions(base, ours, theirs)
+    assert [t["next_step"] for t in merged] == ["ours", "theirs"]
+
+def test_read_only(tmp_path):
+    workspace = make_workspace(tmp_path, [task("a")])
+    dataholder = DataHolder.from_workspace(workspace, read_only=True)
+
+    # 他のプロセスが読み取り中でも読める
+    with WorkspaceLock.for_workspace(workspace).shared():
+        assert DataHolder.from_workspace(workspace, read_only=True).tasklist == dataholder.tasklist
+    with pytest.raises(ReadOnlyError):
+        dataholder.save_tasklist()
+
+    # ロックファイルがなくても読み取りはファイルを作らない
+    assert not (tmp_path / ".gpt_worker" / "lock").exists()
+
+def test_summary_updates_are_merged(tmp_path):
+    first = SummaryStore(str(tmp_path))
+    second = SummaryStore(str(tmp_path))
+
+    first.update("## Progress\nstep 1")
+    second.update("## Notes\nuse pytest")
+
+    summary = (tmp_path / STATE_SUMMARY_FILE).read_text()
+    assert "step 1" in summary and "use pytest" in summary
+    assert list((tmp_path / ".gpt_worker").glob("*.tmp")) == []
+
+def test_summary_condensed_outside_lock(tmp_path):
+    (tmp_path / ".gpt_worker").mkdir()
+    other = WorkspaceLock(str(tmp_path), timeout=0.1)
+
+    def condenser(title, text, max_chars):
+        # 要約中はロックを持たないので、別のプロセスがロックを取って書き込める
+        with other.exclusive():
+            pass
+        SummaryStore(str(tmp_path)).update("## Notes\nwritten meanwhile")
+        return text[:max_chars]
+
+    store = SummaryStore(str(tmp_path), condenser=condenser, section_max_chars=10)
+    summary = store.update("## Progress\n" + "x" * 50)
+
+    assert store.condensed
+    assert "## Progress\nxxxxxxxxxx" in summary and "written meanwhile" in summary
+    assert (tmp_path / STATE_SUMMARY_FILE).read_text() == summary
@@ -0,0 +1,83 @@
+import json
+from openai import OpenAI
+from openai.types.chat import ChatCompletionMessageToolCall
+from gpt_worker.agents import Worker
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.history import summarize_turns
+from gpt_worker.messages import BlobStore, MessageStore, to_api, tool_call_dict
+from gpt_worker.routing import RoutingPolicy
+from tests.openai_stub import OpenAIStub, chat_completion
+
+def read_call(call_id, path):
+    return {"id": call_id, "type": "function", "function": {"name": "FileReader", "arguments": json.dumps({"path": path})}}
+
+def conversation():
+    content = "ok path=a.py\n" + "x = 1\n" * 1000
+    return [
+        {"role": "system", "content": "あなたはエージェントです"},
+        {"role": "user", "content": "作業して"},
+        {"role": "assistant", "tool_calls": [read_call("call_1", "a.py")]},
+        {"role": "tool", "content": content, "tool_call_id": "call_1"},
+        {"role": "assistant", "tool_calls": [read_call("call_2", "a.py")]},
+        # 同じファイルを読み直した結果は別の文字列として届く
+        {"role": "tool", "content": "".join(content), "tool_call_id": "call_2"},
+        {"role": "assistant", "content": "完了しました"},
+    ]
+
+def test_round_trip():
+    messages = conversation()
+    store = MessageStore(messages)
+
+    assert store.to_api() == messages
+    assert list(store) == messages
+    assert store[3] == messages[3]
+    assert store[-1] == messages[-1]
+    assert store[2:4] == messages[2:4]
+    assert len(store) == len(messages)
+    assert summarize_turns(store) == summarize_turns(messages)
+    assert to_api(messages) is messages
+
+    store.append({"role": "user", "content": "続けて", "name": "operator"})
+    assert store[-1] == {"role": "user", "content": "続けて", "name": "operator"}
+
+def test_payloads_kept_once():
+    messages = conversation()
+    store = MessageStore(messages)
+
+    # 同じ内容のツール結果と引数は1つずつしか保持しない
+    assert len(store.blobs) == 2
+    assert store[3]["content"] is store[5]["content"]
+    assert store.blobs.put(messages[3]["content"]) == BlobStore.blob_id(messages[5]["content"])
+
+def test_tool_call_dict():
+    sdk_call = ChatCompletionMessageToolCall(id="call_1", type="function", function={"name": "FileReader", "arguments": "{}"})
+    assert tool_call_dict(sdk_call) == {"id": "call_1", "type": "function", "function": {"name": "FileReader", "arguments": "{}"}}
+
+    store = MessageStore([{"role": "assistant", "tool_calls": [sdk_call]}])
+    assert store[0]["tool_calls"] == [tool_call_dict(sdk_call)]
+    # ルーティングもストアをそのまま読める
+    assert RoutingPolicy().route_for("worker", store) == "worker_explore"
+
+def test_worker_sends_api_format(monkeypatch, tmp_path):
+    (tmp_path / "a.py").write_text("x = 1\n")
+    requests = []
+    turns = iter([
+        chat_completion("m", content=None, tool_calls=[read_call("call_1", str(tmp_path / "a.py"))]),
+        chat_completion("m", content="done"),
+    ])
+
+    def handler(method, path, body):
+        requests.append(body)
+        return 200, next(turns)
+
+    dataholder = DataHolder(tasklist=[{"task_id": 0, "name": "t", "done_flg": False}], state_summary="", workspace_dir=str(tmp_path))
+    with OpenAIStub(handler) as stub:
+        monkeypatch.setattr(OpenAIConnector, "_client", OpenAI(base_url=stub.base_url, api_key="test", max_retries=0))
+        messages = list(Worker(dataholder).run(model="m", max_iterations=1))
+
+    # 2回目のリクエストには前のターンがAPI形式で入っている
+    sent = requests[1]["messages"]
+    assert sent[-2]["tool_calls"] == [read_call("call_1", str(tmp_path / "a.py"))]
+    assert sent[-1]["role"] == "tool" and sent[-1]["tool_call_id"] == "call_1" and "x = 1" in sent[-1]["content"]
+    assert messages[0]["tool_calls"][0]["function"]["name"] == "FileReader"
@@ -0,0 +1,58 @@
+from gpt_worker import outline
+from gpt_worker.outline import outline_python, outline_generic, outline_source
+
+SOURCE = '''"""Sample module."""
+MAX_RETRIES = 3
+
+class Connector(Base):
+    def create(self, messages: list, retries: int = 3, *, model=None) -> dict:
+        pass
+
+    @classmethod
+    async def close(cls, **kwargs):
+        pass
+
+def helper(*args):
+    pass
+'''
+
+def test_outline_python():
+    assert outline_python(SOURCE) == [
+        '"""Sample module."""',
+        "L2 MAX_RETRIES = ...",
+        "L4 class Connector(Base)",
+        "L5   def create(self, messages: list, retries: int=3, *, model=None) -> dict",
+        "L9   @classmethod async def close(cls, **kwargs)",
+        "L12 def helper(*args)",
+    ]
+
+def test_outline_generic():
+    source = (
+        "# Title\n"
+        "export async function load(path) {\n"
+        "  return read(path);\n"
+        "}\n"
+        "const handler = (event) => {\n"
+        "pub fn run(config: Config) -> Result<()> {\n"
+        "func (s *Server) Serve() error {\n"
+    )
+    assert outline_generic(source) == [
+        "L1 # Title",
+        "L2 export async function load(path)",
+        "L5 const handler = (event) =>",
+        "L6 pub fn run(config: Config) -> Result<()>",
+        "L7 func (s *Server) Serve() error",
+    ]
+
+def test_outline_is_cached_by_content(monkeypatch):
+    calls = []
+    original = outline.outline_python
+    monkeypatch.setattr(outline, "outline_python", lambda source: calls.append(source) or original(source))
+
+    first = outline_source("a.py", SOURCE + "\n# a")
+    second = outline_source("b.py", SOURCE + "\n# a")
+    assert first == second
+    assert len(calls) == 1
+
+    # 構文エラーのPythonファイルは正規表現で処理する
+    assert outline_source("broken.py", "def ok():\n    pass\ndef broken(:\n") == ["L1 def ok():", "L3 def broken(:"]
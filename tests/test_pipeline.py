@@ -0,0 +1,141 @@
+import threading
+import pytest
+from types import SimpleNamespace
+from gpt_worker.agents import Orchestrator, Planner, Worker
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.tools import PlanMaker
+
+def task(name, done=False):
+    return {"name": name, "description": "", "next_step": "", "done_flg": done}
+
+def test_merge_tasklist(tmp_path):
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+    dataholder.merge_plans = True
+    PlanMaker.run({"tasklist": [task("a", True), task("b"), task("c")], "dataholder": dataholder})
+
+    # 計画を見ていない別のエージェントが書いた計画でも、完了済みのタスクと追加されたタスクは失われない
+    writer = threading.Thread(target=PlanMaker.run, args=({"tasklist": [task("b"), task("d")], "dataholder": dataholder},))
+    writer.start()
+    writer.join()
+    assert [(t["name"], t["done_flg"], t["task_id"]) for t in dataholder.tasklist] == [
+        ("a", True, 0), ("b", False, 1), ("d", False, 2), ("c", False, 3),
+    ]
+    assert dataholder.plan_version == 2
+
+    # 自分が見た計画から消したタスクは削除される
+    dataholder.remember_plan()
+    PlanMaker.run({"tasklist": [task("b"), task("d")], "dataholder": dataholder})
+    assert [(t["name"], t["done_flg"]) for t in dataholder.tasklist] == [("a", True), ("b", False), ("d", False)]
+
+def test_pipelined_run(tmp_path, monkeypatch):
+    first_task_done = threading.Event()
+    worker_runs = []
+
+    def planner_run(self, **kwargs):
+        PlanMaker.run({"tasklist": [task("a"), task("b")], "dataholder": self.dataholder})
+        yield {"role": "assistant", "content": "plan saved"}
+        # Workerが作業している間に計画を見直す
+        assert first_task_done.wait(5)
+        PlanMaker.run({"tasklist": [task("a"), task("b"), task("c")], "dataholder": self.dataholder})
+        yield {"role": "assistant", "content": "plan refined"}
+
+    def worker_run(self, **kwargs):
+        worker_runs.append([t["name"] for t in self.dataholder.tasklist])
+        PlanMaker.run({"tasklist": [dict(t, done_flg=True) for t in self.dataholder.tasklist], "dataholder": self.dataholder})
+        first_task_done.set()
+        self.progress = SimpleNamespace(stop_reason="completed")
+        yield {"role": "assistant", "content": "worked"}
+
+    monkeypatch.setattr(Planner, "run", planner_run)
+    monkeypatch.setattr(Worker, "run", worker_run)
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+
+    messages = [message["content"] for message in Orchestrator(dataholder).run(order="作る", pipeline=True)]
+
+    assert messages[0] == "plan saved"
+    assert sorted(messages) == sorted(["plan saved", "plan refined", "worked", "worked"])
+    # 計画の見直しで追加されたタスクは2回目のWorkerで処理される
+    assert worker_runs == [["a", "b"], ["a", "b", "c"]]
+    assert [(t["name"], t["done_flg"]) for t in dataholder.tasklist] == [("a", True), ("b", True), ("c", True)]
+    assert dataholder.merge_plans == False
+
+def test_pipelined_run_closed(tmp_path, monkeypatch):
+    stopped = []
+
+    def agent_run(name):
+        def run(self, **kwargs):
+            if name == "planner":
+                PlanMaker.run({"tasklist": [task("a")], "dataholder": self.dataholder})
+            yield {"role": "assistant", "content": name}
+            # 呼び出し元が止めるまで作業を続ける
+            assert kwargs["cancel"].wait(5)
+            stopped.append(name)
+            yield {"role": "assistant", "content": f"{name} again"}
+        return run
+
+    monkeypatch.setattr(Planner, "run", agent_run("planner"))
+    monkeypatch.setattr(Worker, "run", agent_run("worker"))
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+
+    run = Orchestrator(dataholder).run(order="作る", pipeline=True)
+    assert {next(run)["content"], next(run)["content"]} == {"planner", "worker"}
+    run.close()
+
+    # ジェネレーターを閉じるとPlannerとWorkerのスレッドも止まる
+    assert sorted(stopped) == ["planner", "worker"]
+    assert not [thread for thread in threading.enumerate() if thread.name in ("gptw-planner", "gptw-worker")]
+    assert dataholder.merge_plans == False
+
+def test_pipelined_revision_renames_task(tmp_path, monkeypatch):
+    worker_started = threading.Event()
+    revised = threading.Event()
+
+    def planner_run(self, **kwargs):
+        self.dataholder.remember_plan()
+        PlanMaker.run({"tasklist": [task("a"), task("b")], "dataholder": self.dataholder})
+        yield {"role": "assistant", "content": "plan saved"}
+        # Workerが作業を始めてから、タスクbをb2に改名し、aを削除する
+        assert worker_started.wait(5)
+        PlanMaker.run({"tasklist": [task("b2")], "dataholder": self.dataholder})
+        revised.set()
+        yield {"role": "assistant", "content": "plan revised"}
+
+    def worker_run(self, **kwargs):
+        self.dataholder.remember_plan()
+        seen = [dict(t) for t in self.dataholder.tasklist]
+        worker_started.set()
+        assert revised.wait(5)
+        # 改名前の計画を見たWorkerが、追加したタスクとともに保存する
+        PlanMaker.run({"tasklist": seen + [task("c")], "dataholder": self.dataholder})
+        self.progress = SimpleNamespace(stop_reason="stagnated")
+        yield {"role": "assistant", "content": "worked"}
+
+    monkeypatch.setattr(Planner, "run", planner_run)
+    monkeypatch.setattr(Worker, "run", worker_run)
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+    list(Orchestrator(dataholder).run(order="作る", pipeline=True))
+
+    # 改名・削除されたタスクは重複して残らず、Workerが追加したタスクは残る
+    assert sorted(t["name"] for t in dataholder.tasklist) == ["b2", "c"]
+
+def test_pipelined_error_stops_other_agent(tmp_path, monkeypatch):
+    planner_stopped = threading.Event()
+
+    def planner_run(self, **kwargs):
+        PlanMaker.run({"tasklist": [task("a")], "dataholder": self.dataholder})
+        yield {"role": "assistant", "content": "plan saved"}
+        # Workerが失敗したら、終わるのを待たずに止められる
+        assert kwargs["cancel"].wait(5)
+        planner_stopped.set()
+        kwargs["cancel"].check()
+
+    def worker_run(self, **kwargs):
+        raise RuntimeError("boom")
+        yield
+
+    monkeypatch.setattr(Planner, "run", planner_run)
+    monkeypatch.setattr(Worker, "run", worker_run)
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        list(Orchestrator(dataholder).run(order="作る", pipeline=True))
+    assert planner_stopped.is_set()
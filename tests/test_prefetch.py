@@ -0,0 +1,66 @@
+import json
+import os
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.prefetch import Prefetcher, ReadCache, predict_paths
+
+def test_read_cache_validates_by_mtime(tmp_path):
+    cache = ReadCache()
+    path = tmp_path / "a.txt"
+    path.write_text("one")
+
+    assert cache.read(str(path)) == "one"
+    assert cache.read(str(path)) == "one"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # 更新されたファイルはキャッシュから返さない
+    path.write_text("second")
+    os.utime(path, ns=(1, 1))
+    assert cache.read(str(path)) == "second"
+    assert cache.misses == 2
+
+def test_read_cache_evicts_by_size(tmp_path):
+    cache = ReadCache(max_bytes=10)
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_text("x" * 4)
+        cache.read(str(tmp_path / name))
+    cache.read(str(tmp_path / "a"))
+    assert cache.misses == 4
+
+def test_prefetch_hits_are_counted(tmp_path):
+    cache = ReadCache()
+    (tmp_path / "README.md").write_text("readme")
+    (tmp_path / "other.txt").write_text("other")
+
+    prefetcher = Prefetcher(cache)
+    prefetcher.prefetch([str(tmp_path / "README.md"), str(tmp_path / "other.txt")])
+    prefetcher.executor.shutdown(wait=True)
+
+    assert cache.read(str(tmp_path / "README.md")) == "readme"
+    assert cache.read(str(tmp_path / "README.md")) == "readme"
+    stats = cache.stats()
+    assert stats["prefetched"] == 2
+    assert stats["prefetch_hits"] == 1
+    assert stats["prefetch_hit_rate"] == 0.5
+    assert stats["hit_rate"] == 1.0
+
+def test_predict_paths(tmp_path):
+    (tmp_path / "src").mkdir()
+    for name in ("src/app.py", "src/done.py", "notes.md", "README.md"):
+        (tmp_path / name).write_text("")
+    dataholder = DataHolder(
+        tasklist=[
+            {"task_id": 0, "name": "修正", "next_step": "Fix the bug in src/app.py", "done_flg": False},
+            {"task_id": 1, "name": "完了", "next_step": "Edit src/done.py", "done_flg": True},
+        ],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+    messages = [{"role": "assistant", "tool_calls": [
+        {"id": "c", "type": "function", "function": {"name": "FileWriter", "arguments": json.dumps({"path": "notes.md", "content": ""})}},
+    ]}]
+
+    assert predict_paths(dataholder, messages) == [
+        os.path.join(str(tmp_path), "notes.md"),
+        os.path.join(str(tmp_path), "src/app.py"),
+        os.path.join(str(tmp_path), "README.md"),
+    ]
@@ -0,0 +1,81 @@
+import json
+import time
+from openai import OpenAI
+from gpt_worker.agents import Planner
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.profiler import Profiler, format_profile_summary, profiler
+from tests.openai_stub import OpenAIStub, chat_completion
+
+def test_phases_nest():
+    timer = Profiler()
+    # 停止中は何も記録しない
+    with timer.phase("outer"):
+        pass
+    assert timer.phases == {}
+
+    timer.start()
+    with timer.phase("outer"):
+        time.sleep(0.02)
+        with timer.phase("inner"):
+            time.sleep(0.02)
+    with timer.phase("inner"):
+        pass
+    timer.stop()
+
+    assert timer.phases["outer"][0] == 1 and timer.phases["inner"][0] == 2
+    calls, total, self_time = timer.phases["outer"]
+    assert total >= 0.04 and 0.02 <= self_time < total
+    assert set(timer.stacks) == {("outer",), ("outer", "inner"), ("inner",)}
+
+    lines = timer.collapsed_stacks().splitlines()
+    stacks = dict(line.rsplit(" ", 1) for line in lines)
+    assert int(stacks["outer;inner"]) >= 20000
+    summary = format_profile_summary(timer)
+    assert "outer" in summary and "(outside phases)" in summary
+
+def test_generator_closed_out_of_order():
+    timer = Profiler()
+    timer.start()
+
+    def agent():
+        with timer.phase("agent"):
+            yield 1
+            yield 2
+
+    messages = agent()
+    next(messages)
+    with timer.phase("consumer"):
+        # ジェネレーターが途中で閉じられても、フェーズのスタックは壊れない
+        messages.close()
+    with timer.phase("after"):
+        pass
+    timer.stop()
+
+    assert ("after",) in timer.stacks
+    assert timer._stack() == []
+
+def test_run_phases(monkeypatch, tmp_path):
+    (tmp_path / "README.md").write_text("hello")
+    turns = iter([
+        chat_completion("m", content=None, tool_calls=[{
+            "id": "call_1", "type": "function",
+            "function": {"name": "FileReader", "arguments": json.dumps({"file_path": str(tmp_path / "README.md")})},
+        }]),
+        chat_completion("m", content="done"),
+    ])
+
+    with OpenAIStub(lambda method, path, body: (200, next(turns))) as stub:
+        monkeypatch.setattr(OpenAIConnector, "_client", OpenAI(base_url=stub.base_url, api_key="test", max_retries=0))
+        dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+        profiler.start()
+        try:
+            list(Planner(dataholder).run(order="read", model="m"))
+        finally:
+            profiler.stop()
+
+    assert profiler.phases["api"][0] == 2
+    assert profiler.phases["tool:FileReader"][0] == 1
+    assert profiler.phases["json"][0] == 2
+    assert ("planner", "prompt") in profiler.stacks
+    assert ("planner", "api") in profiler.stacks
@@ -0,0 +1,87 @@
+import json
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.progress import ProgressTracker
+
+def make_dataholder(tmp_path):
+    return DataHolder(
+        tasklist=[{"task_id": 0, "name": "タスク", "next_step": "開始", "done_flg": False}],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+
+def tool_message(content):
+    return {"role": "tool", "tool_call_id": "c", "content": json.dumps(content)}
+
+def test_next_step_edit_counts_as_progress(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder)
+
+    # done_flgが変わらなくてもnext_stepの変更は進捗とみなす
+    dataholder.tasklist[0]["next_step"] = "続き"
+    assert tracker.record_iteration([]) is True
+    assert tracker.should_stop() is False
+
+def test_file_change_counts_as_progress(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder)
+
+    (tmp_path / "output.txt").write_text("結果")
+    assert tracker.record_iteration([]) is True
+
+def test_no_change_stops_with_explanation(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder)
+
+    assert tracker.record_iteration([]) is False
+    assert tracker.should_stop() is True
+    assert tracker.stop_reason == "stagnation"
+    assert "Warning: No progress detected in tasks" in tracker.explanation
+
+def test_flag_flipping_is_not_progress(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder, stagnation_window=2)
+    outcome = [tool_message({"success": True})]
+
+    dataholder.tasklist[0]["done_flg"] = True
+    assert tracker.record_iteration(outcome) is True
+
+    # 以前と同じ状態と結果に戻るだけのイテレーションは進捗ではない
+    dataholder.tasklist[0]["done_flg"] = False
+    assert tracker.record_iteration(outcome) is False
+    assert tracker.should_stop() is False
+    dataholder.tasklist[0]["done_flg"] = True
+    assert tracker.record_iteration(outcome) is False
+
+    dataholder.tasklist[0]["done_flg"] = False
+    assert tracker.should_stop() is True
+    assert tracker.revisited is True
+    assert "returned to an earlier state" in tracker.explanation
+
+def test_new_tool_outcomes_count_as_progress(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder)
+
+    assert tracker.record_iteration([tool_message({"success": True, "content": "a"})]) is True
+    assert tracker.record_iteration([tool_message({"success": True, "content": "a"})]) is False
+
+def test_budgets(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder, token_budget=100)
+    dataholder.usage_log.append({"prompt_tokens": 90, "completion_tokens": 20, "cached_tokens": 0})
+    assert tracker.should_stop() is True
+    assert tracker.stop_reason == "token_budget"
+
+    tracker = ProgressTracker(dataholder, time_budget=0)
+    assert tracker.should_stop() is True
+    assert tracker.stop_reason == "time_budget"
+
+def test_completed_and_max_iterations(tmp_path):
+    dataholder = make_dataholder(tmp_path)
+    tracker = ProgressTracker(dataholder, max_iterations=0)
+    assert tracker.should_stop() is True
+    assert tracker.stop_reason == "max_iterations"
+
+    dataholder.tasklist[0]["done_flg"] = True
+    tracker = ProgressTracker(dataholder)
+    assert tracker.should_stop() is True
+    assert tracker.stop_reason == "completed"
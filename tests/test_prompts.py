@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.prompts import TaskListView, build_planner_messages, build_worker_messages, format_directory_structure, format_tasklist
+from gpt_worker.telemetry import usage_from_response, summarize_usage
+
+def make_dataholder(workspace_dir, state_summary="", tasklist=None):
+    return DataHolder(tasklist=tasklist or [], state_summary=state_summary, workspace_dir=str(workspace_dir))
+
+def test_planner_prefix_is_stable(tmp_path):
+    before = build_planner_messages(make_dataholder(tmp_path, "状態A"), order="テスト")
+
+    (tmp_path / "new.txt").write_text("追加")
+    task = {"task_id": 0, "name": "タスク", "done_flg": False}
+    after = build_planner_messages(make_dataholder(tmp_path, "状態B", [task]), order="テスト")
+
+    # システムプロンプトと指示は変化せず、末尾のメッセージだけが変わる
+    assert before[:-1] == after[:-1]
+    assert before[-1] != after[-1]
+    assert "new.txt" in after[-1]["content"]
+    assert "状態B" in after[-1]["content"]
+
+def test_worker_prefix_is_stable(tmp_path):
+    before = build_worker_messages(make_dataholder(tmp_path, "状態A"), order="テスト")
+    after = build_worker_messages(make_dataholder(tmp_path, "状態B"), order="テスト")
+
+    assert before[0]["role"] == "system"
+    assert str(tmp_path) in before[0]["content"]
+    assert before[:-1] == after[:-1]
+    assert "状態A" not in before[0]["content"]
+
+def test_directory_structure_is_sorted(tmp_path):
+    (tmp_path / "b.txt").write_text("")
+    (tmp_path / "a.txt").write_text("")
+    (tmp_path / ".hidden").mkdir()
+
+    structure = format_directory_structure(str(tmp_path))
+    assert structure == str((str(tmp_path), [".hidden"], ["a.txt", "b.txt"])) + "\n"
+
+def make_tasks(count, done):
+    return [
+        {"task_id": i, "name": f"タスク{i}", "description": f"説明{i}", "next_step": f"次{i}", "done_flg": i < done}
+        for i in range(count)
+    ]
+
+def test_tasklist_compact_view():
+    rendered = format_tasklist(make_tasks(7, 2), TaskListView(frontier=2))
+    assert rendered.splitlines() == [
+        "2 of 7 tasks done: #0 タスク0, #1 タスク1",
+        "task_id|name|next_step|description",
+        "2|タスク2|次2|説明2",
+        "3|タスク3|次3|説明3",
+        "Later tasks: #4 タスク4, #5 タスク5, #6 タスク6",
+    ]
+
+def test_tasklist_full_view_keeps_every_field():
+    tasks = make_tasks(3, 1)
+    tasks[2]["description"] = "複数行\nの|説明"
+    rendered = format_tasklist(tasks, TaskListView.full())
+    assert rendered.splitlines() == [
+        "task_id|done_flg|name|next_step|description",
+        "0|True|タスク0|次0|説明0",
+        "1|False|タスク1|次1|説明1",
+        "2|False|タスク2|次2|複数行 の/説明",
+    ]
+
+def test_worker_context_uses_tasklist_view(tmp_path):
+    dataholder = make_dataholder(tmp_path, tasklist=make_tasks(10, 8))
+    context = build_worker_messages(dataholder)[-1]["content"]
+    assert "8 of 10 tasks done" in context
+    assert "説明0" not in context
+    assert "説明0" in build_worker_messages(dataholder, tasklist_view=TaskListView.full())[-1]["content"]
+
+def test_usage_cached_ratio():
+    response = SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=1000,
+        completion_tokens=50,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=750),
+    ))
+    record = usage_from_response(response, "gpt-4o")
+    assert record["cached_tokens"] == 750
+
+    # usageが返らない場合は0として扱う
+    empty = usage_from_response(SimpleNamespace(usage=None), "gpt-4o")
+    summary = summarize_usage([record, empty])
+    assert summary["turns"] == 2
+    assert summary["cached_ratio"] == 0.75
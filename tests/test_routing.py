@@ -0,0 +1,90 @@
+import json
+import pytest
+from openai import OpenAI
+from gpt_worker.connector import OpenAIConnector
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.routing import RoutingPolicy, RoutingError, is_read_only_call
+from gpt_worker.telemetry import estimate_cost, summarize_by_route
+from tests.openai_stub import OpenAIStub, chat_completion
+
+def assistant_calls(*calls):
+    return {"role": "assistant", "tool_calls": [
+        {"id": str(i), "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+        for i, (name, args) in enumerate(calls)
+    ]}
+
+def test_route_selection():
+    policy = RoutingPolicy({"planner": "strong", "worker_explore": "cheap", "worker_edit": "strong"})
+    user = {"role": "user", "content": "作業して"}
+
+    assert policy.select("planner", [user], "default") == ("planner", "strong")
+    # 最初のターンは編集ルート
+    assert policy.select("worker", [user], "default") == ("worker_edit", "strong")
+    # 読み取りだけのツール呼び出しの後は探索ルート
+    explore = [user, assistant_calls(("FileReader", {"path": "a.py"}), ("ScriptExecutor", {"script": "ls -la | grep py"}))]
+    assert policy.select("worker", explore, "default") == ("worker_explore", "cheap")
+    edit = [user, assistant_calls(("FileReader", {"path": "a.py"}), ("FileWriter", {"path": "a.py", "content": ""}))]
+    assert policy.select("worker", edit, "default") == ("worker_edit", "strong")
+
+def test_read_only_scripts():
+    assert is_read_only_call(assistant_calls(("ScriptExecutor", {"script": "cat a.txt && wc -l a.txt"}))["tool_calls"][0])
+    assert not is_read_only_call(assistant_calls(("ScriptExecutor", {"script": "ls; rm -rf build"}))["tool_calls"][0])
+    assert is_read_only_call(assistant_calls(("ScriptExecutor", {"script": "timeout 5 grep -r x src 2>/dev/null 2>&1 < in.txt"}))["tool_calls"][0])
+    # リダイレクトや書き込むオプション、置換を含むスクリプトは読み取りだけとはみなさない
+    for script in ("cat a.txt > b.txt", "ls >> log.txt", "ls &> log.txt", "cat a.txt | tee b.txt", "find . -name '*.pyc' -delete",
+                   "find . -exec rm {} ;", "sed -i s/a/b/ a.txt", "tree -o out.txt", "ls | xargs rm", "cat $(rm x)",
+                   "ls `rm x`", "cat <(rm x)", "cat 'unbalanced"):
+        assert not is_read_only_call(assistant_calls(("ScriptExecutor", {"script": script}))["tool_calls"][0]), script
+
+def test_unconfigured_routes_use_default_model():
+    policy = RoutingPolicy()
+    assert policy.select("planner", [], "gpt-4o") == ("planner", "gpt-4o")
+    assert policy.fallback_for("gpt-4o", "gpt-4o") is None
+
+def test_load_from_file_and_options(tmp_path):
+    (tmp_path / ".gpt_worker").mkdir()
+    (tmp_path / ".gpt_worker" / "routing.json").write_text(json.dumps({"worker_explore": "gpt-4o-mini", "fallback": "gpt-4o"}))
+
+    policy = RoutingPolicy.load(str(tmp_path), ["planner=gpt-4.1"])
+    assert policy.routes == {"worker_explore": "gpt-4o-mini", "planner": "gpt-4.1"}
+    assert policy.fallback_for("gpt-4o-mini", "default") == "gpt-4o"
+
+    with pytest.raises(RoutingError):
+        RoutingPolicy.load(str(tmp_path), ["unknown=gpt-4o"])
+    with pytest.raises(RoutingError):
+        RoutingPolicy.load(str(tmp_path), ["planner"])
+
+def test_fallback_on_model_error(monkeypatch, tmp_path):
+    def responder(method, path, body):
+        if body["model"] == "broken-model":
+            return 400, {"error": {"message": "model not available", "type": "invalid_request_error"}}
+        return 200, chat_completion(body["model"], content="完了")
+
+    with OpenAIStub(responder) as stub:
+        monkeypatch.setattr(OpenAIConnector, "_client", OpenAI(base_url=stub.base_url, api_key="test", max_retries=0))
+        dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+        policy = RoutingPolicy({"planner": "broken-model"}, fallback_model="gpt-4o-mini")
+
+        messages = [{"role": "user", "content": "計画して"}]
+        replies = list(OpenAIConnector.CreateResponse(messages, [], dataholder, "gpt-4o", routing=policy, role="planner"))
+
+    assert replies[0]["content"] == "完了"
+    assert [body["model"] for _, _, body in stub.requests] == ["broken-model", "gpt-4o-mini"]
+    assert dataholder.usage_log[0]["route"] == "planner"
+    assert dataholder.usage_log[0]["model"] == "gpt-4o-mini"
+
+def test_cost_and_route_summary():
+    assert estimate_cost("gpt-4o-2024-08-06", 1_000_000, 0, 0) == 2.50
+    assert estimate_cost("gpt-4o-mini", 1_000_000, 1_000_000, 0) == 0.075
+    assert estimate_cost("unknown-model", 10, 0, 10) is None
+
+    usage_log = [
+        {"model": "gpt-4o", "route": "planner", "prompt_tokens": 100, "cached_tokens": 0, "completion_tokens": 10, "latency": 2.0, "cost": 0.01},
+        {"model": "gpt-4o-mini", "route": "worker_explore", "prompt_tokens": 50, "cached_tokens": 0, "completion_tokens": 5, "latency": 0.5, "cost": None},
+        {"model": "gpt-4o-mini", "route": "worker_explore", "prompt_tokens": 50, "cached_tokens": 0, "completion_tokens": 5, "latency": 1.5, "cost": 0.001},
+    ]
+    summary = summarize_by_route(usage_log)
+    assert summary["planner"]["cost"] == 0.01
+    assert summary["worker_explore"]["turns"] == 2
+    assert summary["worker_explore"]["avg_latency"] == 1.0
+    assert summary["worker_explore"]["models"] == ["gpt-4o-mini"]
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.sandbox import SandboxLimits, run_command
+from gpt_worker.tools import ScriptExecutor
+
+def test_run_command_reports_usage(tmp_path):
+    result = run_command("python -c \"x = bytearray(64 * 1024 * 1024); print(len(x))\"", cwd=str(tmp_path))
+    assert result.returncode == 0
+    assert result.stdout.strip() == str(64 * 1024 * 1024)
+    assert result.peak_rss_mb >= 64
+    assert result.cpu_seconds > 0
+
+def test_cpu_limit_kills_command(tmp_path):
+    limits = SandboxLimits(cpu_seconds=1, ionice=False)
+    result = run_command("python -c 'while True: pass'", cwd=str(tmp_path), timeout=20, limits=limits)
+    assert result.signal_name in ("SIGXCPU", "SIGKILL")
+    assert not result.timed_out
+    assert result.cpu_seconds >= 0.9
+
+def test_limits_applied_from_threads(tmp_path):
+    limits = SandboxLimits(cpu_seconds=7, ionice=False)
+    results = []
+    # 制限はfork後のPythonコードではなくラッパーで設定するので、スレッドから同時に実行しても安全
+    threads = [threading.Thread(target=lambda: results.append(run_command("ulimit -t; nice", cwd=str(tmp_path), limits=limits)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [result.stdout.split() for result in results] == [["7", str(min(os.nice(0) + limits.nice, 19))]] * 8
+
+def test_default_limits_allow_threads(tmp_path):
+    # 既定の制限では多数のスレッドを使うプログラムも動く
+    script = "python -c \"import threading; ts = [threading.Thread(target=lambda: None) for _ in range(200)]; [t.start() for t in ts]; [t.join() for t in ts]; print('ok')\""
+    result = run_command(script, cwd=str(tmp_path), limits=SandboxLimits(ionice=False))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
+
+def test_memory_and_file_size_limits(tmp_path):
+    limits = SandboxLimits(memory_bytes=256 * 1024 * 1024, file_size_bytes=1024, ionice=False)
+    result = run_command("python -c \"bytearray(512 * 1024 * 1024)\"", cwd=str(tmp_path), limits=limits)
+    assert result.returncode != 0
+    assert "MemoryError" in result.stderr
+
+    result = run_command("head -c 4096 /dev/zero > big.bin", cwd=str(tmp_path), limits=limits)
+    assert result.returncode != 0
+    assert (tmp_path / "big.bin").stat().st_size <= 1024
+
+def test_timeout_kills_process_group(tmp_path):
+    started = time.monotonic()
+    result = run_command("sleep 30 & sleep 30", cwd=str(tmp_path), timeout=1)
+    assert result.timed_out
+    assert time.monotonic() - started < 10
+
+def test_script_executor_reports_usage(tmp_path):
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+    dataholder.sandbox = SandboxLimits(ionice=False)
+
+    result = ScriptExecutor.run({"script": "echo ok", "ask_user": False, "dataholder": dataholder})
+    assert result["success"] == True
+    assert result["content"] == "ok\n"
+    assert result["cpu_seconds"] >= 0
+    assert result["peak_rss_mb"] > 0
+
+def test_limit_options_reach_command(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+    from gpt_worker.agents import Orchestrator, Worker
+    from gpt_worker.cli import cli
+
+    assert "RLIMIT_AS" not in SandboxLimits.from_options().command_prefix()[6]
+    prefixes = []
+
+    def capture(self, **kwargs):
+        prefixes.append(self.dataholder.sandbox.command_prefix()[6])
+        self.progress = type("Progress", (), {"stop_reason": "completed", "explanation": ""})()
+        return iter([])
+
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(Orchestrator, "run", capture)
+    monkeypatch.setattr(Worker, "run", capture)
+    (tmp_path / ".gpt_worker").mkdir()
+    (tmp_path / ".gpt_worker" / "plan.json").write_text('[{"task_id": 0, "name": "a", "description": "", "next_step": "", "done_flg": false}]')
+    options = ["--sandbox-memory", "256", "--sandbox-max-processes", "64"]
+    runner = CliRunner()
+    # runとqueue workのオプションでメモリとプロセス数の制限を設定できる
+    assert runner.invoke(cli, ["run", "-d", str(tmp_path), "--no-watch"] + options).exit_code == 0
+    assert runner.invoke(cli, ["queue", "publish", "-d", str(tmp_path)]).exit_code == 0
+    assert runner.invoke(cli, ["queue", "work", "-d", str(tmp_path), "--max-tasks", "1"] + options).exit_code == 0
+    assert prefixes == ["RLIMIT_CPU:60:65,RLIMIT_AS:268435456:268435456,RLIMIT_FSIZE:1073741824:1073741824,RLIMIT_NPROC:64:64"] * 2
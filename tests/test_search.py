@@ -0,0 +1,42 @@
+import os
+from gpt_worker.search import SearchIndex, tokenize
+
+def test_tokenize_splits_identifiers():
+    tokens = tokenize("def CreateResponse(max_retries): return HTTPServer")
+    assert {"createresponse", "create", "response", "max_retries", "max", "retries", "httpserver", "http", "server"} <= tokens
+
+def test_incremental_update(tmp_path):
+    (tmp_path / "a.py").write_text("alpha = 1\n")
+    (tmp_path / "b.py").write_text("beta = 2\n")
+    (tmp_path / "__pycache__").mkdir()
+    (tmp_path / "__pycache__" / "a.pyc").write_bytes(b"\0alpha")
+
+    index = SearchIndex(str(tmp_path))
+    assert index.update() == (2, 0)
+    assert index.update() == (0, 0)
+    index.save()
+
+    # 保存したインデックスを読み込み、変更分だけ更新する
+    (tmp_path / "b.py").write_text("beta = 2\ngamma = 3\n")
+    os.remove(tmp_path / "a.py")
+    reloaded = SearchIndex(str(tmp_path))
+    reloaded.load()
+    assert reloaded.update() == (1, 1)
+    assert "alpha" not in reloaded.postings
+    result = reloaded.search("gamma")[0]
+    assert (result["path"], result["line"], result["snippet"]) == ("b.py", 2, "gamma = 3")
+
+def test_search_ranking_and_budget(tmp_path):
+    (tmp_path / "both.py").write_text("retry = 0\nrate_limit_retry = 1\n")
+    (tmp_path / "one.py").write_text("retry = 0\n")
+    (tmp_path / "many.txt").write_text("retry\n" * 100)
+
+    index = SearchIndex(str(tmp_path))
+    index.update()
+
+    results = index.search("rate limit retry")
+    assert (results[0]["path"], results[0]["line"]) == ("both.py", 2)
+
+    limited = index.search("retry", max_bytes=100)
+    assert sum(len(r["path"]) + len(r["snippet"]) + 10 for r in limited) <= 100
+    assert len(limited) < 100
@@ -0,0 +1,248 @@
+import http.client
+import json
+import threading
+import time
+import pytest
+from gpt_worker import server as server_module
+from gpt_worker.server import JobManager, RemoteClient, ServerError, create_server, read_token, token_file, write_token
+
+def fake_runner(order, model, directory, **options):
+    yield {"role": "assistant", "content": f"order: {order}"}
+    yield {"role": "tool", "content": '{"success": true}', "tool_call_id": "call_0"}
+
+def failing_runner(order, model, directory, **options):
+    yield {"role": "assistant", "content": "start"}
+    raise RuntimeError("boom")
+
+def start_server(runner):
+    server = create_server(port=0, manager=JobManager(runner=runner))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, RemoteClient(f"http://127.0.0.1:{server.server_address[1]}", token=server.token)
+
+def raw_request(server, method, path, body=b"", headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    status = response.status
+    response.read()
+    connection.close()
+    return status
+
+def test_submit_and_stream_events(tmp_path):
+    server, client = start_server(fake_runner)
+    try:
+        job = client.submit(order="テスト", model="gpt-4o", directory=str(tmp_path))
+        events = list(client.events(job["job_id"]))
+
+        assert events[0] == {"role": "assistant", "content": "order: テスト"}
+        assert events[1]["role"] == "tool"
+
+        status = client.status(job["job_id"])
+        assert status["status"] == "done"
+        assert status["events"] == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_failed_job_reports_error(tmp_path):
+    server, client = start_server(failing_runner)
+    try:
+        job = client.submit(directory=str(tmp_path))
+        events = list(client.events(job["job_id"]))
+        assert len(events) == 1
+
+        status = client.status(job["job_id"])
+        assert status["status"] == "failed"
+        assert "boom" in status["error"]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_job_sandbox_options(tmp_path):
+    received = []
+
+    def runner(order, model, directory, **options):
+        received.append(options)
+        yield {"role": "assistant", "content": "ok"}
+
+    server, client = start_server(runner)
+    try:
+        # ジョブごとにメモリとプロセス数の制限を指定できる
+        job = client.submit(directory=str(tmp_path), sandbox_memory=256, sandbox_max_processes=None)
+        list(client.events(job["job_id"]))
+        assert [{name: value for name, value in options.items() if name != "cancel"} for options in received] == [{"sandbox_memory": 256}]
+        with pytest.raises(ServerError):
+            client.submit(directory=str(tmp_path), sandbox_memory="lots")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def waiting_runner(order, model, directory, cancel, **options):
+    yield {"role": "assistant", "content": "start"}
+    assert cancel.wait(5)
+    cancel.check()
+
+def test_cancel_job(tmp_path):
+    server, client = start_server(waiting_runner)
+    try:
+        job = client.submit(directory=str(tmp_path))
+        events = client.events(job["job_id"])
+        assert next(events)["content"] == "start"
+        # 実行中のジョブをキャンセルできる
+        assert client.cancel(job["job_id"])["job_id"] == job["job_id"]
+        assert list(events) == []
+        assert client.status(job["job_id"])["status"] == "cancelled"
+        with pytest.raises(ServerError):
+            client.cancel("unknown")
+        assert raw_request(server, "POST", f"/jobs/{job['job_id']}/cancel") == 401
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_shutdown_cancels_running_jobs(tmp_path):
+    manager = JobManager(runner=waiting_runner)
+    job = manager.submit(directory=str(tmp_path))
+    while not job.events:
+        time.sleep(0.01)
+    started = time.monotonic()
+    # 終了時は実行中のジョブをキャンセルし、止まるまで待つ
+    manager.shutdown()
+    assert job.status == "cancelled"
+    assert time.monotonic() - started < 5
+
+def test_finished_jobs_and_events_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(server_module, "SERVER_MAX_JOB_EVENTS", 3)
+
+    def runner(order, model, directory, **options):
+        for i in range(10):
+            yield {"role": "assistant", "content": str(i)}
+
+    manager = JobManager(runner=runner, max_finished_jobs=2)
+    jobs = []
+    for _ in range(3):
+        jobs.append(manager.submit(directory=str(tmp_path)))
+        while not jobs[-1].finished:
+            time.sleep(0.01)
+    # ジョブごとのイベントは最新の分だけ保持する
+    assert [event["content"] for event in jobs[-1].iter_events()] == ["7", "8", "9"]
+    assert jobs[-1].to_dict()["events"] == 10
+    # 終了したジョブは上限を超えた古いものから削除する
+    assert [job.job_id for job in manager.list()] == [job.job_id for job in jobs[1:]]
+
+    manager.job_ttl = 0
+    time.sleep(0.01)
+    assert manager.list() == []
+    manager.shutdown()
+
+def test_invalid_requests(tmp_path):
+    server, client = start_server(fake_runner)
+    try:
+        # 存在しないディレクトリ
+        with pytest.raises(ServerError):
+            client.submit(directory=str(tmp_path / "missing"))
+        # 存在しないジョブ
+        with pytest.raises(ServerError):
+            client.status("unknown")
+
+        auth = {"Authorization": f"Bearer {server.token}", "Content-Type": "application/json"}
+        body = json.dumps({"directory": str(tmp_path)})
+        # 不正なContent-Lengthやオブジェクトでない本文は400
+        assert raw_request(server, "POST", "/jobs", body, dict(auth, **{"Content-Length": "x"})) == 400
+        assert raw_request(server, "POST", "/jobs", "[]", auth) == 400
+        # フォームから送れるtext/plainは受け付けない
+        assert raw_request(server, "POST", "/jobs", body, dict(auth, **{"Content-Type": "text/plain"})) == 400
+        assert server.manager.list() == []
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_token_host_and_origin(tmp_path):
+    server, client = start_server(fake_runner)
+    try:
+        body = json.dumps({"directory": str(tmp_path)})
+        headers = {"Content-Type": "application/json"}
+        # トークンがなければジョブを投入できず、一覧も読めない
+        assert raw_request(server, "POST", "/jobs", body, headers) == 401
+        assert raw_request(server, "GET", "/jobs", headers={"Authorization": "Bearer wrong"}) == 401
+        with pytest.raises(ServerError):
+            RemoteClient(client.base_url, token="wrong").submit(directory=str(tmp_path))
+
+        # DNSリバインディング対策: ループバック以外のホスト名や別のOriginは拒否する
+        auth = dict(headers, Authorization=f"Bearer {server.token}")
+        assert raw_request(server, "POST", "/jobs", body, dict(auth, Host="evil.example:8765")) == 403
+        assert raw_request(server, "POST", "/jobs", body, dict(auth, Origin="http://evil.example")) == 403
+        assert raw_request(server, "GET", "/health", headers={"Host": "evil.example"}) == 403
+        assert server.manager.list() == []
+
+        assert raw_request(server, "GET", "/health") == 200
+        assert raw_request(server, "POST", "/jobs", body, auth) == 201
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_token_file(monkeypatch, tmp_path):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.delenv("GPTW_SERVER_TOKEN", raising=False)
+    assert read_token("http://127.0.0.1:9999") is None
+
+    write_token(token_file(9999), "secret")
+    # 他のユーザーからは読めない
+    assert (tmp_path / ".gpt_worker" / "server-9999.token").stat().st_mode & 0o777 == 0o600
+    assert read_token("http://127.0.0.1:9999") == "secret"
+
+    monkeypatch.setenv("GPTW_SERVER_TOKEN", "from-env")
+    assert read_token("http://127.0.0.1:9999") == "from-env"
+
+def test_answer_approval_over_http(tmp_path):
+    manager = JobManager(runner=fake_runner)
+    server = create_server(port=0, manager=manager)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = RemoteClient(f"http://127.0.0.1:{server.server_address[1]}", token=server.token)
+    try:
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(manager.approvals("make install", str(tmp_path), "no rule")))
+        waiting.start()
+        while not client.approvals():
+            pass
+
+        request = client.approvals()[0]
+        assert request["script"] == "make install"
+        assert client.resolve_approval(request["request_id"], False)["status"] == "denied"
+        waiting.join()
+        assert results == [False]
+
+        with pytest.raises(ServerError):
+            client.resolve_approval(request["request_id"], True)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_approvals_need_token(tmp_path):
+    server, client = start_server(fake_runner)
+    manager = server.manager
+    try:
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(manager.approvals("make install", str(tmp_path), "no rule")))
+        waiting.start()
+        while not client.approvals():
+            pass
+        request_id = client.approvals()[0]["request_id"]
+
+        # トークンのない、または別のOriginからのリクエストでは承認を読むことも答えることもできない
+        body = json.dumps({"approve": True})
+        headers = {"Content-Type": "application/json"}
+        assert raw_request(server, "GET", "/approvals") == 401
+        assert raw_request(server, "POST", f"/approvals/{request_id}", body, headers) == 401
+        auth = dict(headers, Authorization=f"Bearer {server.token}")
+        assert raw_request(server, "POST", f"/approvals/{request_id}", body, dict(auth, Origin="http://evil.example")) == 403
+        assert raw_request(server, "POST", f"/approvals/{request_id}", body, dict(auth, Host="evil.example")) == 403
+        assert raw_request(server, "POST", f"/approvals/{request_id}", body, dict(auth, **{"Content-Type": "text/plain"})) == 400
+        assert len(client.approvals()) == 1
+
+        assert client.resolve_approval(request_id, False)["status"] == "denied"
+        waiting.join()
+        assert results == [False]
+    finally:
+        server.shutdown()
+        server.server_close()
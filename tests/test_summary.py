@@ -0,0 +1,45 @@
+from gpt_worker.summary import DEFAULT_SECTION, SummaryStore, parse_sections, render_sections, truncate_condenser
+
+def test_sections_round_trip():
+    text = "前置き\n\n## 目的\nAを作る\n\n## 進捗\n- x.py 完了"
+    sections = parse_sections(text)
+    assert list(sections) == [DEFAULT_SECTION, "目的", "進捗"]
+    assert render_sections(parse_sections(render_sections(sections))) == render_sections(sections)
+    # 見出しのないサマリーはそのまま
+    assert render_sections(parse_sections("現在の状態")) == "現在の状態"
+
+def test_update_merges_sections(tmp_path):
+    store = SummaryStore(str(tmp_path))
+    store.update("## 目的\nAを作る\n\n## 進捗\nなし")
+    summary = store.update("## 進捗\nx.py 完了\n\n## 課題\nテスト不足")
+    assert parse_sections(summary) == {"目的": "Aを作る", "進捗": "x.py 完了", "課題": "テスト不足"}
+
+    # 空のセクションは削除、見出しのない更新は全体を置き換える
+    assert "課題" not in parse_sections(store.update("## 課題\n"))
+    assert store.update("やり直し") == "やり直し"
+    assert (tmp_path / ".gpt_worker/state_summary.md").read_text() == "やり直し"
+
+    history = store.history()
+    assert len(history) == 4
+    assert history[0]["update"] == "## 目的\nAを作る\n\n## 進捗\nなし"
+
+def test_update_condenses_over_budget(tmp_path):
+    calls = []
+    def condenser(title, text, max_chars):
+        calls.append((title, max_chars))
+        return text[:max_chars]
+
+    store = SummaryStore(str(tmp_path), condenser=condenser, section_max_chars=100, max_chars=150)
+    summary = store.update("## A\n" + "a" * 300 + "\n\n## B\n" + "b" * 80)
+    assert calls[0] == ("A", 100)
+    assert len(summary) <= 150
+    assert store.condensed
+    assert len(store.history()[0]["update"]) > 300
+
+    store.update("## B\nshort")
+    assert not store.condensed
+
+def test_truncate_condenser_keeps_whole_lines():
+    text = "line one\nline two\nline three"
+    assert truncate_condenser("A", text, 100) == text
+    assert truncate_condenser("A", text, 25) == "line one\n(condensed)"
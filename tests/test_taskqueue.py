@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from gpt_worker.agents import Worker
+from gpt_worker.constants import PLAN_FILE
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.taskqueue import DONE, FAILED, LEASED, PENDING, MemoryBroker, QueueWorker, SQLiteBroker, collect_results, publish_plan
+from gpt_worker.tools import PlanUpdater
+
+def task(task_id, name, done=False):
+    return {"task_id": task_id, "name": name, "description": "", "next_step": "", "done_flg": done}
+
+@pytest.fixture(params=["memory", "sqlite"])
+def broker(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBroker(max_attempts=2)
+    return SQLiteBroker(str(tmp_path / "queue.sqlite3"), max_attempts=2)
+
+def make_workspace(tmp_path, tasklist):
+    workspace = tmp_path / "workspace"
+    (workspace / ".gpt_worker").mkdir(parents=True)
+    (workspace / PLAN_FILE).write_text(json.dumps(tasklist))
+    return DataHolder.from_workspace(str(workspace))
+
+def test_publish_and_lease(broker, tmp_path):
+    dataholder = make_workspace(tmp_path, [task(0, "a", True), task(1, "b"), task(2, "c")])
+
+    # 完了済みのタスクは公開せず、公開済みのタスクは重複しない
+    assert publish_plan(broker, dataholder, "q") == 2
+    assert publish_plan(broker, dataholder, "q") == 0
+
+    first = broker.acquire("q", "w1")
+    second = broker.acquire("q", "w2")
+    assert (first.task_id, first.task["name"]) == (1, "b")
+    assert (second.task_id, second.task["name"]) == (2, "c")
+    assert broker.acquire("q", "w3") is None
+    assert [(e["status"], e["worker_id"]) for e in broker.entries("q")] == [(LEASED, "w1"), (LEASED, "w2")]
+
+    assert broker.complete(first, {"done_flg": True, "next_step": "ok"})
+    # 完了したリースはもう使えない
+    assert not broker.heartbeat(first)
+    assert not broker.complete(first, {})
+    assert broker.entries("q")[0]["result"] == {"done_flg": True, "next_step": "ok"}
+
+def test_lease_expiry_requeues(broker):
+    broker.publish("q", [task(0, "a")])
+
+    lease = broker.acquire("q", "w1", lease_seconds=0.05)
+    assert broker.heartbeat(lease, lease_seconds=0.05)
+    time.sleep(0.1)
+    # 期限切れのリースは別のワーカーに渡され、元のワーカーの結果は破棄される
+    retry = broker.acquire("q", "w2")
+    assert retry.task_id == 0 and retry.lease_id != lease.lease_id
+    assert not broker.complete(lease, {"done_flg": True})
+    assert broker.entries("q")[0]["attempts"] == 2
+
+    # max_attemptsに達したタスクは再投入しない
+    assert broker.fail(retry, {"error": "boom"})
+    entry = broker.entries("q")[0]
+    assert entry["status"] == FAILED and entry["result"] == {"error": "boom"}
+    assert broker.acquire("q", "w3") is None
+
+def test_fail_requeues(broker):
+    broker.publish("q", [task(0, "a")])
+    lease = broker.acquire("q", "w1")
+    assert broker.fail(lease, {"done_flg": False})
+    assert broker.entries("q")[0]["status"] == PENDING
+    assert broker.acquire("q", "w2").worker_id == "w2"
+
+def test_queue_workers(broker, tmp_path, monkeypatch):
+    dataholder = make_workspace(tmp_path, [task(0, "a", True), task(1, "b"), task(2, "c"), task(3, "d")])
+    publish_plan(broker, dataholder)
+    seen = []
+
+    def worker_run(self, **kwargs):
+        # 各タスクはそのタスクだけを持つDataHolderで実行される
+        assert len(self.dataholder.tasklist) == 1 and not self.dataholder.persist_plan
+        current = self.dataholder.tasklist[0]
+        seen.append((current["name"], kwargs["model"]))
+        if current["name"] != "d":
+            PlanUpdater.run({"tasklist": [dict(current, done_flg=True, next_step=f"{current['name']} done")], "dataholder": self.dataholder})
+        self.progress = SimpleNamespace(stop_reason="completed", explanation="")
+        yield {"role": "assistant", "content": f"worked on {current['name']}"}
+
+    monkeypatch.setattr(Worker, "run", worker_run)
+    workers = [QueueWorker(broker, dataholder.workspace_dir, worker_id=f"w{i}", model="m") for i in range(2)]
+    threads = [threading.Thread(target=lambda worker=worker: list(worker.run())) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 完了しなかったタスクはmax_attemptsまで再実行される
+    assert sorted(seen) == [("b", "m"), ("c", "m"), ("d", "m"), ("d", "m")]
+    assert [e["status"] for e in broker.entries("default")] == [DONE, DONE, FAILED]
+    # ワーカーは計画ファイルを書き換えない
+    assert json.loads((tmp_path / "workspace" / PLAN_FILE).read_text())[1]["done_flg"] == False
+
+    assert collect_results(broker, dataholder) == 2
+    assert [(t["name"], t["done_flg"], t["next_step"]) for t in dataholder.tasklist] == [
+        ("a", True, ""), ("b", True, "b done"), ("c", True, "c done"), ("d", False, ""),
+    ]
+    assert json.loads((tmp_path / "workspace" / PLAN_FILE).read_text()) == dataholder.tasklist
+    assert collect_results(broker, dataholder) == 0
+
+def test_collect_skips_rewritten_tasks(tmp_path):
+    broker = MemoryBroker()
+    dataholder = make_workspace(tmp_path, [task(0, "a")])
+    publish_plan(broker, dataholder)
+    broker.complete(broker.acquire("default", "w1"), {"done_flg": True})
+
+    # 公開後に書き換えられた計画の別タスクには結果を反映しない
+    dataholder.tasklist = [task(0, "z")]
+    assert collect_results(broker, dataholder) == 0
+    assert dataholder.tasklist[0]["done_flg"] == False
+
+def test_worker_exception_fails_task(tmp_path, monkeypatch):
+    broker = MemoryBroker(max_attempts=1)
+    dataholder = make_workspace(tmp_path, [task(0, "a")])
+    publish_plan(broker, dataholder)
+
+    def worker_run(self, **kwargs):
+        raise RuntimeError("boom")
+        yield
+
+    monkeypatch.setattr(Worker, "run", worker_run)
+    messages = list(QueueWorker(broker, dataholder.workspace_dir).run())
+    assert messages == [(0, {"role": "assistant", "content": "Task 0 failed: boom"})]
+    entry = broker.entries("default")[0]
+    assert entry["status"] == FAILED and entry["result"]["error"] == "boom"
+
+def test_lost_lease_stops_worker(tmp_path, monkeypatch):
+    broker = MemoryBroker()
+    dataholder = make_workspace(tmp_path, [task(0, "a")])
+    publish_plan(broker, dataholder)
+    stolen = []
+
+    def worker_run(self, **kwargs):
+        # 期限切れのリースを別のワーカーが取得する
+        time.sleep(0.1)
+        stolen.append(broker.acquire("default", "w2"))
+        yield {"role": "assistant", "content": "working"}
+        assert kwargs["cancel"].wait(5)
+        kwargs["cancel"].check()
+
+    monkeypatch.setattr(Worker, "run", worker_run)
+    worker = QueueWorker(broker, dataholder.workspace_dir, worker_id="w1", lease_seconds=0.05, heartbeat_interval=0.2)
+    messages = list(worker.run(max_tasks=1))
+
+    # リースを失ったWorkerは止まり、結果を報告しない
+    assert [message["content"] for _, message in messages] == ["working", "Task 0 stopped: its lease was lost"]
+    entry = broker.entries("default")[0]
+    assert entry["status"] == LEASED and entry["worker_id"] == "w2" and entry["result"] is None
+
+def test_closed_task_stops_heartbeat(tmp_path, monkeypatch):
+    broker = MemoryBroker()
+    dataholder = make_workspace(tmp_path, [task(0, "a")])
+    publish_plan(broker, dataholder)
+
+    def worker_run(self, **kwargs):
+        while True:
+            yield {"role": "assistant", "content": "working"}
+
+    monkeypatch.setattr(Worker, "run", worker_run)
+    run = QueueWorker(broker, dataholder.workspace_dir).run()
+    next(run)
+    run.close()
+
+    # ジェネレーターを閉じてもハートビートのスレッドは残らない
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("gptw-heartbeat-")]
@@ -1,6 +1,6 @@
 import os
 import pytest
-from gpt_worker.tools import FileReader, FileWriter, StateUpdater, PlanMaker, ScriptExecutor, Task
+from gpt_worker.tools import CodeSearch, FileReader, FileWriter, MultiFileReader, OutlineReader, StateUpdater, PlanMaker, PlanUpdater, ScriptExecutor, Task
 from gpt_worker.dataholder import DataHolder
 
 def test_file_reader_success(tmp_path):
@@ -85,6 +85,15 @@ def test_file_writer_failure(tmp_path):
     })
     assert result["success"] == False
 
+def test_file_writer_refuses_config_dir(tmp_path):
+    dataholder = DataHolder(tasklist=[], state_summary="", workspace_dir=str(tmp_path))
+
+    # .gpt_worker以下の承認ルールや接続先はエージェントが書き換えられない
+    for path in (".gpt_worker/approval.json", str(tmp_path / ".gpt_worker" / "endpoints.json"), "src/../.gpt_worker/routing.json"):
+        result = FileWriter.run({"path": path, "content": '{"default": "allow"}', "dataholder": dataholder})
+        assert result["success"] == False, path
+    assert not (tmp_path / ".gpt_worker").exists()
+
 def test_state_updater(tmp_path):
     # StateUpdaterのテスト
     dataholder = DataHolder(
@@ -132,6 +141,25 @@ def test_plan_maker(tmp_path):
     assert dataholder.tasklist[0]["name"] == test_task["name"]
     assert dataholder.tasklist[0]["task_id"] == 0
 
+def test_plan_updater_returns_diff(tmp_path):
+    dataholder = DataHolder(
+        tasklist=[
+            {"task_id": 0, "name": "a", "done_flg": False},
+            {"task_id": 1, "name": "b", "done_flg": False},
+        ],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+
+    result = PlanUpdater.run({
+        "dataholder": dataholder,
+        "tasklist": [{"task_id": 1, "done_flg": True}]
+    })
+
+    assert result["success"] == True
+    assert dataholder.tasklist[1]["done_flg"] == True
+    assert result["content"] == "#1 done_flg: false -> true\n(1 tasks unchanged)"
+
 def test_script_executor_without_permission(tmp_path):
     dataholder = DataHolder(
         tasklist=[],
@@ -169,3 +197,79 @@ def test_script_executor_denied(monkeypatch, tmp_path):
     result = ScriptExecutor.run({"script": "python nonexestent.py", "ask_user": True, "dataholder": dataholder})
     assert result["success"] == False
     assert "User aborted execution" in result["content"]
+
+def test_code_search(tmp_path):
+    dataholder = DataHolder(
+        tasklist=[],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+
+    (tmp_path / "connector.py").write_text("class OpenAIConnector:\n    def CreateResponse(self):\n        retry_count = 0\n")
+    (tmp_path / "notes.md").write_text("response handling is described here\n")
+
+    result = CodeSearch.run({"query": "CreateResponse", "dataholder": dataholder})
+    assert result["success"] == True
+    assert result["content"].startswith("connector.py:2:")
+
+    # インデックスがワークスペース内に保存される
+    assert (tmp_path / ".gpt_worker/index/index.json").exists()
+
+    # 変更されたファイルだけが再インデックスされる
+    (tmp_path / "notes.md").write_text("nothing to see\n")
+    result = CodeSearch.run({"query": "response handling", "dataholder": dataholder})
+    assert "notes.md" not in result["content"]
+
+    result = CodeSearch.run({"query": "zzz_not_there", "dataholder": dataholder})
+    assert result["content"] == "No matches found"
+
+def test_outline_reader(tmp_path):
+    dataholder = DataHolder(
+        tasklist=[],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "main.py").write_text("class App:\n    def run(self):\n        pass\n")
+    (tmp_path / "pkg" / "README.md").write_text("# App\n\ntext\n")
+
+    result = OutlineReader.run({"path": "pkg/main.py", "dataholder": dataholder})
+    assert result["success"] == True
+    assert result["content"] == "pkg/main.py (3 lines)\n  L1 class App\n  L2   def run(self)\n"
+
+    # ディレクトリを指定すると配下のファイルをまとめて要約する
+    result = OutlineReader.run({"path": "pkg", "dataholder": dataholder})
+    assert "pkg/README.md (3 lines)\n  L1 # App\n" in result["content"]
+    assert "pkg/main.py" in result["content"]
+
+    result = OutlineReader.run({"path": "missing.py", "dataholder": dataholder})
+    assert result["success"] == False
+
+def test_multi_file_reader(tmp_path):
+    dataholder = DataHolder(
+        tasklist=[],
+        state_summary="",
+        workspace_dir=str(tmp_path)
+    )
+
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("a = 1\n")
+    (tmp_path / "src" / "b.py").write_text("b = 2\n")
+    (tmp_path / "README.md").write_text("readme\n")
+
+    result = MultiFileReader.run({"paths": ["src/*.py", "README.md", "missing.txt"], "dataholder": dataholder})
+    assert result["success"] == True
+    assert result["paths"][:2] == [str(tmp_path / "src/a.py"), str(tmp_path / "src/b.py")]
+    assert f"=== {tmp_path / 'src/a.py'} ===\na = 1\n" in result["content"]
+    assert f"=== {tmp_path / 'README.md'} ===\nreadme\n" in result["content"]
+    assert "missing.txt: File not found" in result["content"]
+
+    result = MultiFileReader.run({"paths": ["*.nothing"], "dataholder": dataholder})
+    assert result["success"] == False
+
+def test_multi_file_reader_budget():
+    # 小さいファイルはそのまま、残りを大きいファイルで均等に分ける
+    assert MultiFileReader.allocate([10, 1000, 1000], 310) == [10, 150, 150]
+    assert MultiFileReader.allocate([10, 20], 100) == [10, 20]
+    assert sum(MultiFileReader.allocate([500, 300, 700, 50], 1000)) <= 1000
@@ -0,0 +1,66 @@
+import os
+import pytest
+from gpt_worker.dataholder import DataHolder
+from gpt_worker.prefetch import read_cache
+from gpt_worker.progress import hash_workspace
+from gpt_worker.prompts import build_worker_messages, format_directory_structure
+from gpt_worker.watcher import WorkspaceWatcher, watch_workspace
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def watcher(request, tmp_path):
+    (tmp_path / "a.py").write_text("a")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").write_text("ref")
+    watcher = WorkspaceWatcher(str(tmp_path), poll_interval=60, use_inotify=request.param).start()
+    yield watcher
+    watcher.stop()
+
+def test_changes_are_drained(watcher, tmp_path):
+    assert watcher.drain_changes() == []
+
+    (tmp_path / "a.py").write_text("changed")
+    (tmp_path / "b.txt").write_text("new")
+    os.remove(tmp_path / "pkg" / "__init__.py")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "c.py").write_text("c")
+    (tmp_path / ".git" / "HEAD").write_text("ignored")
+
+    changed = watcher.drain_changes()
+    assert {"a.py", "b.txt", os.path.join("pkg", "__init__.py"), os.path.join("sub", "c.py")} <= set(changed)
+    assert not any(path.startswith(".git") for path in changed)
+    assert watcher.drain_changes() == []
+
+def test_snapshot_matches_a_rescan(watcher, tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "c.py").write_text("c")
+    (tmp_path / "z.txt").write_text("z")
+
+    assert watcher.fingerprint() == hash_workspace(str(tmp_path))
+    assert [entry[0] for entry in watcher.walk()] == [str(tmp_path), str(tmp_path / "pkg"), str(tmp_path / "sub")]
+    assert format_directory_structure(str(tmp_path), watcher).splitlines()[1:] == format_directory_structure(str(tmp_path)).splitlines()[1:]
+
+def test_watch_workspace_invalidates_read_cache(tmp_path):
+    path = tmp_path / "a.py"
+    path.write_text("a")
+    dataholder = DataHolder([{"task_id": 1, "done_flg": False}], "", str(tmp_path))
+    watcher = watch_workspace(dataholder)
+    try:
+        assert dataholder.watcher is watcher
+        read_cache.read(str(path))
+        assert read_cache._key(str(path)) in read_cache._entries
+
+        path.write_text("b")
+        assert watcher.drain_changes() == ["a.py"]
+        assert read_cache._key(str(path)) not in read_cache._entries
+    finally:
+        watcher.stop()
+
+def test_worker_messages_list_changed_paths(tmp_path):
+    dataholder = DataHolder([{"task_id": 1, "done_flg": False}], "", str(tmp_path))
+    assert "since your previous iteration" not in build_worker_messages(dataholder)[-1]["content"]
+
+    context = build_worker_messages(dataholder, changed_paths=["a.py", "b.py"])[-1]["content"]
+    assert "since your previous iteration" in context
+    assert "- a.py\n- b.py\n" in context
@@ -0,0 +1,40 @@
+import json
+from gpt_worker.wire import decode_tool_result, diff_tasklist, encode_tool_result
+
+def test_round_trip():
+    results = [
+        {"success": True, "path": "src/app.py", "content": 'def main():\n    print("hello")\n'},
+        {"success": True, "path": "my docs/a=b.md", "content": "x"},
+        {"success": False, "content": "Command failed with error: boom"},
+        {"success": True},
+    ]
+    for result in results:
+        assert decode_tool_result(encode_tool_result(result)) == result
+
+def test_content_is_not_escaped():
+    encoded = encode_tool_result({"success": True, "path": "a.py", "content": 'print("a")\nprint("b")\n'})
+    assert encoded == 'ok path=a.py\nprint("a")\nprint("b")\n'
+    assert len(encoded) < len(json.dumps({"success": True, "path": "a.py", "content": 'print("a")\nprint("b")\n'}))
+
+def test_decodes_legacy_json_and_plain_text():
+    assert decode_tool_result(json.dumps({"success": False, "content": "no"})) == {"success": False, "content": "no"}
+    assert decode_tool_result("something else") == {"success": True, "content": "something else"}
+
+def test_diff_tasklist():
+    before = [
+        {"task_id": 0, "name": "a", "next_step": "edit", "done_flg": False},
+        {"task_id": 1, "name": "b", "next_step": "test", "done_flg": False},
+        {"task_id": 2, "name": "c", "next_step": "doc", "done_flg": False},
+    ]
+    after = [
+        {"task_id": 0, "name": "a", "next_step": "edit", "done_flg": True},
+        {"task_id": 1, "name": "b", "next_step": "test", "done_flg": False},
+        {"task_id": 3, "name": "d", "done_flg": False},
+    ]
+    assert diff_tasklist(before, after).splitlines() == [
+        "#0 done_flg: false -> true",
+        '+#3 {"name":"d","done_flg":false}',
+        "-#2",
+        "(1 tasks unchanged)",
+    ]
+    assert diff_tasklist(before, before) == "no changes"